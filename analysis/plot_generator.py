@@ -1,18 +1,36 @@
 """Telemetry plot generator for Mario Kart DS RL training runs.
 
-Reads a ``telemetry_log.csv`` produced by the agent during a training run and
+Reads the per-step telemetry log produced by the agent during a training run
+(binary shards in ``logs/telemetry/``, or a legacy ``telemetry_log.csv``) and
 generates five diagnostic PNG plots saved alongside the run's other outputs.
 
+Position, action and termination-reason plots are drawn from the occupancy
+histograms the training callback keeps per checkpoint window
+(``logs/occupancy/``, see ``src/utils/occupancy.py``), which count every env
+step and are small enough to load at once.  Runs without them, and the
+remaining plots, read the step log one shard or CSV chunk at a time, so
+memory does not grow with the length of the run.  Either
+
+* a uniformly downsampled subset of at most :data:`MAX_STEP_ROWS` rows is
+  kept and plotted as before (scatter of individual steps), or
+* in **streaming mode** (:class:`StepLogStats`) every row is folded into
+  fixed-size accumulators: action and reason counts, a position histogram,
+  speed statistics per offroad bin and a decimated cumulative-reward curve.
+
+Streaming is used automatically for step logs larger than
+:data:`STREAM_THRESHOLD_BYTES` on disk.
+
 Plots produced:
-    1. **heatmap.png**       – 2-D kernel-density estimate of track position
-                               (pos_x vs pos_z) showing where the kart spent
-                               most of its time.
+    1. **heatmap.png**       – 2-D histogram of track position (pos_x vs
+                               pos_z) on a log colour scale, showing where the
+                               kart spent most of its time.
     2. **actions.png**       – Bar chart of how frequently each discrete action
                                (Gas / Gas+Left / Gas+Right) was chosen.
     3. **reasons.png**       – Pie chart of episode-termination reasons logged
                                in the ``reason`` column.
     4. **speed_offroad.png** – Scatter plot correlating the offroad modifier
-                               with the kart's speed.
+                               with the kart's speed (streaming: mean speed
+                               +/- one standard deviation per offroad bin).
     5. **cumulative_reward.png** – Line chart of cumulative reward over all
                                    logged training steps (only if a ``reward``
                                    column is present).
@@ -21,47 +39,391 @@ Usage::
 
     python analysis/plot_generator.py   # from project root
     python plot_generator.py            # from analysis/ directory
+    python analysis/plot_generator.py --stream always   # force streaming mode
 
 The script resolves the ``outputs/`` directory relative to its own location,
 so it works correctly regardless of the calling working directory.
 """
 
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+from matplotlib.colors import LogNorm
 import seaborn as sns
 import os
+import sys
+import argparse
 from pathlib import Path
 
+# Make the project packages importable when run as a script from anywhere.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from env.telemetry import REASON_LABELS, TerminalReason
+from src.utils import config
+from src.utils.occupancy import bin_edges, read_occupancy
+from src.utils.run_index import RunIndex
+from src.utils.telemetry_store import iter_shards, list_shards
+
+# Step rows kept for the plots that need individual rows (speed vs offroad,
+# and the fallbacks for runs without occupancy histograms).
+MAX_STEP_ROWS = 200_000
+
+# Rows per pd.read_csv chunk when reading a legacy telemetry_log.csv.
+CSV_CHUNK_ROWS = 1_000_000
+
+# Cells per axis of the position histogram built from step rows.
+FALLBACK_BINS = 256
+
+# Step logs above this size on disk are summarised in streaming mode.
+STREAM_THRESHOLD_BYTES = 256 * 1024 ** 2
+
+# Streaming mode: offroad bins for the speed statistics, and points kept on
+# the cumulative-reward curve.
+OFFROAD_BINS = 128
+OFFROAD_RANGE = (0.0, 2.0)
+MAX_CURVE_POINTS = 20_000
+
+# Column types of telemetry_log.csv.  Positions are read as floats so that
+# logs written by older versions parse too; reasons as categories whose codes
+# + 1 are the TerminalReason codes (0 mid-episode).
+CSV_DTYPES = {
+    "step": np.int64,
+    "speed": np.float64,
+    "offroad": np.float64,
+    "pos_x": np.float64,
+    "pos_z": np.float64,
+    "action": np.int64,
+    "reason": pd.CategoricalDtype(list(REASON_LABELS[1:])),
+    "reward": np.float64,
+}
+
+
+def _decimate(chunks, max_rows):
+    """Keeps a uniform subset of at most ``max_rows`` rows of a chunked log.
+
+    Rows are kept when their global row index (the DataFrame index) is a
+    multiple of a stride that doubles whenever too many are held, so only
+    one chunk plus ``max_rows`` rows are in memory at any time.
+
+    Args:
+        chunks (Iterable[pandas.DataFrame]): Consecutive chunks of the log,
+            indexed by global row number.
+        max_rows (int): Upper bound on the rows kept.
+
+    Returns:
+        tuple[pandas.DataFrame | None, int]: The kept rows (``None`` for an
+            empty log) and the final stride (every ``stride``-th row kept).
+    """
+    kept, n_kept, stride = [], 0, 1
+    for chunk in chunks:
+        part = chunk[chunk.index % stride == 0]
+        kept.append(part)
+        n_kept += len(part)
+        while n_kept > max_rows:
+            stride *= 2
+            kept = [k[k.index % stride == 0] for k in kept]
+            n_kept = sum(len(k) for k in kept)
+    return (pd.concat(kept) if kept else None), stride
+
+
+def _load_step_sample(run_path, columns, max_rows=MAX_STEP_ROWS):
+    """Reads a downsampled copy of a run's per-step telemetry.
+
+    Binary shards are read one shard at a time (only ``columns``), a legacy
+    ``telemetry_log.csv`` in chunks of :data:`CSV_CHUNK_ROWS` rows; see
+    :func:`_decimate`.  The ``reason`` column is decoded to its labels, NaN
+    mid-episode, as ``pd.read_csv`` gives for the CSV.
+
+    Args:
+        run_path (str): Run directory (``outputs/<run_id>``).
+        columns (list[str]): Columns to read (missing CSV columns are
+            skipped).
+        max_rows (int): Upper bound on the rows returned.
+
+    Returns:
+        tuple[pandas.DataFrame | None, int]: The sampled rows (``None`` if the
+            run has no step log, e.g. ``--telemetry-sample 0``) and the
+            sampling stride.
+    """
+    shard_dir = os.path.join(run_path, "logs", "telemetry")
+    if list_shards(shard_dir):
+        def chunks():
+            offset = 0
+            for shard in iter_shards(shard_dir, columns):
+                n = len(next(iter(shard.values())))
+                yield pd.DataFrame(shard, index=pd.RangeIndex(offset, offset + n))
+                offset += n
+        df, stride = _decimate(chunks(), max_rows)
+        if df is not None and "reason" in df.columns:
+            df["reason"] = pd.Series(REASON_LABELS[df["reason"].to_numpy()], index=df.index).replace("", np.nan)
+        return df, stride
+
+    csv_path = os.path.join(run_path, "logs/telemetry_log.csv")
+    if not os.path.isfile(csv_path):
+        return None, 1
+    return _decimate(_read_csv_chunks(csv_path, columns), max_rows)
+
 
-def generate_plots():
-    """Generate performance plots from a user-selected telemetry CSV log.
+def _read_csv_chunks(csv_path, columns):
+    """Reads ``telemetry_log.csv`` in chunks with explicit column types.
 
-    Presents an interactive CLI menu listing every subdirectory found inside
-    ``<project_root>/outputs/``.  The user selects a run by index; the
-    function then reads ``<run>/logs/telemetry_log.csv`` and writes five PNG
-    plots to ``<run>/plots/``.
+    Args:
+        csv_path (str): CSV path.
+        columns (list[str]): Columns to read (missing ones are skipped).
+
+    Returns:
+        Iterable[pandas.DataFrame]: Chunks of :data:`CSV_CHUNK_ROWS` rows;
+            the index keeps counting across chunks.
+    """
+    return pd.read_csv(csv_path, usecols=lambda c: c in columns, chunksize=CSV_CHUNK_ROWS,
+                       dtype={name: dtype for name, dtype in CSV_DTYPES.items() if name in columns})
+
+
+def _step_log_bytes(run_path):
+    """Size on disk of a run's step log (shards or CSV), ``0`` if it has none."""
+    shards = list_shards(os.path.join(run_path, "logs", "telemetry"))
+    if shards:
+        return sum(os.path.getsize(path) for path in shards)
+    csv_path = os.path.join(run_path, "logs/telemetry_log.csv")
+    return os.path.getsize(csv_path) if os.path.isfile(csv_path) else 0
+
+
+class StepLogStats:
+    """Fixed-size summary of a step log, accumulated one chunk at a time.
+
+    Memory does not depend on the number of rows: counts and sums live in
+    preallocated arrays, and the cumulative-reward curve keeps the rows whose
+    index is a multiple of a stride that doubles whenever it holds more than
+    ``max_curve_points`` points (the plotted values are still exact running
+    totals over every row).
+
+    Args:
+        bins (int): Position grid cells per axis.
+        extent (int): Half-width of the position grid in raw world units.
+        offroad_bins (int): Bins of the offroad modifier.
+        offroad_range (tuple[float, float]): Offroad values binned; values
+            outside go to the first or last bin.
+        max_curve_points (int): Upper bound on the cumulative-reward points.
+
+    Attributes:
+        rows (int): Rows accumulated.
+        position (np.ndarray): ``(bins, bins)`` position histogram (rows Z,
+            columns X); :attr:`edges` are its cell edges.
+        actions (np.ndarray): Rows per action.
+        reasons (np.ndarray): Rows per :class:`~env.telemetry.TerminalReason`
+            code.
+        offroad_edges (np.ndarray): Offroad bin edges.
+        speed_count, speed_sum, speed_sumsq (np.ndarray): Per offroad bin
+            row count, sum and sum of squares of ``speed``.
+        has_reward (bool): Whether the log has a ``reward`` column.
+    """
+
+    def __init__(self, bins=512, extent=1 << 25, offroad_bins=OFFROAD_BINS, offroad_range=OFFROAD_RANGE,
+                 max_curve_points=MAX_CURVE_POINTS):
+        self.rows = 0
+        self.edges = bin_edges(bins, extent)
+        self.position = np.zeros((bins, bins), dtype=np.int64)
+        self.actions = np.zeros(0, dtype=np.int64)
+        self.reasons = np.zeros(len(TerminalReason), dtype=np.int64)
+        self.offroad_edges = np.linspace(*offroad_range, offroad_bins + 1)
+        self.speed_count = np.zeros(offroad_bins, dtype=np.int64)
+        self.speed_sum = np.zeros(offroad_bins)
+        self.speed_sumsq = np.zeros(offroad_bins)
+        self.has_reward = False
+        self.max_curve_points = max_curve_points
+        self._reward_total = 0.0
+        self._last_step = None
+        self._stride = 1
+        self._curve = []  # (row index, step, cumulative reward) arrays
+
+    def update(self, chunk):
+        """Folds one chunk of rows into the summary.
+
+        Args:
+            chunk (dict[str, np.ndarray]): Column arrays of equal length:
+                ``step``, ``speed``, ``offroad``, ``pos_x``, ``pos_z``,
+                ``action``, ``reason`` (TerminalReason codes) and optionally
+                ``reward``.
+        """
+        n = len(chunk["step"])
+        if not n:
+            return
+
+        counts, _, _ = np.histogram2d(chunk["pos_z"], chunk["pos_x"], bins=(self.edges, self.edges))
+        self.position += counts.astype(np.int64)
+
+        actions = np.bincount(np.clip(chunk["action"], 0, None).astype(np.intp))
+        if len(actions) > len(self.actions):
+            self.actions = np.pad(self.actions, (0, len(actions) - len(self.actions)))
+        self.actions[:len(actions)] += actions
+        self.reasons += np.bincount(chunk["reason"].astype(np.intp), minlength=len(self.reasons))[:len(self.reasons)]
+
+        # Speed statistics per offroad bin.
+        offroad_bins = len(self.speed_count)
+        idx = np.clip(np.searchsorted(self.offroad_edges, chunk["offroad"], side="right") - 1, 0, offroad_bins - 1)
+        speed = chunk["speed"].astype(np.float64)
+        self.speed_count += np.bincount(idx, minlength=offroad_bins)
+        self.speed_sum += np.bincount(idx, weights=speed, minlength=offroad_bins)
+        self.speed_sumsq += np.bincount(idx, weights=speed * speed, minlength=offroad_bins)
+
+        if "reward" in chunk:
+            self.has_reward = True
+            cumulative = self._reward_total + np.cumsum(chunk["reward"], dtype=np.float64)
+            self._reward_total = float(cumulative[-1])
+            self._last_step = int(chunk["step"][-1])
+            row = np.arange(self.rows, self.rows + n)
+            keep = row % self._stride == 0
+            self._curve.append((row[keep], chunk["step"][keep], cumulative[keep]))
+            while sum(len(r) for r, _, _ in self._curve) > self.max_curve_points:
+                self._stride *= 2
+                self._curve = [(r[r % self._stride == 0], s[r % self._stride == 0], c[r % self._stride == 0])
+                               for r, s, c in self._curve]
+        self.rows += n
+
+    def speed_by_offroad(self):
+        """Returns offroad bin centres, mean speed and its standard deviation.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: Centres,
+                means, standard deviations and row counts of the non-empty
+                bins.
+        """
+        filled = self.speed_count > 0
+        count = self.speed_count[filled]
+        mean = self.speed_sum[filled] / count
+        std = np.sqrt(np.maximum(self.speed_sumsq[filled] / count - mean * mean, 0.0))
+        centres = (self.offroad_edges[:-1] + self.offroad_edges[1:])[filled] / 2
+        return centres, mean, std, count
+
+    def reward_curve(self):
+        """Returns the decimated ``(step, cumulative reward)`` curve.
+
+        The last row is always included, so the curve ends at the exact
+        total.
+        """
+        if not self._curve:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        steps = np.concatenate([s for _, s, _ in self._curve] + [[self._last_step]])
+        cumulative = np.concatenate([c for _, _, c in self._curve] + [[self._reward_total]])
+        return steps, cumulative
+
+
+def stream_step_log(run_path, bins=512, extent=1 << 25):
+    """Summarises a run's whole step log in one bounded-memory pass.
+
+    Binary shards are read one at a time, ``telemetry_log.csv`` in chunks of
+    :data:`CSV_CHUNK_ROWS` rows with :data:`CSV_DTYPES`.
+
+    Args:
+        run_path (str): Run directory (``outputs/<run_id>``).
+        bins (int): Position grid cells per axis.
+        extent (int): Half-width of the position grid in raw world units.
+
+    Returns:
+        StepLogStats | None: The summary, ``None`` if the run has no step log.
+    """
+    columns = ["step", "speed", "offroad", "pos_x", "pos_z", "action", "reason", "reward"]
+    stats = StepLogStats(bins=bins, extent=extent)
+    shard_dir = os.path.join(run_path, "logs", "telemetry")
+    if list_shards(shard_dir):
+        for shard in iter_shards(shard_dir, columns):
+            stats.update(shard)
+        return stats
+
+    csv_path = os.path.join(run_path, "logs/telemetry_log.csv")
+    if not os.path.isfile(csv_path):
+        return None
+    for chunk in _read_csv_chunks(csv_path, columns):
+        arrays = {name: chunk[name].to_numpy() for name in chunk.columns if name != "reason"}
+        # Category codes are -1 for NaN (mid-episode), so + 1 gives the TerminalReason code.
+        arrays["reason"] = (chunk["reason"].cat.codes.to_numpy() + 1 if "reason" in chunk.columns
+                            else np.zeros(len(chunk), dtype=np.intp))
+        stats.update(arrays)
+    return stats
+
+
+def _plot_position_histogram(counts, x_edges, z_edges, path, title):
+    """Draws a position histogram, cropped to the visited cells, on a log scale.
+
+    Args:
+        counts (np.ndarray): ``(len(z_edges) - 1, len(x_edges) - 1)`` step
+            counts (rows Z, columns X).
+        x_edges (np.ndarray): Cell edges along X (raw world units).
+        z_edges (np.ndarray): Cell edges along Z.
+        path (str): Output PNG path.
+        title (str): Figure title.
+    """
+    plt.figure(figsize=(10, 8))
+    ax = plt.gca()
+    ax.set_facecolor('white')  # Unvisited cells stay white.
+    rows, cols = np.nonzero(counts)
+    if len(rows):
+        # Crop to the visited cells plus a small margin.
+        r0, r1 = max(rows.min() - 2, 0), min(rows.max() + 3, counts.shape[0])
+        c0, c1 = max(cols.min() - 2, 0), min(cols.max() + 3, counts.shape[1])
+        image = plt.imshow(
+            np.ma.masked_equal(counts[r0:r1, c0:c1], 0),
+            origin="lower",
+            extent=(x_edges[c0], x_edges[c1], z_edges[r0], z_edges[r1]),
+            norm=LogNorm(),  # Straights and spawn points would swamp a linear scale.
+            cmap=sns.color_palette("mako", as_cmap=True),
+            interpolation="nearest",
+            aspect="equal",
+        )
+        plt.colorbar(image, label="Steps")
+    plt.title(title)
+    plt.xlabel("Position X")
+    plt.ylabel("Position Z")
+    plt.grid(False)
+    # Note: pos_x/pos_z are raw NDS fixed-point units; divide by 4096.0 for real-world scale.
+    plt.savefig(path, dpi=300, facecolor='white')
+    plt.close()
+
+
+def generate_plots(stream="auto"):
+    """Generate performance plots from a user-selected telemetry log.
+
+    Presents an interactive CLI menu listing every run of the run index of
+    ``<project_root>/outputs/`` (synced first, see
+    :mod:`src.utils.run_index`), with its episodes and step-log rows.  The
+    user selects a run by index; the
+    function then reads the run's occupancy histograms
+    (``<run>/logs/occupancy/``) and a downsampled copy of
+    ``<run>/logs/telemetry/`` (binary shards) or, for older runs,
+    ``<run>/logs/telemetry_log.csv``, and writes five PNG plots to
+    ``<run>/plots/``.  In streaming mode the whole step log is summarised
+    in one bounded-memory pass (:func:`stream_step_log`) instead.
+
+    Args:
+        stream (str): ``"always"`` or ``"never"`` to force or disable
+            streaming mode; ``"auto"`` (default) streams step logs larger
+            than :data:`STREAM_THRESHOLD_BYTES`.
 
     Plots generated:
-        1. **heatmap.png** - KDE density of kart position (pos_x x pos_z).
-           Raw coordinates are NDS fixed-point units (divide by 4096.0 for
-           real-world metres).
+        1. **heatmap.png** - Histogram of kart position (pos_x x pos_z) over
+           every step, or over the sampled step rows for runs without
+           occupancy histograms.  Raw coordinates are NDS fixed-point units
+           (divide by 4096.0 for real-world metres).
         2. **actions.png** - Bar chart of discrete-action frequencies with
            human-readable labels (0 -> "Gas", 1 -> "Gas + Left",
            2 -> "Gas + Right").
-        3. **reasons.png** - Pie chart of episode-termination reasons drawn
-           from the non-null rows of the ``reason`` column.
+        3. **reasons.png** - Pie chart of episode-termination reasons.
         4. **speed_offroad.png** - Scatter of ``offroad`` modifier vs
-           ``speed``; low offroad values indicate the kart is on grass.
+           ``speed`` (sampled rows), or the mean speed +/- one standard
+           deviation per offroad bin in streaming mode; low offroad values
+           indicate the kart is on grass.
         5. **cumulative_reward.png** - Cumulative sum of the ``reward`` column
            plotted against ``step`` (skipped when ``reward`` column absent).
 
+    Actions and reasons are counted from the occupancy histograms when the
+    run has them.  Otherwise reasons and cumulative reward come from
+    ``<run>/logs/episodes.csv`` (one row per episode) when it exists, since
+    per-step rows are sampled, and the rest from the step log.
+    Runs without a step log (``--telemetry-sample 0``) get empty step-based
+    plots.
+
     Returns:
         None: All output is written to disk; nothing is returned.
 
-    Raises:
-        FileNotFoundError: Implicitly via ``pd.read_csv`` if the selected
-            run's ``telemetry_log.csv`` does not exist.
-
     Note:
         The function returns early (with an error message) if the ``outputs/``
         directory does not exist or contains no run subdirectories.
@@ -69,8 +431,8 @@ def generate_plots():
     Example::
 
         >>> generate_plots()
-        0: run_20240101_120000
-        1: run_20240102_090000
+        0: run_20240101_120000 (812 episodes, 1310720 step rows)
+        1: run_20240102_090000 (95 episodes, 131072 step rows)
         Select Run Index: 0
         Plots saved to .../outputs/run_20240101_120000/plots/
     """
@@ -92,25 +454,49 @@ def generate_plots():
         print(f"Error: Directory '{base_dir}' not found. Current path: {os.getcwd()}")
         return
 
-    # Collect only immediate subdirectories -- each represents one training run.
-    runs = [d for d in os.listdir(base_dir) if os.path.isdir(os.path.join(base_dir, d))]
+    # One row per training run, from the run index.
+    runs = RunIndex(base_dir).sync().runs()
 
     if not runs:
         print("No runs found in outputs directory.")
         return
 
     # Print an indexed menu so the user can identify runs by name.
-    print("\n".join([f"{i}: {r}" for i, r in enumerate(runs)]))
+    print("\n".join([f"{i}: {r['run_id']} ({r['episodes']} episodes, {r['telemetry_rows']} step rows)"
+                     for i, r in enumerate(runs)]))
     try:
         choice = int(input("Select Run Index: "))
-        run_path = os.path.join(base_dir, runs[choice])
+        run_path = os.path.join(base_dir, runs[choice]["run_id"])
     except (ValueError, IndexError):
         print("Invalid selection.")
         return
 
-    # Load the flat telemetry CSV; every row is one environment step.
-    csv_path = os.path.join(run_path, "logs/telemetry_log.csv")
-    df = pd.read_csv(csv_path)
+    # Per-window histograms counted during training (every step), summed.
+    occupancy = read_occupancy(os.path.join(run_path, "logs", "occupancy"))
+
+    # Step log; every row is one environment step.  Either summarised in one
+    # streaming pass, or downsampled: binary shards load only the columns
+    # plotted below and give the same frame layout as the CSV (reason labels,
+    # NaN mid-episode).
+    if stream == "always" or (stream == "auto" and _step_log_bytes(run_path) > STREAM_THRESHOLD_BYTES):
+        print("Streaming the step log...")
+        stats = stream_step_log(run_path, bins=config.OCCUPANCY_BINS or 512, extent=config.OCCUPANCY_EXTENT)
+        if stats is None:
+            stats = StepLogStats(bins=config.OCCUPANCY_BINS or 512, extent=config.OCCUPANCY_EXTENT)
+        df, stride = None, 1
+    else:
+        stats = None
+        df, stride = _load_step_sample(run_path, ["step", "speed", "offroad", "pos_x", "pos_z",
+                                                  "action", "reason", "reward"])
+        if df is None:
+            df = pd.DataFrame(columns=["step", "speed", "offroad", "pos_x", "pos_z", "action", "reason"])
+        if stride > 1:
+            print(f"Step log downsampled to every {stride}th row ({len(df)} rows).")
+
+    # Episode table (one row per episode).  Step rows are usually sampled, so
+    # episode-level plots use this table when the run has one.
+    episode_path = os.path.join(run_path, "logs", "episodes.csv")
+    episodes = pd.read_csv(episode_path) if os.path.isfile(episode_path) else None
 
     # Ensure the output directory exists before writing any figures.
     plot_dir = os.path.join(run_path, "plots")
@@ -119,26 +505,20 @@ def generate_plots():
     # ------------------------------------------------------------------ #
     # 1. Position Heatmap                                                  #
     # ------------------------------------------------------------------ #
-    plt.figure(figsize=(10, 8))
-    ax = plt.gca()
-    ax.set_facecolor('white')  # Override whitegrid grey to keep KDE colours vivid.
-
-    sns.kdeplot(
-        data=df, x="pos_x", y="pos_z",
-        fill=True,         # Shade the density regions rather than just contour lines.
-        thresh=0.05,       # Drop the bottom 5 % density band to reduce noise.
-        levels=100,        # High level count gives a smooth gradient appearance.
-        cmap="mako",       # Dark sequential palette -- good contrast on white bg.
-        antialiased=True   # Smooth the contour edges for publication quality.
-    )
-
-    plt.title("Track Position Density")
-    plt.xlabel("Position X")
-    plt.ylabel("Position Z")
-    plt.grid(True)
-    # Note: pos_x/pos_z are raw NDS fixed-point units; divide by 4096.0 for real-world scale.
-    plt.savefig(os.path.join(plot_dir, "heatmap.png"), dpi=300, facecolor='white')
-    plt.close()
+    heatmap_path = os.path.join(plot_dir, "heatmap.png")
+    if occupancy is not None:
+        edges = bin_edges(occupancy["bins"], occupancy["extent"])
+        _plot_position_histogram(occupancy["occupancy"], edges, edges, heatmap_path,
+                                 f"Track Occupancy ({occupancy['steps']:,} steps)")
+    elif stats is not None:
+        _plot_position_histogram(stats.position, stats.edges, stats.edges, heatmap_path,
+                                 f"Track Occupancy ({stats.rows:,} logged steps)")
+    else:
+        # Older runs: bin the sampled rows over their own range.
+        counts, z_edges, x_edges = np.histogram2d(df["pos_z"].to_numpy(float), df["pos_x"].to_numpy(float),
+                                                  bins=FALLBACK_BINS)
+        _plot_position_histogram(counts, x_edges, z_edges, heatmap_path,
+                                 f"Track Occupancy ({len(df):,} sampled steps)")
 
     # ------------------------------------------------------------------ #
     # 2. Action Frequency (With Descriptive Labels)                        #
@@ -146,7 +526,14 @@ def generate_plots():
     plt.figure(figsize=(8, 6))
     # Map integer action IDs to human-readable strings for axis tick labels.
     action_map = {0: "Gas", 1: "Gas + Left", 2: "Gas + Right"}
-    action_counts = df['action'].value_counts().sort_index()
+    if occupancy is not None:
+        action_counts = pd.Series(occupancy["actions"])
+        action_counts = action_counts[action_counts > 0]
+    elif stats is not None:
+        action_counts = pd.Series(stats.actions)
+        action_counts = action_counts[action_counts > 0]
+    else:
+        action_counts = df['action'].value_counts().sort_index()
     labels = [action_map.get(x, str(x)) for x in action_counts.index]
     # hue=labels + legend=False: satisfies seaborn's categorical colour API
     # while still applying distinct palette colours without a redundant legend.
@@ -162,8 +549,15 @@ def generate_plots():
     # 3. Terminal Reasons                                                  #
     # ------------------------------------------------------------------ #
     plt.figure(figsize=(8, 8))
-    # Filter to rows where a termination reason was recorded (non-NaN).
-    reason_counts = df[df['reason'].notna()]['reason'].value_counts()
+    if occupancy is not None or (episodes is None and stats is not None):
+        # Index 0 counts the steps that did not end an episode.
+        counts = occupancy["reasons"] if occupancy is not None else stats.reasons
+        reason_counts = pd.Series(counts[1:], index=REASON_LABELS[1:]).sort_values(ascending=False)
+    else:
+        # Filter to rows where a termination reason was recorded (non-NaN).
+        reasons = episodes if episodes is not None else df
+        reason_counts = reasons[reasons['reason'].notna()]['reason'].value_counts()
+    reason_counts = reason_counts[reason_counts > 0]
     if not reason_counts.empty:
         plt.pie(
             reason_counts,
@@ -181,8 +575,14 @@ def generate_plots():
     # 4. Speed vs Offroad Correlation                                      #
     # ------------------------------------------------------------------ #
     plt.figure(figsize=(8, 6))
-    # alpha=0.1 handles overplotting when thousands of steps are logged.
-    sns.scatterplot(data=df, x="offroad", y="speed", alpha=0.1, color='orange')
+    if stats is not None:
+        # Mean speed per offroad bin, with a +/- one standard deviation band.
+        centres, mean, std, _ = stats.speed_by_offroad()
+        plt.fill_between(centres, mean - std, mean + std, color='orange', alpha=0.25, linewidth=0)
+        plt.plot(centres, mean, color='orange', marker='o', markersize=3)
+    else:
+        # alpha=0.1 handles overplotting when thousands of steps are logged.
+        sns.scatterplot(data=df, x="offroad", y="speed", alpha=0.1, color='orange')
     plt.title("Speed vs. Offroad Performance")
     plt.xlabel("Offroad Modifier (Lower = More Grass)")
     plt.ylabel("Speed")
@@ -192,20 +592,33 @@ def generate_plots():
     # ------------------------------------------------------------------ #
     # 5. Cumulative Reward Progress                                        #
     # ------------------------------------------------------------------ #
-    if 'reward' in df.columns:
+    if episodes is not None or (stats.has_reward if stats is not None else 'reward' in df.columns):
         plt.figure(figsize=(10, 6))
-        # Calculate cumulative reward over steps
-        df['cumulative_reward'] = df['reward'].cumsum()
-
-        plt.plot(df['step'], df['cumulative_reward'], color='green', linewidth=2)
+        # Calculate cumulative reward over steps; from whole-episode rewards
+        # when available (exact even if step rows are sampled), otherwise
+        # from the streamed running total, or scaled up by the downsampling
+        # stride.
+        if episodes is not None:
+            steps, cumulative = episodes['step'], episodes['reward'].cumsum()
+        elif stats is not None:
+            steps, cumulative = stats.reward_curve()
+        else:
+            steps, cumulative = df['step'], df['reward'].cumsum() * stride
+
+        plt.plot(steps, cumulative, color='green', linewidth=2)
         plt.title("Cumulative Reward over Training Steps")
         plt.xlabel("Step")
         plt.ylabel("Total Reward")
         plt.grid(True, alpha=0.3)  # Light grid avoids competing visually with the line.
         plt.savefig(os.path.join(plot_dir, "cumulative_reward.png"), dpi=300)
+        plt.close()
 
     print(f"Plots saved to {plot_dir}/")
 
 
 if __name__ == "__main__":
-    generate_plots()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate telemetry plots for a training run.")
+    parser.add_argument("--stream", choices=["auto", "always", "never"], default="auto",
+                        help="Summarise the step log in one bounded-memory pass: 'auto' for logs over "
+                             f"{STREAM_THRESHOLD_BYTES // 1024 ** 2} MB (default: auto)")
+    generate_plots(stream=parser.parse_args().stream)
\ No newline at end of file
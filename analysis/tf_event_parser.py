@@ -24,23 +24,215 @@ Metrics parsed (when present in event files):
     - train/loss               – TD / policy loss
     - train/n_updates          – cumulative gradient update count
     - time/fps                 – overall training throughput in fps
+
+Event files are read with the direct record reader of
+``src/utils/tfevents.py``, which returns every scalar event
+(``EventAccumulator`` kept a 10,000-point reservoir sample per tag).  They
+are parsed in a process pool, one file per task, and every parsed file is
+cached as columnar arrays in ``analysis/.tf_cache/`` (one ``.npz`` per event
+file, keyed by its path, size and modification time, with the byte offset
+read up to).  Re-running the analysis only reads event files that are new,
+and only the appended records of those that have grown since the last run
+(e.g. the live file of a run still training); "plot all runs" on unchanged
+logs reads the cache only.  ``--workers 1`` parses serially, ``--no-cache``
+ignores and does not write the cache.
+
+The TensorBoard folders and their event files come from the run index
+(``outputs/run_index.sqlite``, see ``src/utils/run_index.py``), which
+training updates as it opens event files; the menu re-walks only the
+folders that changed since the last sync.
 """
 
 import os
+import sys
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from tensorboard.backend.event_processing.event_accumulator import EventAccumulator
+
+# Make the project packages importable when run as a script from anywhere.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src.utils.run_index import RunIndex
+from src.utils.tfevents import merge_scalars, read_scalar_events
+
+# Parsed-scalar cache, one .npz per event file.
+CACHE_DIR = Path(__file__).resolve().parent / ".tf_cache"
+
+# Bumped when the cache layout changes; older entries are re-parsed.
+CACHE_VERSION = 2
+
+# Scalar tags plotted by save_plots().
+TARGET_TAGS = [
+    'rollout/ep_rew_mean',
+    'rollout/ep_len_mean',
+    'rollout/exploration_rate',  # Added to track epsilon decay
+    'rollout/fps',
+    'train/learning_rate',
+    'train/loss',
+    'train/n_updates',
+    'time/fps',
+]
+
+
+def find_event_files(run_path):
+    """Returns the ``tfevents`` files under ``run_path`` (recursively), sorted."""
+    return sorted(os.path.join(root, file)
+                  for root, _, files in os.walk(run_path)
+                  for file in files if "tfevents" in file)
+
+
+def parse_event_file(path, offset=0):
+    """Reads every scalar series of one event file, from a byte offset.
+
+    Runs in the worker processes of :func:`load_scalars`.  All scalar tags
+    are kept (not only :data:`TARGET_TAGS`), so the cache stays valid if the
+    plotted tags change.
+
+    Args:
+        path (str): ``tfevents`` file path.
+        offset (int): Record boundary to start at (``0`` for the whole file).
+
+    Returns:
+        tuple[dict[str, tuple[np.ndarray, np.ndarray]], int]: Tag ->
+            ``(steps, values)`` (int64 and float64 arrays, in file order),
+            and the offset after the last complete record.
+    """
+    return read_scalar_events(path, offset=offset)
+
+
+def _cache_path(cache_dir, path):
+    """Cache file of an event file (named after a hash of its absolute path)."""
+    digest = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:20]
+    return os.path.join(cache_dir, f"{digest}.npz")
+
+
+def _read_cache(cache_dir, path):
+    """Returns the cache entry of ``path``, or ``None`` if there is none.
+
+    Returns:
+        dict | None: ``scalars``, plus the ``size``, ``mtime_ns`` and
+            ``offset`` of the event file when it was read.
+    """
+    cache_path = _cache_path(cache_dir, path)
+    try:
+        with np.load(cache_path) as cached:
+            if int(cached["version"]) != CACHE_VERSION or str(cached["source"]) != os.path.abspath(path):
+                return None
+            return {
+                "size": int(cached["size"]),
+                "mtime_ns": int(cached["mtime_ns"]),
+                "offset": int(cached["offset"]),
+                "scalars": {str(tag): (cached[f"steps_{i}"], cached[f"values_{i}"])
+                            for i, tag in enumerate(cached["tags"])},
+            }
+    except (OSError, KeyError, ValueError):
+        # Missing, partially written by an older version, or unreadable.
+        return None
+
+
+def _write_cache(cache_dir, path, size, mtime_ns, offset, scalars):
+    """Saves the scalars of ``path`` (temporary file, then rename)."""
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = _cache_path(cache_dir, path)
+    columns = {}
+    for i, (steps, values) in enumerate(scalars.values()):
+        columns[f"steps_{i}"] = steps
+        columns[f"values_{i}"] = values
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, version=CACHE_VERSION, source=os.path.abspath(path), size=size, mtime_ns=mtime_ns,
+                 offset=offset, tags=np.array(list(scalars), dtype=str), **columns)
+    os.replace(tmp_path, cache_path)
+
+
+def load_scalars(event_files, cache_dir=CACHE_DIR, workers=None):
+    """Returns the scalars of many event files, parsing only what changed.
+
+    Files whose cache entry matches their current size and modification time
+    are read from the cache.  Files that have grown are read from the cached
+    offset on (event files are append-only) and the new events appended to
+    the cached ones; new (or shrunk) files are read whole.  Reads run
+    :func:`parse_event_file` in a process pool (one task per file), and their
+    cache entries are rewritten.
+
+    Args:
+        event_files (list[str]): ``tfevents`` file paths.
+        cache_dir (str | Path | None): Cache directory; ``None`` disables
+            the cache.
+        workers (int | None): Worker processes; ``None`` uses one per CPU,
+            ``1`` parses in this process.
+
+    Returns:
+        dict[str, dict[str, tuple[np.ndarray, np.ndarray]]]: Event file path
+            -> tag -> ``(steps, values)``.
+    """
+    results, stale = {}, []
+    for path in event_files:
+        stat = os.stat(path)
+        cached = _read_cache(cache_dir, path) if cache_dir is not None else None
+        if cached is not None and (cached["size"], cached["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+            results[path] = cached["scalars"]
+        elif cached is not None and stat.st_size > cached["size"]:
+            stale.append((path, stat, cached))
+        else:
+            stale.append((path, stat, None))
+
+    if stale:
+        grown = sum(cached is not None for _, _, cached in stale)
+        print(f"Reading {len(stale) - grown} new and {grown} grown event file(s) "
+              f"({len(event_files) - len(stale)} cached)...")
+        paths = [path for path, _, _ in stale]
+        offsets = [cached["offset"] if cached is not None else 0 for _, _, cached in stale]
+        n_workers = min(workers or os.cpu_count() or 1, len(stale))
+        if n_workers == 1:
+            parsed = [parse_event_file(path, offset) for path, offset in zip(paths, offsets)]
+        else:
+            with ProcessPoolExecutor(max_workers=n_workers) as pool:
+                parsed = list(pool.map(parse_event_file, paths, offsets))
+        for (path, stat, cached), (scalars, offset) in zip(stale, parsed):
+            if cached is not None:
+                scalars = merge_scalars(cached["scalars"], scalars)
+            results[path] = scalars
+            if cache_dir is not None:
+                _write_cache(cache_dir, path, stat.st_size, stat.st_mtime_ns, offset, scalars)
+    return results
+
+
+def scalars_to_frames(scalars, run_name, tags=TARGET_TAGS):
+    """Turns parsed scalars into the per-tag DataFrames of :func:`save_plots`.
+
+    Args:
+        scalars (Iterable[dict[str, tuple[np.ndarray, np.ndarray]]]): Parsed
+            event files of one run.
+        run_name (str): Value of the ``run`` column.
+        tags (list[str]): Tags to keep.
+
+    Returns:
+        dict[str, list[pd.DataFrame]]: Tag -> one ``step``/``value``/``run``
+            DataFrame per event file containing the tag.
+    """
+    data = {}
+    for file_scalars in scalars:
+        for tag in tags:
+            if tag in file_scalars:
+                steps, values = file_scalars[tag]
+                df = pd.DataFrame({'step': steps, 'value': values})
+                df['run'] = run_name  # Tag rows for hue-based multi-run coloring.
+                data.setdefault(tag, []).append(df)
+    return data
 
 
-def extract_tf_logs(run_path, run_name):
+def extract_tf_logs(run_path, run_name, cache_dir=CACHE_DIR, workers=None):
     """Extract scalar metric data from TensorFlow event files in a run directory.
 
     Walks the entire ``run_path`` subtree looking for files whose name contains
-    ``"tfevents"``.  For each event file found, loads it via
-    :class:`~tensorboard.backend.event_processing.event_accumulator.EventAccumulator`
-    and extracts only the scalar tags listed in ``target_tags``.
+    ``"tfevents"``.  The event files are read through :func:`load_scalars`
+    (cached, parsed in parallel) and only the scalar tags listed in
+    :data:`TARGET_TAGS` are extracted.
 
     Args:
         run_path (str): Absolute path to the run directory to search.  The
@@ -48,6 +240,9 @@ def extract_tf_logs(run_path, run_name):
         run_name (str): Human-readable label assigned to every DataFrame row
             via the ``run`` column.  Used as the ``hue`` identifier when
             overlaying multiple runs in :func:`save_plots`.
+        cache_dir (str | Path | None): Parsed-scalar cache; ``None``
+            disables it.
+        workers (int | None): Parser processes (see :func:`load_scalars`).
 
     Returns:
         dict[str, list[pd.DataFrame]]: A mapping from metric tag name to a
@@ -68,40 +263,10 @@ def extract_tf_logs(run_path, run_name):
         data = extract_tf_logs("/outputs/run_A", "run_A")
         # data["rollout/ep_rew_mean"] -> [DataFrame with step/value/run cols]
     """
-    data = {}
-    #target_tags = ['rollout/ep_rew_mean', 'train/loss', 'rollout/ep_len_mean', 'train/learning_rate']
-    target_tags = [
-        'rollout/ep_rew_mean',
-        'rollout/ep_len_mean',
-        'rollout/exploration_rate',  # Added to track epsilon decay
-        'rollout/fps',
-        'train/learning_rate',
-        'train/loss',
-        'train/n_updates',
-        'time/fps',
-    ]
-
     # Search for tfevents inside the specific run folder
-    for root, _, files in os.walk(run_path):
-        for file in files:
-            if "tfevents" in file:
-                # Load and parse the binary event file.
-                ea = EventAccumulator(os.path.join(root, file))
-                ea.Reload()
-                # Tags() returns a dict keyed by data type; 'scalars' is a list
-                # of tag names for which scalar events exist in this file.
-                available_tags = ea.Tags()['scalars']
-
-                for tag in target_tags:
-                    if tag in available_tags:
-                        events = ea.Scalars(tag)
-                        # Each ScalarEvent namedtuple has .step, .value, .wall_time;
-                        # we only need step and value for plotting.
-                        df = pd.DataFrame([(e.step, e.value) for e in events], columns=['step', 'value'])
-                        df['run'] = run_name  # Tag rows for hue-based multi-run coloring.
-                        if tag not in data: data[tag] = []
-                        data[tag].append(df)
-    return data
+    event_files = find_event_files(run_path)
+    scalars = load_scalars(event_files, cache_dir=cache_dir, workers=workers)
+    return scalars_to_frames([scalars[path] for path in event_files], run_name)
 
 
 def save_plots(all_data, save_base_dir, is_comparison=False):
@@ -175,26 +340,33 @@ def save_plots(all_data, save_base_dir, is_comparison=False):
     print(f"Done. Plots saved to: {save_base_dir}")
 
 
-def run_menu():
+def run_menu(cache_dir=CACHE_DIR, workers=None):
     """CLI entry point for interactive TensorBoard log analysis.
 
-    Scans ``<project_root>/logs/`` for run subdirectories and presents a
+    Lists the run subdirectories of ``<project_root>/logs/`` from the run
+    index (synced first, see :mod:`src.utils.run_index`) and presents a
     numbered menu.  Two operating modes are available based on the user's
     numeric choice:
 
     **Mode 0 – Compare all runs:**
-        Iterates over every subdirectory in ``logs/``, calls
-        :func:`extract_tf_logs` for each, merges all results into a single
-        ``all_data`` dict, and calls :func:`save_plots` with
-        ``is_comparison=True``.  Plots are saved to
-        ``<project_root>/analysis/plots/comparison/``.
+        Takes the event files of every subdirectory in ``logs/`` from the
+        index, reads
+        them all in one :func:`load_scalars` call (so the process pool
+        works across runs), merges all results into a single ``all_data``
+        dict, and calls :func:`save_plots` with ``is_comparison=True``.
+        Plots are saved to ``<project_root>/analysis/plots/comparison/``.
 
     **Mode N (1 … len(runs)) – Single run:**
-        Processes only the run at index N.  If the directory name ends with
-        ``_0`` (e.g. ``my_experiment_0``) that suffix is stripped to produce
-        the ``base_run_name`` used as the output subdirectory, keeping the
-        folder structure consistent with non-indexed runs.  Plots are saved
-        to ``<project_root>/outputs/<base_run_name>/plots/``.
+        Processes only the run at index N.  Its plots are saved to
+        ``<project_root>/outputs/<run_id>/plots/``, where *run_id* is the
+        training run the folder belongs to (the directory name without
+        SB3's ``_<N>`` suffix, e.g. ``my_experiment_0`` ->
+        ``my_experiment``).
+
+    Args:
+        cache_dir (str | Path | None): Parsed-scalar cache; ``None``
+            disables it.
+        workers (int | None): Parser processes (see :func:`load_scalars`).
 
     Returns:
         None: Output is written to disk; the function prints confirmation
@@ -228,8 +400,10 @@ def run_menu():
         print(f"Error: Directory '{log_dir}' not found. No runs to examine.")
         return
 
-    # Collect only immediate child directories; each represents one training run.
-    runs = [d for d in os.listdir(log_dir) if os.path.isdir(log_dir / d)]
+    # Immediate child directories (one per training session) and their event
+    # files, from the run index.
+    tb_runs = RunIndex(output_dir, log_dir).sync().tb_runs()
+    runs = [tb_run["name"] for tb_run in tb_runs]
     if not runs:
         print("No runs found in logs directory.")
         return
@@ -246,9 +420,11 @@ def run_menu():
             # -------------------------------------------------------------- #
             # Multi-run comparison: aggregate data from every run directory.  #
             # -------------------------------------------------------------- #
+            scalars = load_scalars([path for tb_run in tb_runs for path in tb_run["event_files"]],
+                                   cache_dir=cache_dir, workers=workers)
             all_data = {}
-            for r in runs:
-                run_data = extract_tf_logs(str(log_dir / r), r)
+            for tb_run in tb_runs:
+                run_data = scalars_to_frames([scalars[path] for path in tb_run["event_files"]], tb_run["name"])
                 # Merge this run's data into the shared dict by extending each
                 # tag's DataFrame list (preserving the 'run' column per df).
                 for tag, dfs in run_data.items():
@@ -263,12 +439,14 @@ def run_menu():
             # -------------------------------------------------------------- #
             # Single-run mode: process only the selected run directory.       #
             # -------------------------------------------------------------- #
-            selected_run = runs[choice - 1]
-            # Strip the trailing '_0' index suffix (added by SB3 when a run
-            # name is reused) so plots land in the canonical base run folder.
-            base_run_name = selected_run.rsplit('_', 1)[0] if selected_run.endswith('_0') else selected_run
+            tb_run = tb_runs[choice - 1]
+            # Plots land in the folder of the training run; the trailing
+            # '_<N>' index suffix SB3 adds to TensorBoard folders is not part
+            # of the run ID.
+            base_run_name = tb_run["run_id"] or tb_run["name"]
 
-            run_data = extract_tf_logs(str(log_dir / selected_run), selected_run)
+            scalars = load_scalars(tb_run["event_files"], cache_dir=cache_dir, workers=workers)
+            run_data = scalars_to_frames([scalars[path] for path in tb_run["event_files"]], tb_run["name"])
 
             save_path = output_dir / base_run_name / "plots"
             save_plots(run_data, str(save_path), is_comparison=False)
@@ -279,4 +457,10 @@ def run_menu():
 
 
 if __name__ == "__main__":
-    run_menu()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Plot TensorBoard scalars of training runs.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes parsing event files (default: one per CPU; 1 = serial)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help=f"Parse every event file again and do not update the cache in {CACHE_DIR}")
+    args = parser.parse_args()
+    run_menu(cache_dir=None if args.no_cache else CACHE_DIR, workers=args.workers)
\ No newline at end of file
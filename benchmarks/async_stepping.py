@@ -0,0 +1,94 @@
+"""Benchmark: synchronous vs asynchronous partial-batch environment stepping.
+
+Drives ``MKDSEnv`` workers with random actions (no learner) and reports
+environment transitions per second for:
+
+* ``sync``  -- the current training path, ``SubprocVecEnv`` + ``VecFrameStack``;
+* ``async`` -- :class:`~env.async_vec_env.AsyncSharedMemoryVecEnv`, returning
+  the first ``K`` ready workers per step (``K = workers * batch_fraction``).
+
+Requires the ROM and ``mkds_boot.dst`` just like training.  Typical usage::
+
+    python benchmarks/async_stepping.py --workers 4 8 16 --steps 2000
+"""
+
+import os
+import sys
+import time
+import argparse
+
+# Allow running as a script from the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from stable_baselines3.common.vec_env import SubprocVecEnv, VecFrameStack
+from env.mkds_gym_env import MKDSEnv
+from env.async_vec_env import AsyncSharedMemoryVecEnv
+from src.utils import config
+
+
+def parse_args():
+    """Parses command-line arguments for the benchmark."""
+    parser = argparse.ArgumentParser(description="Compare sync and async MKDSEnv stepping throughput.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[4, 8, 16],
+                        help="Worker counts to benchmark (default: 4 8 16)")
+    parser.add_argument("--steps", type=int, default=2000,
+                        help="Environment transitions to collect per configuration (default: 2000)")
+    parser.add_argument("--warmup", type=int, default=100,
+                        help="Untimed transitions collected first (default: 100)")
+    parser.add_argument("--batch-fraction", type=float, default=0.5,
+                        help="Async batch size as a fraction of the worker count (default: 0.5)")
+    parser.add_argument("--frame-skip", type=int, default=config.FRAME_SKIP,
+                        help=f"Emulator frames per step (default: {config.FRAME_SKIP})")
+    return parser.parse_args()
+
+
+def run(env, n_transitions, warmup, rng):
+    """Steps ``env`` with random actions and returns transitions per second.
+
+    Rows that ``AsyncSharedMemoryVecEnv`` returns straight from its initial
+    reset are not transitions and are not counted.
+    """
+    env.reset()
+    n_actions = env.action_space.n
+    counted, start = 0, None
+    while counted < warmup + n_transitions:
+        if start is None and counted >= warmup:
+            counted, start = 0, time.perf_counter()
+            warmup = 0
+        _, _, _, infos = env.step(rng.integers(n_actions, size=env.num_envs))
+        counted += sum(1 for info in infos if "telemetry" in info)
+    return counted / (time.perf_counter() - start)
+
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(0)
+
+    def make_env():
+        return MKDSEnv(visualize=False, frame_skip=args.frame_skip)
+
+    def make_stacked_env():
+        # Async mode stacks inside the env, as train_sb3_dqn.py does.
+        return MKDSEnv(visualize=False, frame_skip=args.frame_skip, frame_stack=config.STACK_SIZE)
+
+    print(f"{'workers':>8} {'mode':>6} {'batch':>6} {'steps/s':>10} {'speedup':>8}")
+    for n in args.workers:
+        env = VecFrameStack(SubprocVecEnv([make_env] * n), n_stack=config.STACK_SIZE, channels_order="last")
+        try:
+            sync_sps = run(env, args.steps, args.warmup, rng)
+        finally:
+            env.close()
+        print(f"{n:>8} {'sync':>6} {n:>6} {sync_sps:>10.1f} {1.0:>7.2f}x")
+
+        batch = max(1, int(n * args.batch_fraction))
+        env = AsyncSharedMemoryVecEnv([make_stacked_env] * n, batch_size=batch)
+        try:
+            async_sps = run(env, args.steps, args.warmup, rng)
+        finally:
+            env.close()
+        print(f"{n:>8} {'async':>6} {batch:>6} {async_sps:>10.1f} {async_sps / sync_sps:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
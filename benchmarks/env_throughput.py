@@ -0,0 +1,300 @@
+"""Environment throughput benchmark suite for ``MKDSEnv``.
+
+Runs the environment headless with a fixed, repeating action script (no
+learner involved), and writes a machine-readable JSON report:
+
+* **single_env** -- one ``MKDSEnv`` in this process: steps/sec, reset latency,
+  and per-step memory allocation measured with ``tracemalloc``.  The
+  allocations are reported as the mean peak transient bytes allocated during
+  a step and the mean bytes still held after it (leak rate).
+* **vec** -- for every VecEnv option and worker count: steps/sec, reset
+  latency of the whole VecEnv, and the total RSS of this process plus all
+  its worker processes (``psutil``).
+
+VecEnv options mirror the training entry-point: ``dummy`` (one env
+in-process; only for 1 worker, since DeSmuME is one instance per process),
+``subproc`` (``SubprocVecEnv`` + ``VecFrameStack``), ``shm``
+(``SharedMemoryVecEnv`` + ``VecFrameStack``) and ``async``
+(``AsyncSharedMemoryVecEnv``, first ``workers // 2`` ready, frames stacked in
+the env).
+
+Reports from two commits can be compared; regressions beyond a threshold are
+listed, and the exit status is 1 when there are any::
+
+    python benchmarks/env_throughput.py --workers 1 2 4 8
+    python benchmarks/env_throughput.py --compare benchmarks/results/env_throughput_<old>.json \\
+                                                  benchmarks/results/env_throughput_<new>.json
+
+Requires the ROM and ``mkds_boot.dst`` just like training.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import tracemalloc
+from datetime import datetime
+
+# Allow running as a script from the repository root.
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import numpy as np
+import psutil
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv, VecFrameStack
+from env.mkds_gym_env import MKDSEnv
+from env.shared_memory_vec_env import SharedMemoryVecEnv
+from env.async_vec_env import AsyncSharedMemoryVecEnv
+from env.worker_startup import START_METHODS, resolve_start_method
+from src.utils import config
+
+VEC_ENV_OPTIONS = ("dummy", "subproc", "shm", "async")
+
+# Fixed driving pattern (0: straight, 1: left, 2: right), repeated.  Every
+# env receives the same action on the same step so runs are comparable.
+ACTION_SCRIPT = np.array([0] * 12 + [1] * 4 + [0] * 12 + [2] * 4)
+
+# Metric direction, used by --compare.
+HIGHER_IS_BETTER = {"steps_per_sec"}
+LOWER_IS_BETTER = {"reset_ms_mean", "reset_ms_p95", "alloc_peak_bytes_per_step",
+                   "alloc_retained_bytes_per_step", "rss_mb"}
+
+
+def parse_args():
+    """Parses command-line arguments for the benchmark suite."""
+    parser = argparse.ArgumentParser(description="Benchmark MKDSEnv throughput, reset latency and memory.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4],
+                        help="Worker counts to benchmark (default: 1 2 4)")
+    parser.add_argument("--vec-envs", nargs="+", default=list(VEC_ENV_OPTIONS), choices=VEC_ENV_OPTIONS,
+                        help="VecEnv options to benchmark (default: all)")
+    parser.add_argument("--steps", type=int, default=2000,
+                        help="Timed environment transitions per configuration (default: 2000)")
+    parser.add_argument("--warmup", type=int, default=100,
+                        help="Untimed transitions collected first (default: 100)")
+    parser.add_argument("--resets", type=int, default=20,
+                        help="Resets timed for the reset-latency figures (default: 20)")
+    parser.add_argument("--frame-skip", type=int, default=config.FRAME_SKIP,
+                        help=f"Emulator frames per step (default: {config.FRAME_SKIP})")
+    parser.add_argument("--start-method", choices=START_METHODS, default=config.WORKER_START_METHOD,
+                        help=f"Worker start method (default: {config.WORKER_START_METHOD})")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Report path (default: benchmarks/results/env_throughput_<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"), default=None,
+                        help="Compare two reports instead of running the benchmark.")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative change counted as a regression by --compare (default: 0.10)")
+    return parser.parse_args()
+
+
+def git_commit():
+    """Returns the short hash of HEAD, or ``"unknown"`` outside a git checkout."""
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def summarize_ms(samples_s):
+    """Mean/p50/p95 in milliseconds of a list of durations in seconds."""
+    ms = np.asarray(samples_s) * 1000.0
+    return {"reset_ms_mean": float(ms.mean()), "reset_ms_p50": float(np.percentile(ms, 50)),
+            "reset_ms_p95": float(np.percentile(ms, 95))}
+
+
+def total_rss_mb():
+    """RSS of this process plus all of its (recursive) children, in MB."""
+    proc = psutil.Process()
+    rss = proc.memory_info().rss
+    for child in proc.children(recursive=True):
+        try:
+            rss += child.memory_info().rss
+        except psutil.NoSuchProcess:
+            pass
+    return rss / (1024 * 1024)
+
+
+def bench_single_env(args):
+    """Benchmarks one in-process ``MKDSEnv``: throughput, resets, allocations."""
+    env = MKDSEnv(visualize=False, frame_skip=args.frame_skip)
+    try:
+        resets = []
+        for _ in range(args.resets):
+            start = time.perf_counter()
+            env.reset()
+            resets.append(time.perf_counter() - start)
+
+        env.reset()
+        for t in range(args.warmup):
+            _, _, terminated, truncated, _ = env.step(int(ACTION_SCRIPT[t % len(ACTION_SCRIPT)]))
+            if terminated or truncated:
+                env.reset()
+
+        start = time.perf_counter()
+        for t in range(args.steps):
+            _, _, terminated, truncated, _ = env.step(int(ACTION_SCRIPT[t % len(ACTION_SCRIPT)]))
+            if terminated or truncated:
+                env.reset()
+        steps_per_sec = args.steps / (time.perf_counter() - start)
+
+        # Allocation pass, separate from the timed pass (tracemalloc slows
+        # every allocation down).  Resets are excluded from the figures.
+        n_alloc = min(args.steps, 500)
+        peaks, retained = [], []
+        tracemalloc.start()
+        for t in range(n_alloc):
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            _, _, terminated, truncated, _ = env.step(int(ACTION_SCRIPT[t % len(ACTION_SCRIPT)]))
+            after, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(after - before)
+            if terminated or truncated:
+                env.reset()
+        tracemalloc.stop()
+    finally:
+        env.close()
+
+    result = {"steps_per_sec": steps_per_sec,
+              "alloc_peak_bytes_per_step": float(np.mean(peaks)),
+              "alloc_retained_bytes_per_step": float(np.mean(retained))}
+    result.update(summarize_ms(resets))
+    return result
+
+
+def make_vec_env(vec_env, workers, args, start_method):
+    """Builds a VecEnv configured like ``train_sb3_dqn.py`` does."""
+    frame_skip = args.frame_skip
+    if vec_env == "async":
+        env_fns = [lambda: MKDSEnv(visualize=False, frame_skip=frame_skip, frame_stack=config.STACK_SIZE)] * workers
+        return AsyncSharedMemoryVecEnv(env_fns, batch_size=max(1, workers // 2), start_method=start_method)
+
+    env_fns = [lambda: MKDSEnv(visualize=False, frame_skip=frame_skip)] * workers
+    if vec_env == "dummy":
+        env = DummyVecEnv(env_fns)
+    elif vec_env == "subproc":
+        env = SubprocVecEnv(env_fns, start_method="forkserver" if start_method == "zygote" else start_method)
+    else:
+        env = SharedMemoryVecEnv(env_fns, start_method=start_method)
+    return VecFrameStack(env, n_stack=config.STACK_SIZE, channels_order="last")
+
+
+def bench_vec_env(vec_env, workers, args, start_method):
+    """Benchmarks one VecEnv option at one worker count."""
+    env = make_vec_env(vec_env, workers, args, start_method)
+    try:
+        resets = []
+        for _ in range(max(1, args.resets // 4)):
+            start = time.perf_counter()
+            env.reset()
+            resets.append(time.perf_counter() - start)
+
+        # Count real transitions only: the async env's first rows after a
+        # reset carry no step (see env/async_vec_env.py).
+        counted, t, start = 0, 0, None
+        target = args.warmup
+        while True:
+            if start is None and counted >= target:
+                counted, target, start = 0, args.steps, time.perf_counter()
+            elif start is not None and counted >= target:
+                break
+            actions = np.full(env.num_envs, ACTION_SCRIPT[t % len(ACTION_SCRIPT)])
+            _, _, _, infos = env.step(actions)
+            counted += sum(1 for info in infos if "telemetry" in info)
+            t += 1
+        steps_per_sec = counted / (time.perf_counter() - start)
+        rss = total_rss_mb()
+    finally:
+        env.close()
+
+    result = {"vec_env": vec_env, "workers": workers, "steps_per_sec": steps_per_sec, "rss_mb": rss}
+    result.update(summarize_ms(resets))
+    return result
+
+
+def run(args):
+    """Runs the suite and writes the JSON report."""
+    start_method = resolve_start_method(args.start_method)
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "start_method": start_method,
+            "frame_skip": args.frame_skip,
+            "steps": args.steps,
+            "action_script": ACTION_SCRIPT.tolist(),
+        },
+        "single_env": bench_single_env(args),
+        "vec": [],
+    }
+    single = report["single_env"]
+    print(f"single env: {single['steps_per_sec']:.1f} steps/s, reset {single['reset_ms_mean']:.2f} ms, "
+          f"alloc {single['alloc_peak_bytes_per_step']:.0f} B/step peak")
+
+    print(f"{'vec_env':>8} {'workers':>8} {'steps/s':>10} {'reset ms':>10} {'RSS MB':>8}")
+    for vec_env in args.vec_envs:
+        for workers in args.workers:
+            if vec_env == "dummy" and workers != 1:
+                continue  # One DeSmuME instance per process
+            entry = bench_vec_env(vec_env, workers, args, start_method)
+            report["vec"].append(entry)
+            print(f"{vec_env:>8} {workers:>8} {entry['steps_per_sec']:>10.1f} "
+                  f"{entry['reset_ms_mean']:>10.2f} {entry['rss_mb']:>8.0f}")
+
+    output = args.output or os.path.join(REPO_ROOT, "benchmarks", "results", f"env_throughput_{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {output}")
+
+
+def compare(baseline_path, candidate_path, threshold):
+    """Compares two reports and prints regressions beyond ``threshold``.
+
+    Returns:
+        int: Process exit status, ``1`` when any metric regressed.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(candidate_path) as f:
+        candidate = json.load(f)
+
+    pairs = [("single_env", baseline["single_env"], candidate["single_env"])]
+    base_vec = {(e["vec_env"], e["workers"]): e for e in baseline["vec"]}
+    for entry in candidate["vec"]:
+        key = (entry["vec_env"], entry["workers"])
+        if key in base_vec:
+            pairs.append((f"{key[0]} x{key[1]}", base_vec[key], entry))
+
+    print(f"{baseline['meta']['commit']} -> {candidate['meta']['commit']} (threshold {threshold:.0%})")
+    regressions = 0
+    for label, old, new in pairs:
+        for metric in sorted(HIGHER_IS_BETTER | LOWER_IS_BETTER):
+            if metric not in old or metric not in new or not old[metric]:
+                continue
+            change = (new[metric] - old[metric]) / abs(old[metric])
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            flag = "REGRESSION" if worse > threshold else ""
+            regressions += bool(flag)
+            print(f"{label:>14} {metric:>30} {old[metric]:>12.2f} {new[metric]:>12.2f} {change:>+8.1%} {flag}")
+    print(f"{regressions} regression(s)")
+    return 1 if regressions else 0
+
+
+def main():
+    args = parse_args()
+    if args.compare:
+        sys.exit(compare(*args.compare, args.threshold))
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Benchmark: prioritized replay sampling cost vs one DQN gradient step.
+
+Fills a :class:`~src.utils.replay_buffers.PrioritizedReplayBuffer` with
+random 84x84 frames (no emulator needed) and times, at the training batch
+size:
+
+* ``tree_find``      -- the sum-tree descent alone (batched);
+* ``tree_update``    -- a batched priority update;
+* ``per_sample``     -- a full prioritized ``sample()`` (descent, stale
+  checks, importance weights, stack gather and tensor conversion);
+* ``uniform_sample`` -- ``FrameStackReplayBuffer.sample()`` for comparison;
+* ``gradient_step``  -- one ``CnnPolicy`` update on that batch (forward on
+  the online and target networks, backward, optimizer step), i.e. what
+  ``DQN.train`` does per sample.
+
+Typical usage::
+
+    python benchmarks/per_sampling.py --buffer-size 1000000 --batch-size 128
+"""
+
+import os
+import sys
+import time
+import argparse
+
+# Allow running as a script from the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import torch as th
+from gymnasium import spaces
+from torch.nn import functional as F
+from stable_baselines3.dqn.policies import CnnPolicy
+from src.utils import config
+from src.utils.replay_buffers import FrameStackReplayBuffer, PrioritizedReplayBuffer
+
+
+def parse_args():
+    """Parses command-line arguments for the benchmark."""
+    parser = argparse.ArgumentParser(description="Time prioritized replay sampling against a DQN gradient step.")
+    parser.add_argument("--buffer-size", type=int, default=config.MEMORY_SIZE,
+                        help=f"Replay buffer capacity in transitions (default: {config.MEMORY_SIZE})")
+    parser.add_argument("--batch-size", type=int, default=config.BATCH_SIZE,
+                        help=f"Sampled batch size (default: {config.BATCH_SIZE})")
+    parser.add_argument("--n-envs", type=int, default=config.NUM_OF_INSTANCES,
+                        help=f"Parallel env streams in the buffer (default: {config.NUM_OF_INSTANCES})")
+    parser.add_argument("--repeats", type=int, default=200,
+                        help="Timed repetitions per operation (default: 200)")
+    parser.add_argument("--device", default="auto", help="Torch device for the gradient step (default: auto)")
+    return parser.parse_args()
+
+
+def fill(buffer, n_envs, rng, episode_len=500):
+    """Fills ``buffer`` to capacity with stacked random frames."""
+    k = buffer.n_stack
+    stack = np.zeros((n_envs, k, 84, 84), dtype=np.uint8)
+    no_infos = [{} for _ in range(n_envs)]
+    for t in range(buffer.buffer_size):
+        next_stack = np.concatenate([stack[:, 1:], rng.integers(0, 256, (n_envs, 1, 84, 84), dtype=np.uint8)], 1)
+        done = np.full(n_envs, (t + 1) % episode_len == 0)
+        buffer.add(stack, next_stack, rng.integers(0, 3, (n_envs, 1)), rng.random(n_envs), done, no_infos)
+        stack = np.where(done[:, None, None, None], 0, next_stack)
+
+
+def timed(fn, repeats):
+    """Returns the median and p95 wall time of ``fn()`` in milliseconds."""
+    fn()  # Warm-up
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000.0)
+    return np.percentile(times, 50), np.percentile(times, 95)
+
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(0)
+    obs_space = spaces.Box(0, 255, (config.STACK_SIZE, 84, 84), np.uint8)  # As the policy sees it
+    act_space = spaces.Discrete(config.ACTION_SPACE)
+    device = th.device("cuda" if args.device == "auto" and th.cuda.is_available() else
+                       ("cpu" if args.device == "auto" else args.device))
+    batch = args.batch_size
+
+    per = PrioritizedReplayBuffer(args.buffer_size, obs_space, act_space, device=device, n_envs=args.n_envs)
+    uniform = FrameStackReplayBuffer(args.buffer_size, obs_space, act_space, device=device, n_envs=args.n_envs)
+    print(f"Filling two buffers of {args.buffer_size} transitions ({args.n_envs} env stream(s))...")
+    fill(per, args.n_envs, rng)
+    fill(uniform, args.n_envs, rng)
+    n = per.tree.capacity
+    per.update_priorities(np.arange(n), rng.exponential(size=n))  # Non-uniform priorities
+
+    policy = CnnPolicy(obs_space, act_space, lr_schedule=lambda _: config.LEARNING_RATE).to(device)
+    data = per.sample(batch)
+
+    def gradient_step():
+        with th.no_grad():
+            next_q = policy.q_net_target(data.next_observations).max(dim=1)[0].reshape(-1, 1)
+            target = data.rewards + (1 - data.dones) * config.GAMMA * next_q
+        current = th.gather(policy.q_net(data.observations), dim=1, index=data.actions.long())
+        loss = (data.weights * F.smooth_l1_loss(current, target, reduction="none")).mean()
+        policy.optimizer.zero_grad()
+        loss.backward()
+        policy.optimizer.step()
+        if device.type == "cuda":
+            th.cuda.synchronize()
+
+    results = {
+        "tree_find": timed(lambda: per.tree.find(rng.random(batch) * per.tree.total), args.repeats),
+        "tree_update": timed(lambda: per.tree.update(rng.integers(0, n, batch), rng.random(batch)), args.repeats),
+        "per_sample": timed(lambda: per.sample(batch), args.repeats),
+        "uniform_sample": timed(lambda: uniform.sample(batch), args.repeats),
+        "gradient_step": timed(gradient_step, args.repeats),
+    }
+
+    print(f"\nbatch {batch}, {n} transitions, sum-tree depth {per.tree.depth}, device {device}")
+    print(f"{'operation':<16}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, (p50, p95) in results.items():
+        print(f"{name:<16}{p50:>10.3f}{p95:>10.3f}")
+    overhead = results["per_sample"][0] - results["uniform_sample"][0]
+    print(f"\nPER overhead over uniform sampling: {overhead:.3f} ms "
+          f"({overhead / results['gradient_step'][0]:.1%} of a gradient step)")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,8 +7,10 @@ SDL render surface is visible to the user.
 
 Key design choices:
   - Uses :class:`~stable_baselines3.common.vec_env.DummyVecEnv` (single
-    environment, no subprocess overhead) because demo throughput is limited by
-    rendering speed rather than CPU parallelism.
+    environment, no subprocess overhead) by default because demo throughput is
+    limited by rendering speed rather than CPU parallelism.  ``--vec-env shm``
+    runs the emulator in a :class:`~env.shared_memory_vec_env.SharedMemoryVecEnv`
+    worker instead, exercising the same backend as training.
   - Sets ``deterministic=False`` during ``model.predict()`` to introduce slight
     stochasticity, which produces visually smoother and more natural-looking
     driving than the fully greedy policy.
@@ -21,13 +23,15 @@ Typical usage::
 """
 
 import os
-import glob
 import argparse
 import logging
 from stable_baselines3 import DQN
 from stable_baselines3.common.vec_env import VecFrameStack, DummyVecEnv
 from env.mkds_gym_env import MKDSEnv
+from env.shared_memory_vec_env import SharedMemoryVecEnv
 from src.utils import config, setup_logging
+from src.utils.run_index import RunIndex
+from src.utils.run_manifest import find_latest_checkpoint
 
 logger = logging.getLogger(__name__)
 
@@ -51,6 +55,13 @@ def parse_args():
         default=config.STACK_SIZE,
         help=f"Number of consecutive frames stacked per observation (default: {config.STACK_SIZE})",
     )
+    parser.add_argument(
+        "--env-stack",
+        action="store_true",
+        default=config.ENV_FRAME_STACK,
+        help="Stack frames inside MKDSEnv (ring buffer) instead of using VecFrameStack; "
+             "same observation layout, so checkpoints are interchangeable.",
+    )
     parser.add_argument(
         "--action-space",
         type=int,
@@ -58,6 +69,26 @@ def parse_args():
         choices=[3, 6],
         help=f"Number of discrete actions: 3 (basic) or 6 (with drift) (default: {config.ACTION_SPACE})",
     )
+    parser.add_argument(
+        "--frame-skip",
+        type=int,
+        default=config.FRAME_SKIP,
+        help=f"Emulator frames per environment step; must match training (default: {config.FRAME_SKIP})",
+    )
+    parser.add_argument(
+        "--max-pool",
+        action="store_true",
+        default=config.MAX_POOL_FRAMES,
+        help="Observe the max of the last two rendered frames; must match training.",
+    )
+    parser.add_argument(
+        "--vec-env",
+        type=str,
+        default="dummy",
+        choices=["dummy", "shm"],
+        help="'dummy' runs the emulator in this process; 'shm' runs it in a "
+             "SharedMemoryVecEnv worker, as in training (default: dummy).",
+    )
     parser.add_argument(
         "--deterministic",
         action="store_true",
@@ -97,11 +128,12 @@ def resolve_demo_model_path(model_arg):
     run_dir = os.path.normpath(os.path.join("outputs", run_id))
     
     if os.path.isdir(run_dir):
-        model_files = glob.glob(os.path.join(run_dir, "models", "*.zip"))
-        if model_files:
-            latest_model = max(model_files, key=os.path.getmtime)
+        run_index = RunIndex("outputs")
+        run_index.refresh_run(run_id)
+        latest_model = run_index.latest_checkpoint(run_id) or find_latest_checkpoint(run_dir)
+        if latest_model:
             # Strip .zip extension
-            return os.path.splitext(os.path.abspath(latest_model))[0]
+            return os.path.splitext(latest_model)[0]
         else:
             raise FileNotFoundError(f"No model checkpoints (.zip) found in {run_dir}/models/")
     else:
@@ -112,11 +144,13 @@ def resolve_demo_model_path(model_arg):
 
 
 def select_model():
-    """Scans for saved ``.zip`` models and lets the user choose one to run.
+    """Lists the saved ``.zip`` models and lets the user choose one to run.
 
-    Performs a recursive glob under ``outputs/`` to discover every ``.zip``
-    model file regardless of nesting depth, presents a numbered menu, and
-    returns the chosen path stripped of its ``.zip`` extension.
+    Syncs the run index (``outputs/run_index.sqlite``, see
+    :mod:`src.utils.run_index`) and lists the checkpoints of every run
+    with their global step and score, from one query instead of a
+    recursive glob of ``outputs/``.  Presents a numbered menu and returns
+    the chosen path stripped of its ``.zip`` extension.
 
     Note:
         SB3's ``DQN.load()`` expects the path *without* the ``.zip`` suffix;
@@ -127,19 +161,26 @@ def select_model():
             removed (ready to pass directly to ``DQN.load()``), or ``None``
             if no models are found or the user provides invalid input.
     """
-    # Search in outputs root and all sub-folders recursively.
-    search_pattern = os.path.join("outputs", "**", "*.zip")
-    model_files = glob.glob(search_pattern, recursive=True)
+    if not os.path.isdir("outputs"):
+        print("No .zip models found in the /outputs directory.")
+        return None
+
+    run_index = RunIndex("outputs").sync()
+    checkpoints = run_index.checkpoints()
+    model_files = [c["path"] for c in checkpoints]
 
     if not model_files:
         print("No .zip models found in the /outputs directory.")
         return None
 
     print("\n--- Available Models ---")
-    for i, file_path in enumerate(model_files, 1):
+    for i, checkpoint in enumerate(checkpoints, 1):
         # Show only the path relative to outputs/ to keep the menu readable.
-        display_name = os.path.relpath(file_path, "outputs")
-        print(f"{i}) {display_name}")
+        display_name = os.path.relpath(checkpoint["path"], run_index.outputs_dir)
+        details = f"step {checkpoint['step']}" if checkpoint["step"] is not None else "step ?"
+        if checkpoint["score"] is not None:
+            details += f", score {checkpoint['score']:.1f}"
+        print(f"{i}) {display_name} ({details})")
 
     while True:
         try:
@@ -162,12 +203,14 @@ def run_demo(args=None):
     2. Wraps a single :class:`~env.mkds_gym_env.MKDSEnv` (``visualize=True`` unless headless)
        in a :class:`~stable_baselines3.common.vec_env.DummyVecEnv` to satisfy
        the SB3 vectorised-environment interface without spawning a subprocess.
-    3. Applies :class:`~stable_baselines3.common.vec_env.VecFrameStack` to
-       match the observation format the model was trained on.
+    3. Applies :class:`~stable_baselines3.common.vec_env.VecFrameStack` (or
+       ``MKDSEnv``'s own frame stack with ``--env-stack``) to match the
+       observation format the model was trained on.
     4. Runs an infinite predict-step loop, printing cumulative episode rewards
        at each episode boundary.
-    5. Calls ``base_env.emu.destroy()`` in a ``finally`` block to cleanly shut
-       down the emulator regardless of how the loop exits.
+    5. Calls ``env.close()`` in a ``finally`` block to cleanly shut
+       down the emulator (and drop its in-memory boot state) regardless of
+       how the loop exits.
     """
     if args is None:
         args = parse_args()
@@ -177,7 +220,10 @@ def run_demo(args=None):
 
     # Override config values
     config.STACK_SIZE = args.stack_size
+    config.ENV_FRAME_STACK = args.env_stack
     config.ACTION_SPACE = args.action_space
+    config.FRAME_SKIP = args.frame_skip
+    config.MAX_POOL_FRAMES = args.max_pool
 
     if args.model:
         try:
@@ -195,15 +241,24 @@ def run_demo(args=None):
 
     # Instantiate the base environment. We support toggling visualization.
     visualize = not args.no_visualize
-    base_env = MKDSEnv(visualize=visualize)
-
-    # DummyVecEnv wraps a single environment in the VecEnv interface without
-    # creating a subprocess -- ideal for demo/inference where parallelism is
-    # unnecessary and would only add IPC overhead.
-    env = DummyVecEnv([lambda: base_env])
+    env_stack = config.STACK_SIZE if config.ENV_FRAME_STACK else 1
+    def make_env():
+        return MKDSEnv(visualize=visualize, frame_skip=args.frame_skip, max_pool=args.max_pool,
+                       frame_stack=env_stack)
+
+    if args.vec_env == "shm":
+        # Same worker backend as `train_sb3_dqn.py --vec-env shm`.
+        env = SharedMemoryVecEnv([make_env])
+    else:
+        # DummyVecEnv wraps a single environment in the VecEnv interface without
+        # creating a subprocess -- ideal for demo/inference where parallelism is
+        # unnecessary and would only add IPC overhead.
+        env = DummyVecEnv([make_env])
 
-    # Stack frames to match the observation shape the model was trained on.
-    env = VecFrameStack(env, n_stack=config.STACK_SIZE, channels_order='last')
+    # Stack frames to match the observation shape the model was trained on
+    # (unless MKDSEnv already does it; the layout is identical either way).
+    if env_stack == 1:
+        env = VecFrameStack(env, n_stack=config.STACK_SIZE, channels_order='last')
 
     try:
         model = DQN.load(model_path, env=env, device="auto")
@@ -211,7 +266,7 @@ def run_demo(args=None):
     except Exception as e:
         logger.error(f"Error: Model didn't load properly. {e}")
         # Destroy the emulator before returning to avoid orphaned processes.
-        base_env.emu.destroy()
+        env.close()
         return
 
     obs = env.reset()
@@ -246,7 +301,8 @@ def run_demo(args=None):
     finally:
         # Always destroy the emulator to release the SDL window and any
         # underlying DeSmuME resources, even if an exception occurred.
-        base_env.emu.destroy()
+        # Closing the VecEnv closes the wrapped MKDSEnv (or its worker).
+        env.close()
         logger.info("Emulator closed.")
 
 
@@ -0,0 +1,192 @@
+"""Asynchronous partial-batch stepping across emulator workers.
+
+With a synchronous VecEnv, every ``step_wait`` blocks on the slowest
+emulator.  In practice that is whichever worker just hit a reset spike
+(restoring the boot save state), so the whole fleet runs at the pace of its
+stragglers.  :class:`AsyncSharedMemoryVecEnv` works like EnvPool's async
+mode.  It runs ``num_workers`` emulators but presents a batch of only
+``batch_size`` environments to the agent:
+
+* ``step_async(actions)`` sends the actions to the workers of the batch that
+  was returned last (:attr:`env_ids`);
+* ``step_wait()`` returns the first ``batch_size`` workers that have a
+  result ready, whichever they are, and updates :attr:`env_ids`.  Each
+  ``info`` also carries its worker id under ``"env_id"``.
+
+Workers that are still busy keep stepping in the background and are
+returned by a later ``step_wait``.
+
+Because consecutive batches contain different workers, SB3's ``VecFrameStack``
+(which stacks along fixed batch positions) cannot be used.  Frames are stacked
+per worker instead: preferably inside each env (``MKDSEnv(frame_stack=k)``,
+as ``train_sb3_dqn.py`` does), or here with ``n_stack``.  For the same
+reason, a result is not a transition of the batch that produced the last
+actions.  The collector has to
+pair each result with the observation and action last sent to *that* worker;
+:class:`~src.utils.async_dqn.AsyncDQN` does this.
+
+Right after :meth:`reset`, the workers that are not in the first batch are
+queued with their reset observation.  When such a worker is returned for the
+first time, its row is not a transition: reward is 0, done is ``False``, and
+the info is only ``{"env_id": i}``.
+"""
+
+from collections import deque
+from multiprocessing.connection import wait
+import numpy as np
+from gymnasium import spaces
+from env.shared_memory_vec_env import SharedMemoryVecEnv
+
+
+class AsyncSharedMemoryVecEnv(SharedMemoryVecEnv):
+    """Shared-memory VecEnv that returns the first ``batch_size`` ready workers.
+
+    Args:
+        env_fns (list[Callable[[], gym.Env]]): Environment factories, one per
+            worker process.
+        batch_size (int): Number of environments returned per ``step_wait``
+            (the VecEnv's ``num_envs``).  Must not exceed ``len(env_fns)``.
+        n_stack (int): Frames stacked per worker along the last axis (same
+            layout as ``VecFrameStack(channels_order='last')``).
+        start_method (str | None): ``multiprocessing`` start method, see
+            :class:`~env.shared_memory_vec_env.SharedMemoryVecEnv`.
+
+    Attributes:
+        num_workers (int): Number of emulator processes.
+        env_ids (np.ndarray): Worker id of each row of the latest batch.
+
+    Raises:
+        ValueError: If ``batch_size`` is not in ``[1, len(env_fns)]``.
+    """
+
+    def __init__(self, env_fns, batch_size, n_stack=1, start_method=None):
+        if not 1 <= batch_size <= len(env_fns):
+            raise ValueError(f"batch_size must be between 1 and {len(env_fns)}, got {batch_size}")
+        super().__init__(env_fns, start_method=start_method)
+
+        self.num_workers = len(env_fns)
+        self.batch_size = batch_size
+        self.num_envs = batch_size
+        self.n_stack = n_stack
+        self.reset_infos = [{} for _ in range(batch_size)]
+
+        # Per-worker frame stacks (channels last), see VecFrameStack.
+        frame_space = self.observation_space
+        self._frame_channels = frame_space.shape[-1]
+        self.observation_space = spaces.Box(
+            low=np.repeat(frame_space.low, n_stack, axis=-1),
+            high=np.repeat(frame_space.high, n_stack, axis=-1),
+            dtype=frame_space.dtype,
+        )
+        self._stacks = np.zeros((self.num_workers,) + self.observation_space.shape, dtype=frame_space.dtype)
+
+        self.env_ids = np.arange(batch_size)
+        self._busy = set()       # Workers with an action in flight
+        self._ready = deque()    # (worker id, extra info, fresh) not yet returned
+        self._remote_ids = {remote: i for i, remote in enumerate(self.remotes)}
+
+    def step_async(self, actions):
+        actions = np.asarray(actions)
+        for row, i in enumerate(self.env_ids):
+            self._arrays.actions[i] = actions[row]
+            self.remotes[i].send(("step", None))
+            self._busy.add(int(i))
+        self.waiting = True
+
+    def step_wait(self):
+        self._collect(self.batch_size)
+        self.waiting = False
+        arrays = self._arrays
+        batch = [self._ready.popleft() for _ in range(self.batch_size)]
+        self.env_ids = np.array([i for i, _, _ in batch])
+
+        rewards = np.zeros(self.batch_size, dtype=np.float64)
+        dones = np.zeros(self.batch_size, dtype=bool)
+        infos = []
+        for row, (i, extra, fresh) in enumerate(batch):
+            if fresh:
+                # Reset observation queued by reset(); already in the stack.
+                infos.append({"env_id": i})
+                continue
+            info = self._result_info(i, extra)
+            info["env_id"] = i
+            rewards[row] = arrays.rewards[i]
+            dones[row] = arrays.terminated[i] or arrays.truncated[i]
+            if dones[row]:
+                self._push_frame(i, arrays.terminal_obs[i])
+                info["terminal_observation"] = self._stacks[i].copy()
+                self._stacks[i] = 0
+            self._push_frame(i, arrays.obs[i])
+            infos.append(info)
+
+        return self._stacks[self.env_ids], rewards, dones, infos
+
+    def reset(self):
+        self._collect_all()
+        self._ready.clear()
+        for i, remote in enumerate(self.remotes):
+            remote.send(("reset", (self._seeds[i], self._options[i])))
+        reset_infos = [remote.recv() for remote in self.remotes]
+        self._reset_seeds()
+        self._reset_options()
+
+        self._stacks[:] = 0
+        for i in range(self.num_workers):
+            self._push_frame(i, self._arrays.obs[i])
+
+        # The first batch is returned now; the rest wait for their turn.
+        self.env_ids = np.arange(self.batch_size)
+        for i in range(self.batch_size, self.num_workers):
+            self._ready.append((i, None, True))
+        self.reset_infos = [reset_infos[i] for i in self.env_ids]
+        return self._stacks[self.env_ids]
+
+    def close(self):
+        if self.closed:
+            return
+        # Only busy workers owe a reply; the base class would wait on all.
+        for i in self._busy:
+            self.remotes[i].recv()
+        self._busy.clear()
+        self.waiting = False
+        super().close()
+
+    def seed(self, seed=None):
+        if seed is None:
+            seed = int(np.random.randint(0, np.iinfo(np.uint32).max, dtype=np.uint32))
+        self._seeds = [seed + i for i in range(self.num_workers)]
+        return self._seeds
+
+    def _reset_seeds(self):
+        self._seeds = [None for _ in range(self.num_workers)]
+
+    def _reset_options(self):
+        self._options = [{} for _ in range(self.num_workers)]
+
+    def _push_frame(self, index, frame):
+        """Shifts worker ``index``'s stack left and appends ``frame``."""
+        c = self._frame_channels
+        stack = self._stacks[index]
+        stack[..., :-c] = stack[..., c:]
+        stack[..., -c:] = frame
+
+    def _collect(self, n):
+        """Blocks until at least ``n`` results are queued in ``_ready``."""
+        while len(self._ready) < n:
+            for remote in wait([self.remotes[i] for i in self._busy]):
+                i = self._remote_ids[remote]
+                self._ready.append((i, remote.recv(), False))
+                self._busy.discard(i)
+
+    def _collect_all(self):
+        """Waits for every in-flight step so the pipes are free for commands."""
+        self._collect(len(self._ready) + len(self._busy))
+
+    def _get_target_remotes(self, indices):
+        # Indices address workers, not rows of the current batch.
+        self._collect_all()
+        if indices is None:
+            indices = range(self.num_workers)
+        elif isinstance(indices, int):
+            indices = [indices]
+        return [self.remotes[i] for i in indices]
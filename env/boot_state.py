@@ -0,0 +1,129 @@
+"""In-memory boot save state for fast ``MKDSEnv`` resets.
+
+Episodes end often (collision, stuck and backward watchdogs), and every
+reset used to re-check ``mkds_boot.dst`` on disk and hand the 2.7 MB file to
+DeSmuME again.  :class:`BootState` reads the save state **once** per worker,
+keeps the bytes in memory, and restores from a RAM-backed copy on every
+reset.
+
+DeSmuME's C API (``desmume_savestate_load``) only accepts a file name, and
+its numbered save slots are shared files in the emulator's state directory
+(unsafe with several workers writing them at once).  The closest in-memory
+equivalent is therefore a private copy of the state on a RAM-backed
+filesystem (``/dev/shm`` on Linux); on platforms without one, the copy lives
+in the temp directory and is served from the OS page cache.
+"""
+
+import os
+import time
+import atexit
+import logging
+import tempfile
+from src.utils import config
+
+logger = logging.getLogger(__name__)
+
+
+class BootState:
+    """A save state loaded once and restored cheaply on every reset.
+
+    Attributes:
+        source_path (str): The original save-state file on disk.
+        mode (str): ``"memory"`` (default) restores from a private RAM-backed
+            copy; ``"file"`` reloads ``source_path`` every time (the previous
+            behaviour, kept for debugging).
+        data (bytes | None): The save-state bytes, or ``None`` when the file
+            does not exist (resets then keep the current emulator state).
+        load_path (str | None): The file DeSmuME actually loads on restore.
+        last_restore_ms (float): Wall-clock latency of the latest restore.
+    """
+
+    def __init__(self, emu, source_path=None, mode=None):
+        """Reads the save state once and prepares the restore path.
+
+        Args:
+            emu (DeSmuME): Emulator instance the state is restored into.
+            source_path (str | None): Save-state file.  Defaults to
+                ``config.SAVE_FILE_NAME``.
+            mode (str | None): ``"memory"`` or ``"file"``.  Defaults to
+                ``config.BOOT_STATE_MODE``.
+
+        Raises:
+            ValueError: If ``mode`` is not a known restore mode.
+        """
+        self.emu = emu
+        self.source_path = source_path or config.SAVE_FILE_NAME
+        self.mode = mode or config.BOOT_STATE_MODE
+        if self.mode not in ("memory", "file"):
+            raise ValueError(f"Unknown boot state mode '{self.mode}' (expected 'memory' or 'file')")
+
+        self.data = None
+        self.load_path = None
+        self.last_restore_ms = 0.0
+        self._owns_load_path = False
+
+        # Existence is checked once here rather than on every reset.
+        if not os.path.exists(self.source_path):
+            logger.warning(f"Boot save state not found at {self.source_path}; resets will not reload it.")
+            return
+
+        with open(self.source_path, "rb") as f:
+            self.data = f.read()
+
+        if self.mode == "file":
+            self.load_path = self.source_path
+            return
+
+        self.make_private_copy()
+        # /dev/shm is not cleaned on process exit; remove the copy even when
+        # the owning env is never closed explicitly.
+        atexit.register(self.close)
+
+    def make_private_copy(self):
+        """Writes this process's own RAM-backed copy of the state.
+
+        Called once from ``__init__``, and again in workers forked from a
+        pre-booted process (see ``env/worker_startup.py``): a forked child
+        must not share the parent's copy, which the parent deletes on close.
+        Does nothing in ``"file"`` mode or when there is no state.
+        """
+        if self.data is None or self.mode == "file":
+            return
+        # Private per-worker copy on a RAM-backed filesystem when available.
+        ram_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        fd, self.load_path = tempfile.mkstemp(prefix="mkds_boot_", suffix=".dst", dir=ram_dir)
+        with os.fdopen(fd, "wb") as f:
+            f.write(self.data)
+        self._owns_load_path = True
+
+    def restore(self):
+        """Restores the boot state into the emulator.
+
+        Returns:
+            float: Restore latency in milliseconds (also stored in
+                :attr:`last_restore_ms`).  ``0.0`` when there is no state.
+        """
+        if self.load_path is None:
+            self.last_restore_ms = 0.0
+            return 0.0
+        start = time.perf_counter()
+        try:
+            self.emu.savestate.load_file(self.load_path)
+        except RuntimeError:
+            # The RAM copy vanished (e.g. /dev/shm was cleaned): rewrite it.
+            if not self._owns_load_path:
+                raise
+            with open(self.load_path, "wb") as f:
+                f.write(self.data)
+            self.emu.savestate.load_file(self.load_path)
+        self.last_restore_ms = (time.perf_counter() - start) * 1000.0
+        return self.last_restore_ms
+
+    def close(self):
+        """Deletes the private RAM-backed copy, if one was created."""
+        if self._owns_load_path and self.load_path and os.path.exists(self.load_path):
+            try:
+                os.remove(self.load_path)
+            except OSError:
+                pass
+        self._owns_load_path = False
@@ -15,15 +15,28 @@ import numpy as np
 import cv2
 import os
 import math
-from desmume.emulator import DeSmuME, SCREEN_WIDTH, SCREEN_HEIGHT_BOTH
+import time
+import ctypes
+import logging
+from desmume.emulator import DeSmuME, SCREEN_WIDTH, SCREEN_HEIGHT, SCREEN_HEIGHT_BOTH
+from env.boot_state import BootState
+from env.ram_schema import KART_STRUCT, RACE_INFO_STRUCT, TIMER_STRUCT
+from env.telemetry import REASON_CODES, EPISODE_STRUCT, pack_record
+from env.step_profiler import (StepProfiler, EMU_CYCLE, GET_OBS, WINDOW_DRAW,
+                               READ_RAM, READ_RACE_TIME, WATCHDOGS)
 from src.utils import config
 
+logger = logging.getLogger(__name__)
+
 class MKDSEnv(gym.Env):
     """Gymnasium environment for Mario Kart DS.
 
     Uses DeSmuME for emulation and memory access for reward shaping.
     Observations are single-channel (grayscale) crops of the top screen,
     downscaled to ``(config.STATE_H, config.STATE_W, 1)`` for efficiency.
+    With ``frame_stack=k`` the env stacks the last ``k`` frames itself,
+    giving ``(config.STATE_H, config.STATE_W, k)`` observations laid out
+    exactly like ``VecFrameStack(n_stack=k, channels_order='last')``.
 
     Attributes:
         emu (DeSmuME): The running DeSmuME emulator instance.
@@ -32,7 +45,10 @@ class MKDSEnv(gym.Env):
         action_space (spaces.Discrete): Discrete action space whose size is
             defined by ``config.ACTION_SPACE``.
         observation_space (spaces.Box): Box observation space with shape
-            ``(config.STATE_H, config.STATE_W, 1)`` and dtype ``uint8``.
+            ``(config.STATE_H, config.STATE_W, frame_stack)`` and dtype
+            ``uint8``.
+        frame_stack (int): Number of frames stacked inside the env (``1``
+            means no stacking).
         action_map (dict[int, list[int]]): Mapping from discrete action
             index to a list of DeSmuME keymask values to press simultaneously.
         prev_checkpoint (int): Checkpoint index reached in the previous step,
@@ -46,33 +62,90 @@ class MKDSEnv(gym.Env):
             from the previous step, used for stuck detection.
         last_cp_time_stamp (int): Internal race-timer value (60 ticks/s) at
             the last checkpoint advance; used for the timeout watchdog.
+        kart_ptr (int): Cached address of the kart physics struct.
+        race_info_ptr (int): Cached address of the race-info struct.
+        timer_ptr (int): Cached address of the race timer struct.
+        startup_stats (dict): ``pid``, ``init_ms`` (emulator boot, ROM and
+            save-state load) and ``ready_time`` (wall-clock ``time.time()``
+            when the env became usable), read by
+            :func:`env.worker_startup.log_worker_startup`.
     """
 
-    def __init__(self, visualize=False):
+    def __init__(self, visualize=False, frame_skip=None, max_pool=None, frame_stack=1):
         """Initialises the emulator, spaces, and internal tracking state.
 
         Args:
             visualize (bool): When ``True``, creates an SDL window so the
                 emulator renders frames in real time.  Defaults to ``False``
                 for headless training.
+            frame_skip (int | None): Emulator frames advanced per ``step()``
+                (action repeat).  Only the observed frame(s) are rendered.
+                Defaults to ``config.FRAME_SKIP``.
+            max_pool (bool | None): When ``True``, the observation is the
+                pixel-wise maximum of the last two rendered frames.  Defaults
+                to ``config.MAX_POOL_FRAMES``.
+            frame_stack (int): Stack this many consecutive frames along the
+                channel axis inside the env, replacing ``VecFrameStack``.
+                Defaults to ``1`` (single frame; stack in the VecEnv).
         """
         super(MKDSEnv, self).__init__()
+        init_start = time.perf_counter()
+        self.frame_skip = config.FRAME_SKIP if frame_skip is None else int(frame_skip)
+        self.max_pool = config.MAX_POOL_FRAMES if max_pool is None else bool(max_pool)
+        if self.frame_skip < 1:
+            raise ValueError(f"frame_skip must be >= 1, got {self.frame_skip}")
+        self.frame_stack = int(frame_stack)
+        if self.frame_stack < 1:
+            raise ValueError(f"frame_stack must be >= 1, got {self.frame_stack}")
+
         self.emu = DeSmuME()
         self.emu.open(config.ROM_PATH)
         self.window = None
         if visualize:
             self.window = self.emu.create_sdl_window()
 
+        # Direct binding to the 32-bit RAM reader (restype is configured by
+        # py-desmume).  One ctypes call per word, instead of one per byte as
+        # with ``memory.unsigned[a:b]`` slices.
+        self._read_long = self.emu.lib.desmume_memory_read_long
+
+        # Boot save state, read from disk once and restored from memory on
+        # every reset (see env/boot_state.py).
+        self.boot_state = BootState(self.emu)
+        self._pending_reset_ms = None  # Reported in the first step's info
+
         # Discrete action space — size controlled by config so experiments
         # can toggle expanded action sets without touching this file.
         self.action_space = spaces.Discrete(config.ACTION_SPACE)
 
-        # Single-channel (grayscale) observation to reduce CNN input size.
+        # Single-channel (grayscale) frames to reduce CNN input size, stacked
+        # along the last axis when frame_stack > 1.
         self.observation_space = spaces.Box(low=0, high=255, 
-                                            shape=(config.STATE_H, config.STATE_W, 1), 
+                                            shape=(config.STATE_H, config.STATE_W, self.frame_stack), 
                                             dtype=np.uint8)
 
         self.action_map = self._setup_actions()
+
+        # Preallocated observation pipeline buffers (see _get_obs).  The
+        # framebuffer is copied by DeSmuME straight into _rgbx, and the
+        # grayscale / resized images are written in place every step.
+        self._rgbx = np.empty((SCREEN_HEIGHT_BOTH, SCREEN_WIDTH, 4), dtype=np.uint8)
+        self._rgbx_ptr = self._rgbx.ctypes.data_as(ctypes.c_char_p)
+        self._top_screen = self._rgbx[:SCREEN_HEIGHT]  # Contiguous view of rows 0-191
+        self._gray = np.empty((SCREEN_HEIGHT, SCREEN_WIDTH), dtype=np.uint8)
+        self._obs = np.empty((config.STATE_H, config.STATE_W, 1), dtype=np.uint8)
+        self._obs_2d = self._obs[:, :, 0]  # (H, W) view used as the resize target
+        # Second-to-last rendered frame, only used when max-pooling.
+        self._pool_obs = np.empty_like(self._obs) if self.max_pool else None
+
+        # Frame-stack ring buffer.  Every frame is written twice, at channel p
+        # and p + frame_stack, so the last frame_stack frames in order (oldest
+        # first) are always the contiguous channel window [p+1, p+1+frame_stack)
+        # and no stored frame ever has to be shifted.
+        self._ring = None
+        if self.frame_stack > 1:
+            self._ring = np.zeros((config.STATE_H, config.STATE_W, 2 * self.frame_stack), dtype=np.uint8)
+            self._ring_pos = self.frame_stack - 1
         
         # Tracking variables for Watchdogs
         self.prev_checkpoint = 0       # Last known checkpoint index
@@ -82,6 +155,33 @@ class MKDSEnv(gym.Env):
         self.last_pos = (0, 0, 0)      # Last known world-space position
         self.last_cp_time_stamp = 0    # Track internal time of last CP change
 
+        # Episode accumulators, emitted as info["episode_summary"] at the end
+        # of each episode (see env/telemetry.py).  Zeroed by reset().
+        self._ep_length = 0
+        self._ep_reward = 0.0
+        self._ep_speed_sum = 0.0
+        self._ep_offroad_steps = 0
+        self._ep_checkpoints = 0
+        self._ep_start_time = 0
+        self._ep_reset_ms = np.nan
+
+        # Pointer cache: the game structs do not move during a race, so the
+        # three base pointers are resolved once per episode (see
+        # _resolve_pointers) instead of on every RAM read.
+        self.kart_ptr = 0
+        self.race_info_ptr = 0
+        self.timer_ptr = 0
+        self._pointers_valid = False
+
+        # Per-component step timing, off unless set_step_profiling(True).
+        self._profiler = None
+
+        self.startup_stats = {
+            "pid": os.getpid(),
+            "init_ms": (time.perf_counter() - init_start) * 1000.0,
+            "ready_time": time.time(),
+        }
+
     def _setup_actions(self):
         """Maps discrete actions to DeSmuME keymasks.
 
@@ -120,35 +220,93 @@ class MKDSEnv(gym.Env):
     def _get_obs(self):
         """Captures the top screen and processes it for the CNN.
 
-        Reads the full dual-screen RGBX framebuffer from the emulator, crops
-        the top 192 rows (top DS screen), converts to grayscale, and resizes
-        to ``(config.STATE_W, config.STATE_H)`` before adding a channel dim.
+        Copies the full dual-screen RGBX framebuffer from the emulator into a
+        preallocated buffer, takes the top 192 rows (top DS screen), converts
+        to grayscale, and resizes to ``(config.STATE_W, config.STATE_H)``.
+
+        Every intermediate image lives in a per-env buffer allocated in
+        ``__init__``; ``cv2.cvtColor`` and ``cv2.resize`` write into those
+        buffers in place.  The only allocation per call is the final copy,
+        made at the point the observation leaves the environment.
 
         Returns:
             np.ndarray: Processed observation of shape
-                ``(config.STATE_H, config.STATE_W, 1)`` with dtype ``uint8``.
-                Pixel values range ``[0, 255]``.
+                ``(config.STATE_H, config.STATE_W, frame_stack)`` with dtype
+                ``uint8``.  Pixel values range ``[0, 255]``.
+        """
+        self._render_obs()
+        return self._observation()
+
+    def _observation(self):
+        """Returns the observation for the frame currently in ``self._obs``.
+
+        Without frame stacking this is a copy of the frame.  With it, the
+        frame is appended to the ring buffer (two strided channel writes) and
+        the stacked window is copied out.  The copy matters: VecEnvs keep the
+        terminal observation of an episode across the following ``reset()``,
+        which would otherwise overwrite it in place.
+        """
+        if self._ring is None:
+            return self._obs.copy()
+        k = self.frame_stack
+        p = (self._ring_pos + 1) % k
+        self._ring[:, :, p] = self._obs_2d
+        self._ring[:, :, p + k] = self._obs_2d
+        self._ring_pos = p
+        return self._ring[:, :, p + 1:p + 1 + k].copy()
+
+    def _render_obs(self):
+        """Fills ``self._obs`` in place from the current framebuffer.
+
+        ``emu.display_buffer_as_rgbx()`` returns a fresh ``bytearray`` copy
+        of an intermediate ctypes buffer on every call, so the raw DeSmuME
+        export is called directly with a pointer to our own buffer instead.
         """
-        raw_mv = self.emu.display_buffer_as_rgbx()
         # Full dual-screen buffer: height = SCREEN_HEIGHT_BOTH (384), width = SCREEN_WIDTH (256), 4 channels (RGBX)
-        img = np.frombuffer(raw_mv, dtype=np.uint8).reshape(SCREEN_HEIGHT_BOTH, SCREEN_WIDTH, 4)
-        
+        self.emu.lib.desmume_draw_raw_as_rgbx(self._rgbx_ptr)
+
         # [cite_start]Crop Top Screen (First 192 pixels) [cite: 7]
         # The NDS top screen occupies rows 0-191; the bottom touch screen is rows 192-383.
-        top_screen = img[:192, :, :3]  # Drop the unused X (padding) channel
-        
-        # Resize and Grayscale for CNN efficiency
-        gray = cv2.cvtColor(top_screen, cv2.COLOR_RGB2GRAY)
-        resized = cv2.resize(gray, (config.STATE_W, config.STATE_H), interpolation=cv2.INTER_AREA)
-        # Add channel dimension so shape is (H, W, 1) to match observation_space
-        return np.expand_dims(resized, axis=-1)
+        # RGBA2GRAY ignores the unused X (padding) channel, so no 3-channel copy is needed.
+        cv2.cvtColor(self._top_screen, cv2.COLOR_RGBA2GRAY, dst=self._gray)
+
+        # Resize for CNN efficiency, writing straight into the (H, W, 1) buffer
+        # so the channel dimension required by observation_space is free.
+        cv2.resize(self._gray, (config.STATE_W, config.STATE_H), dst=self._obs_2d,
+                   interpolation=cv2.INTER_AREA)
+
+    @staticmethod
+    def _is_valid_pointer(ptr):
+        """Cheap sanity check: a usable struct pointer lies in ARM9 main RAM."""
+        return config.MAIN_RAM_START <= ptr < config.MAIN_RAM_END
+
+    def _resolve_pointers(self):
+        """Dereferences the three base pointers and caches the results.
+
+        Called after every ``reset()`` and, while any pointer is still null
+        or out of range (e.g. the race has not finished loading), lazily from
+        the RAM readers.  Once all three are valid they are reused for the
+        rest of the episode, removing three RAM round-trips per step.
+
+        Returns:
+            bool: ``True`` when all three pointers are valid.
+        """
+        read_long = self._read_long
+        self.kart_ptr = read_long(config.ADDR_BASE_POINTER)
+        self.race_info_ptr = read_long(config.ADDR_RACE_INFO_POINTER)
+        self.timer_ptr = read_long(config.ADDR_TIMER_POINTER)
+        self._pointers_valid = (self._is_valid_pointer(self.kart_ptr)
+                                and self._is_valid_pointer(self.race_info_ptr)
+                                and self._is_valid_pointer(self.timer_ptr))
+        return self._pointers_valid
 
     def _read_race_time(self):
         """Reads the internal 32-bit race timer (60 ticks per second).
 
-        Follows a two-level pointer: first reads a pointer address from
-        ``config.ADDR_TIMER_POINTER``, then dereferences that pointer to
-        obtain the 32-bit tick count.
+        Follows a two-level pointer: the timer struct address stored at
+        ``config.ADDR_TIMER_POINTER`` (cached per episode by
+        :meth:`_resolve_pointers`) is dereferenced to obtain the 32-bit tick
+        count.
 
         Returns:
             int: Current race timer value in emulator ticks (60 ticks = 1 s).
@@ -159,21 +317,21 @@ class MKDSEnv(gym.Env):
             refresh rate.  All timeout durations in ``step()`` are expressed
             in these ticks.
         """
-        mem = self.emu.memory.unsigned
-        # Read the pointer, then the value it points to
-        ptr_val = int.from_bytes(mem[config.ADDR_TIMER_POINTER : config.ADDR_TIMER_POINTER + 4], 'little')
-        if ptr_val == 0:  # Null pointer - race data not yet loaded
-            return 0
-        return int.from_bytes(mem[ptr_val : ptr_val + 4], 'little')
+        if not self._pointers_valid and not self._resolve_pointers():
+            if not self._is_valid_pointer(self.timer_ptr):  # Null pointer - race data not yet loaded
+                return 0
+        return TIMER_STRUCT.read(self._read_long, self.timer_ptr)[0]
 
     def _read_ram(self):
         """Reads physics and race progress from NDS RAM.
 
-        Follows two base pointers - one for the kart physics struct and one
-        for the race-info struct - then reads offsets defined in ``config``.
-        All multi-byte values are little-endian.  Speed and offroad values
-        are stored as 20.12 fixed-point integers and are scaled by dividing
-        by 4096 to yield floating-point units.
+        Uses the cached base pointers (see :meth:`_resolve_pointers`) - one
+        for the kart physics struct and one for the race-info struct - and
+        decodes each struct in one pass with the compiled schemas from
+        :mod:`env.ram_schema` (built from the ``OFFSET_*`` constants in
+        ``config``).  All multi-byte values are little-endian.  Speed and
+        offroad values are stored as 20.12 fixed-point integers and are
+        scaled by dividing by 4096 to yield floating-point units.
 
         Returns:
             tuple: A 6-element tuple ``(speed, angle, checkpoint, lap,
@@ -192,44 +350,69 @@ class MKDSEnv(gym.Env):
                 * **pos** (*tuple[int, int, int]*): World-space position
                   ``(X, Y, Z)`` as signed 32-bit integers in NDS world units.
 
-            If either base pointer is null (data not yet loaded), returns the
-            safe fallback ``(0.0, 0, 0, 0, 1.0, (0, 0, 0))``.
+            If either base pointer is null or outside main RAM (data not yet
+            loaded), returns the safe fallback ``(0.0, 0, 0, 0, 1.0,
+            (0, 0, 0))``.
 
         Note:
             Fixed-point scaling: NDS physics values use a 20.12 fixed-point
             representation, so dividing by ``4096`` (2^12) converts them to
             human-readable floating-point units.
         """
-        mem = self.emu.memory.unsigned
-    
-        base_ptr = int.from_bytes(mem[config.ADDR_BASE_POINTER:config.ADDR_BASE_POINTER+4], 'little')
-        race_ptr = int.from_bytes(mem[config.ADDR_RACE_INFO_POINTER:config.ADDR_RACE_INFO_POINTER+4], 'little')
-        
-        if base_ptr == 0 or race_ptr == 0:  # Guard: pointers valid only mid-race
-            return 0.0, 0, 0, 0, 1.0, (0,0,0)
-
-        # Dynamic values with scaling
-        # Divide by 4096 (2^12) to convert 20.12 fixed-point to float
-        speed = int.from_bytes(mem[base_ptr + config.OFFSET_SPEED:base_ptr + config.OFFSET_SPEED + 4], 'little', signed=True) / 4096.0
-        angle = int.from_bytes(mem[base_ptr + config.OFFSET_ANGLE:base_ptr + config.OFFSET_ANGLE + 2], 'little', signed=True)
-        checkpoint = mem[race_ptr + config.OFFSET_CHECKPOINT]  # Unsigned byte; wraps at track end
-        lap = mem[race_ptr + config.OFFSET_LAP]                # Unsigned byte lap counter
-        # offroad < 1.0 means grass/dirt; exactly 1.0 means normal tarmac
-        offroad = int.from_bytes(mem[base_ptr + config.OFFSET_OFFROAD:base_ptr + config.OFFSET_OFFROAD + 4], 'little', signed=True) / 4096.0
-        
-        # World-space position: three consecutive signed 32-bit words at offsets
-        # 0x80 (X), 0x84 (Y - vertical axis in NDS space), 0x88 (Z)
-        pos = (
-            int.from_bytes(mem[base_ptr + 0x80 : base_ptr + 0x84], 'little', signed=True),  # X: lateral
-            int.from_bytes(mem[base_ptr + 0x84 : base_ptr + 0x88], 'little', signed=True),  # Y: vertical (height)
-            int.from_bytes(mem[base_ptr + 0x88 : base_ptr + 0x8C], 'little', signed=True)   # Z: forward/depth
-        )
-        return speed, angle, checkpoint, lap, offroad, pos
+        # Guard: pointers valid only mid-race.  Re-resolve while any is null.
+        if not self._pointers_valid and not self._resolve_pointers():
+            if not (self._is_valid_pointer(self.kart_ptr) and self._is_valid_pointer(self.race_info_ptr)):
+                return 0.0, 0, 0, 0, 1.0, (0,0,0)
+
+        read_long = self._read_long
+        base_ptr, race_ptr = self.kart_ptr, self.race_info_ptr
+
+        # One decode per struct; fixed-point scaling (/4096) is applied by the
+        # schema.  offroad < 1.0 means grass/dirt; exactly 1.0 means tarmac.
+        # Position: X lateral, Y vertical (height), Z forward/depth.
+        speed, angle, offroad, pos_x, pos_y, pos_z = KART_STRUCT.read(read_long, base_ptr)
+        checkpoint, lap = RACE_INFO_STRUCT.read(read_long, race_ptr)  # u8s; checkpoint wraps at track end
+        return speed, angle, checkpoint, lap, offroad, (pos_x, pos_y, pos_z)
+
+    def _advance_frames(self):
+        """Runs ``frame_skip`` emulator cycles and captures the observation.
+
+        DeSmuME is told to skip rendering for every intermediate frame that
+        is never observed (``emu.skip_next_frame()``), so only the final
+        frame - or the final two when :attr:`max_pool` is set - pays for the
+        2-D/3-D GPU work.  With max-pooling the observation is the
+        pixel-wise maximum of the last two rendered frames (as in the Atari
+        DQN setup), which removes flicker from sprites drawn on alternating
+        frames.  The result is left in ``self._obs``.
+        """
+        frame_skip = self.frame_skip
+        prof = self._profiler
+        pool = self._pool_obs if frame_skip > 1 else None
+        n_rendered = 2 if pool is not None else 1
+        for i in range(frame_skip):
+            if i < frame_skip - n_rendered:
+                self.emu.skip_next_frame()
+            self.emu.cycle()
+            if pool is not None and i == frame_skip - 2:
+                if prof is not None:
+                    prof.lap(EMU_CYCLE)
+                self._render_obs()
+                np.copyto(pool, self._obs)
+                if prof is not None:
+                    prof.lap(GET_OBS)
+        if prof is not None:
+            prof.lap(EMU_CYCLE)
+        self._render_obs()
+        if pool is not None:
+            np.maximum(self._obs, pool, out=self._obs)
+        if prof is not None:
+            prof.lap(GET_OBS)
 
     def step(self, action):
-        """Executes one environment step (4 emulator cycles).
+        """Executes one environment step (``frame_skip`` emulator cycles).
 
-        Applies the selected action for 4 emulator cycles (~1/15 s at 60 fps),
+        Applies the selected action for ``frame_skip`` emulator cycles
+        (default 4, ~1/15 s at 60 fps),
         reads the resulting game state, evaluates all watchdog termination
         conditions in priority order, and computes the shaped reward.
 
@@ -242,8 +425,8 @@ class MKDSEnv(gym.Env):
                 info)`` where:
 
                 * **obs** (*np.ndarray*): Grayscale top-screen observation of
-                  shape ``(config.STATE_H, config.STATE_W, 1)``, dtype
-                  ``uint8``.
+                  shape ``(config.STATE_H, config.STATE_W, frame_stack)``,
+                  dtype ``uint8``.
                 * **reward** (*float*): Shaped scalar reward for this step.
                   Negative for terminal failure states, positive for progress.
                 * **terminated** (*bool*): ``True`` when a terminal condition
@@ -253,26 +436,47 @@ class MKDSEnv(gym.Env):
                   is reached (currently also sets ``terminated``).
                 * **info** (*dict*): Auxiliary diagnostic data with keys:
 
-                    - ``"telemetry"`` (*dict*): ``speed``, ``offroad``,
-                      ``pos_x``, ``pos_y``, ``pos_z``, ``action``.
-                    - ``"terminal_reason"`` (*str | None*): Human-readable
-                      label for the termination cause, or ``None`` if the
-                      episode is still running.
+                    - ``"telemetry"`` (*bytes*): One packed
+                      :data:`~env.telemetry.TELEMETRY_DTYPE` record with
+                      ``speed``, ``offroad``, ``pos_x/y/z``, ``action``,
+                      ``checkpoint``, ``lap``, ``race_time``, the
+                      termination ``reason`` code (``0`` while the episode
+                      is running) and ``reset_time_ms`` (latency of the
+                      reset that started this episode on its first step,
+                      NaN otherwise).  Decode a batch with
+                      :func:`~env.telemetry.records_from_infos`.
+                    - ``"episode_summary"`` (*bytes*): On the episode's
+                      final step only, one packed
+                      :data:`~env.telemetry.EPISODE_DTYPE` record (length,
+                      reward, mean speed, off-road fraction, checkpoints,
+                      lap, race time, reason, reset latency).
         """
+        # Optional per-component timing (see set_step_profiling).
+        prof = self._profiler
+        if prof is not None:
+            prof.start()
+
         # --- APPLY ACTION ---
         # Clear all keys first to avoid sticky inputs from the previous step
         self.emu.input.keypad_update(0)
         for key in self.action_map[action]:
             self.emu.input.keypad_add_key(key)
         # Step emulator and update window
-        for _ in range(4):  # 4 cycles = 1 rendered frame at full 60 fps
-            self.emu.cycle()   
+        self._advance_frames()
         if self.window is not None:
             self.window.draw()
+            if prof is not None:
+                prof.lap(WINDOW_DRAW)
 
-        obs = self._get_obs()
+        obs = self._observation()  # Frame filled in place by _advance_frames()
+        if prof is not None:
+            prof.lap(GET_OBS)
         speed, angle, cp, lap, offroad, pos = self._read_ram()
+        if prof is not None:
+            prof.lap(READ_RAM)
         current_time = self._read_race_time()
+        if prof is not None:
+            prof.lap(READ_RACE_TIME)
         
         terminated = False
         truncated = False
@@ -344,30 +548,73 @@ class MKDSEnv(gym.Env):
                 reason = "finished"
 
 
+        # Episode accumulators (cheap scalar updates; summarised on episode end)
+        self._ep_length += 1
+        self._ep_reward += reward
+        self._ep_speed_sum += speed
+        if offroad < 0.9:
+            self._ep_offroad_steps += 1
+        if cp > self.prev_checkpoint:
+            self._ep_checkpoints += 1
+
         # Update historical trackers for use in the next step's watchdog checks
         self.prev_checkpoint, self.prev_lap = cp, lap
         self.last_pos, self.prev_speed = pos, speed
         
+        # Telemetry as one packed fixed-layout record (see env/telemetry.py).
+        # The first step after a reset also carries that reset's latency, so
+        # it reaches callbacks through the ordinary step infos.
+        reset_ms = self._pending_reset_ms
+        self._pending_reset_ms = None
+        reason_code = REASON_CODES[reason] if terminated else 0
         info = {
-            "telemetry": {
-                "speed": speed,
-                "offroad": offroad,
-                "pos_x": pos[0],
-                "pos_y": pos[1],  # Vertical in DS space
-                "pos_z": pos[2],
-                "action": action
-            },
-            "terminal_reason": reason if terminated else None
+            "telemetry": pack_record(
+                speed, offroad, pos, action, cp, lap, current_time, reason_code,
+                np.nan if reset_ms is None else reset_ms,
+            )
         }
+        if terminated or truncated:
+            n = self._ep_length
+            info["episode_summary"] = EPISODE_STRUCT.pack(
+                n, self._ep_reward, self._ep_speed_sum / n, self._ep_offroad_steps / n,
+                self._ep_checkpoints, lap, max(current_time - self._ep_start_time, 0),
+                reason_code, self._ep_reset_ms,
+            )
+
+        if prof is not None:
+            prof.lap(WATCHDOGS)
+            prof.end_step()
 
         return obs, reward, terminated, truncated, info
 
+    def set_step_profiling(self, enabled, capacity=8192):
+        """Switches per-component step timing on or off.
+
+        Args:
+            enabled (bool): Start (``True``) or stop (``False``) recording.
+            capacity (int): Steps kept between two drains when enabling.
+        """
+        self._profiler = StepProfiler(capacity) if enabled else None
+
+    def drain_step_profile(self):
+        """Returns and clears the step timings recorded so far.
+
+        Returns:
+            np.ndarray | None: ``(n_steps, len(STEP_COMPONENTS))`` durations
+                in milliseconds (columns as in
+                :data:`env.step_profiler.STEP_COMPONENTS`), or ``None`` when
+                profiling is off.
+        """
+        return self._profiler.drain() if self._profiler is not None else None
+
     def reset(self, seed=None, options=None):
         """Resets the environment to the boot save state.
 
-        Loads the pre-saved emulator state from ``config.SAVE_FILE_NAME``
+        Restores the pre-saved emulator state from ``config.SAVE_FILE_NAME``
         (which should place the game at the race start line) and zeroes all
-        watchdog tracking variables so the new episode starts cleanly.
+        watchdog tracking variables so the new episode starts cleanly.  The
+        save state is held in memory by :attr:`boot_state`, so resets do not
+        touch the original file on disk.
 
         Args:
             seed (int | None): Optional RNG seed forwarded to the parent
@@ -381,18 +628,25 @@ class MKDSEnv(gym.Env):
             tuple: A 2-element tuple ``(obs, info)`` where:
 
                 * **obs** (*np.ndarray*): Initial grayscale observation of
-                  shape ``(config.STATE_H, config.STATE_W, 1)``, dtype
-                  ``uint8``, captured immediately after the save state loads.
-                * **info** (*dict*): Empty dict ``{}``; included to satisfy
-                  the Gymnasium API contract.
+                  shape ``(config.STATE_H, config.STATE_W, frame_stack)``,
+                  dtype ``uint8``, captured immediately after the save state
+                  loads.  Stacked frames before it are zero, as with
+                  ``VecFrameStack``.
+                * **info** (*dict*): ``{"reset_time_ms": float}`` - the
+                  save-state restore latency in milliseconds.
         """
         super().reset(seed=seed)
         # Reload the boot save state instead of closing/opening
         # This is much faster than a full emulator restart and avoids the
         # race-select menus that would otherwise need to be navigated.
-        if os.path.exists(config.SAVE_FILE_NAME):
-            self.emu.savestate.load_file(config.SAVE_FILE_NAME) 
-        
+        reset_ms = self.boot_state.restore()
+        self._pending_reset_ms = reset_ms
+        logger.debug(f"Boot state restored in {reset_ms:.2f} ms (pid {os.getpid()})")
+
+        # The save state may relocate the game structs: drop the cached
+        # pointers and resolve them once for the new episode.
+        self._resolve_pointers()
+
         # Reset counters and timers
         self.stuck_counter = 0
         self.prev_speed = 0.0
@@ -401,10 +655,26 @@ class MKDSEnv(gym.Env):
         # Initialise the CP timestamp to the current race time so the timeout
         # watchdog does not fire immediately on the first step.
         self.last_cp_time_stamp = self._read_race_time()
+
+        self._ep_length = 0
+        self._ep_reward = 0.0
+        self._ep_speed_sum = 0.0
+        self._ep_offroad_steps = 0
+        self._ep_checkpoints = 0
+        self._ep_start_time = self.last_cp_time_stamp
+        self._ep_reset_ms = reset_ms
+
+        # Empty frame stack: the first observation is zero-padded, matching
+        # what VecFrameStack produced for checkpoints trained with it.
+        if self._ring is not None:
+            self._ring.fill(0)
+            self._ring_pos = self.frame_stack - 1
         
-        return self._get_obs(), {}
+        return self._get_obs(), {"reset_time_ms": reset_ms}
 
     def close(self):
         """Cleanly destroys the emulator instance to release memory and resources."""
+        if hasattr(self, 'boot_state'):
+            self.boot_state.close()
         if hasattr(self, 'emu') and self.emu is not None:
             self.emu.destroy()
@@ -0,0 +1,376 @@
+"""Shared-memory vectorised environment for ``MKDSEnv``.
+
+:class:`SharedMemoryVecEnv` is a drop-in replacement for SB3's
+``SubprocVecEnv``: one emulator per worker process, the same VecEnv API, and
+the same ``info`` dicts on the training side.  The difference is the data
+path.  ``SubprocVecEnv`` pickles every observation plus the step info
+through a pipe on every step; here workers write observations, rewards, done
+flags and the packed telemetry record (``info["telemetry"]``, see
+:data:`env.telemetry.TELEMETRY_DTYPE`) straight into
+``multiprocessing.shared_memory`` arrays, and only tiny control messages
+(``("step", None)`` and a ``None`` acknowledgement) go over the pipes.
+
+Layout of the shared arrays (``n`` = number of envs)::
+
+    actions        (n,)              written by the parent before each step
+    obs            (n, *obs_shape)   current observation (post auto-reset)
+    terminal_obs   (n, *obs_shape)   last observation of an episode that just ended
+    rewards        (n,)  float64
+    terminated     (n,)  bool
+    truncated      (n,)  bool
+    telemetry      (n,)  TELEMETRY_DTYPE
+"""
+
+import os
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper, VecEnv
+from stable_baselines3.common.vec_env.patch_gym import _patch_env
+from env.telemetry import TELEMETRY_DTYPE
+from env.worker_startup import resolve_start_method, after_fork
+
+
+class _SharedArrays:
+    """A named set of NumPy arrays backed by ``SharedMemory`` blocks.
+
+    The parent creates the blocks with :meth:`create` and sends :attr:`spec`
+    (names, shapes and dtypes only) to each worker, which maps the same
+    memory with :meth:`attach`.
+    """
+
+    def __init__(self, spec, create):
+        self.spec = spec
+        self._blocks = []
+        self._owner = create
+        for name, shape, dtype, shm_name in spec:
+            nbytes = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+            if create:
+                block = shared_memory.SharedMemory(create=True, size=nbytes)
+            else:
+                block = shared_memory.SharedMemory(name=shm_name)
+            self._blocks.append(block)
+            setattr(self, name, np.ndarray(shape, dtype=dtype, buffer=block.buf))
+        if create:
+            # Record the OS-assigned block names so workers can attach.
+            self.spec = [(name, shape, dtype, block.name)
+                         for (name, shape, dtype, _), block in zip(spec, self._blocks)]
+
+    @classmethod
+    def create(cls, n_envs, observation_space, action_space):
+        """Allocates the arrays for ``n_envs`` environments."""
+        obs_shape = (n_envs,) + tuple(observation_space.shape)
+        act_shape = (n_envs,) + tuple(action_space.shape)
+        spec = [
+            ("actions", act_shape, np.dtype(action_space.dtype), None),
+            ("obs", obs_shape, np.dtype(observation_space.dtype), None),
+            ("terminal_obs", obs_shape, np.dtype(observation_space.dtype), None),
+            ("rewards", (n_envs,), np.dtype(np.float64), None),
+            ("terminated", (n_envs,), np.dtype(np.bool_), None),
+            ("truncated", (n_envs,), np.dtype(np.bool_), None),
+            ("telemetry", (n_envs,), TELEMETRY_DTYPE, None),
+        ]
+        return cls(spec, create=True)
+
+    @classmethod
+    def attach(cls, spec):
+        """Maps arrays previously created by another process."""
+        return cls(spec, create=False)
+
+    def close(self):
+        """Releases the mappings and, in the owning process, the blocks."""
+        for name, *_ in self.spec:
+            if hasattr(self, name):
+                delattr(self, name)  # Drop array views before closing buffers
+        for block in self._blocks:
+            block.close()
+            if self._owner:
+                try:
+                    block.unlink()
+                except FileNotFoundError:
+                    pass
+        self._blocks = []
+
+
+def _worker(index, remote, parent_remote, env_fn_wrapper, env=None):
+    """Worker loop: steps one env and publishes results via shared memory.
+
+    Mirrors SB3's ``SubprocVecEnv`` worker (including auto-reset on episode
+    end), but results are written to the shared arrays.  The pipe only
+    carries commands and a ``None`` acknowledgement, plus any info keys
+    other than ``"telemetry"`` (normally only ``"episode_summary"``, once per
+    episode).
+
+    ``env`` is passed instead of ``env_fn_wrapper`` by workers forked from
+    the zygote, which inherit an env that is already built.
+    """
+    # Import here to avoid a circular import
+    from stable_baselines3.common.env_util import is_wrapped
+
+    if parent_remote is not None:
+        parent_remote.close()
+    if env is None:
+        env = _patch_env(env_fn_wrapper.var())
+    arrays = None
+    telemetry_bytes = None  # (n_envs, itemsize) byte view of arrays.telemetry
+    while True:
+        try:
+            cmd, data = remote.recv()
+            if cmd == "step":
+                action = arrays.actions[index]
+                if action.ndim == 0:
+                    action = action.item()
+                observation, reward, terminated, truncated, info = env.step(action)
+                if terminated or truncated:
+                    # Save the final observation where the parent can read it, then reset
+                    arrays.terminal_obs[index] = observation
+                    observation, _ = env.reset()
+                arrays.obs[index] = observation
+                arrays.rewards[index] = reward
+                arrays.terminated[index] = terminated
+                arrays.truncated[index] = truncated
+                telemetry_bytes[index] = np.frombuffer(info["telemetry"], dtype=np.uint8)
+                extra = {k: v for k, v in info.items() if k != "telemetry"}
+                remote.send(extra or None)
+            elif cmd == "reset":
+                maybe_options = {"options": data[1]} if data[1] else {}
+                observation, reset_info = env.reset(seed=data[0], **maybe_options)
+                arrays.obs[index] = observation
+                remote.send(reset_info)
+            elif cmd == "attach":
+                arrays = _SharedArrays.attach(data)
+                telemetry_bytes = arrays.telemetry.view(np.uint8).reshape(len(arrays.telemetry), -1)
+                remote.send(True)
+            elif cmd == "close":
+                env.close()
+                if arrays is not None:
+                    telemetry_bytes = None
+                    arrays.close()
+                remote.close()
+                break
+            elif cmd == "get_spaces":
+                remote.send((env.observation_space, env.action_space))
+            elif cmd == "env_method":
+                method = env.get_wrapper_attr(data[0])
+                remote.send(method(*data[1], **data[2]))
+            elif cmd == "get_attr":
+                remote.send(env.get_wrapper_attr(data))
+            elif cmd == "has_attr":
+                try:
+                    env.get_wrapper_attr(data)
+                    remote.send(True)
+                except AttributeError:
+                    remote.send(False)
+            elif cmd == "set_attr":
+                remote.send(setattr(env, data[0], data[1]))
+            elif cmd == "is_wrapped":
+                remote.send(is_wrapped(env, data))
+            else:
+                raise NotImplementedError(f"`{cmd}` is not implemented in the worker")
+        except EOFError:
+            break
+        except KeyboardInterrupt:
+            break
+
+
+def _zygote(work_remotes, env_fn_wrapper):
+    """Builds one env, then forks a ready worker per pipe from it.
+
+    Runs in its own clean process (see ``"zygote"`` in
+    ``env/worker_startup.py``).  The emulator is booted and reset once here;
+    every forked child inherits that state, takes its own pipe and runs
+    :func:`_worker`.  The zygote then only waits for its children.
+    """
+    env = _patch_env(env_fn_wrapper.var())
+    env.reset()
+    pids = []
+    for index, remote in enumerate(work_remotes):
+        pid = os.fork()
+        if pid == 0:
+            # Child: keep only this worker's pipe end.
+            for other_index, other in enumerate(work_remotes):
+                if other_index != index:
+                    other.close()
+            after_fork(env)
+            try:
+                _worker(index, remote, None, None, env=env)
+            finally:
+                os._exit(0)
+        pids.append(pid)
+
+    for remote in work_remotes:
+        remote.close()
+    for pid in pids:
+        os.waitpid(pid, 0)
+    env.close()
+
+
+class SharedMemoryVecEnv(VecEnv):
+    """Multiprocess VecEnv that exchanges step data through shared memory.
+
+    Usable anywhere ``SubprocVecEnv`` is (``train()``, ``demo.py``, under
+    ``VecFrameStack``).  The SB3-facing ``infos`` are rebuilt in the parent
+    from the shared telemetry records, so callbacks see the same packed
+    ``info["telemetry"]`` bytes ``MKDSEnv.step`` produced; the whole batch is
+    also available as :attr:`telemetry` for consumers that can use the
+    shared array directly.
+
+    Args:
+        env_fns (list[Callable[[], gym.Env]]): Environment factories, one per
+            worker process.
+        start_method (str | None): Worker start method, see
+            :func:`env.worker_startup.resolve_start_method`.  Defaults to
+            ``'forkserver'`` (with preloaded modules) where available, else
+            ``'spawn'``.  ``'zygote'`` builds the env once and forks every
+            worker from it; all ``env_fns`` must then be equivalent, since
+            only ``env_fns[0]`` is called.
+
+    Attributes:
+        telemetry (np.ndarray): ``(n_envs,)`` array of
+            :data:`~env.telemetry.TELEMETRY_DTYPE` for the latest step.
+            Shared memory - overwritten on every step.
+    """
+
+    def __init__(self, env_fns, start_method=None):
+        self.waiting = False
+        self.closed = False
+        n_envs = len(env_fns)
+
+        self.start_method = resolve_start_method(start_method)
+        if self.start_method == "zygote":
+            # The zygote itself is started from a clean (non-forked) process.
+            ctx = mp.get_context(resolve_start_method("forkserver"))
+        else:
+            ctx = mp.get_context(self.start_method)
+
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(n_envs)])
+        self.processes = []
+        if self.start_method == "zygote":
+            args = (self.work_remotes, CloudpickleWrapper(env_fns[0]))
+            process = ctx.Process(target=_zygote, args=args, daemon=True)
+            process.start()
+            self.processes.append(process)
+            for work_remote in self.work_remotes:
+                work_remote.close()
+        else:
+            for index, (work_remote, remote, env_fn) in enumerate(zip(self.work_remotes, self.remotes, env_fns)):
+                args = (index, work_remote, remote, CloudpickleWrapper(env_fn))
+                # daemon=True: if the main process crashes, we should not cause things to hang
+                process = ctx.Process(target=_worker, args=args, daemon=True)
+                process.start()
+                self.processes.append(process)
+                work_remote.close()
+
+        self.remotes[0].send(("get_spaces", None))
+        observation_space, action_space = self.remotes[0].recv()
+        super().__init__(n_envs, observation_space, action_space)
+
+        # Allocate the shared arrays once the spaces are known, then let every
+        # worker map them.  Only the block names travel over the pipes.
+        self._arrays = _SharedArrays.create(n_envs, observation_space, action_space)
+        for remote in self.remotes:
+            remote.send(("attach", self._arrays.spec))
+        for remote in self.remotes:
+            remote.recv()
+
+    @property
+    def telemetry(self):
+        return self._arrays.telemetry
+
+    def step_async(self, actions):
+        self._arrays.actions[:] = np.asarray(actions).reshape(self._arrays.actions.shape)
+        for remote in self.remotes:
+            remote.send(("step", None))
+        self.waiting = True
+
+    def step_wait(self):
+        extras = [remote.recv() for remote in self.remotes]
+        self.waiting = False
+        arrays = self._arrays
+
+        # Copy out of shared memory: SB3 keeps references to the returned
+        # arrays (e.g. DQN's _last_obs) across the next step.
+        obs = arrays.obs.copy()
+        rewards = arrays.rewards.copy()
+        dones = arrays.terminated | arrays.truncated
+
+        infos = [self._result_info(i, extras[i]) for i in range(self.num_envs)]
+        for i in np.flatnonzero(dones):
+            infos[i]["terminal_observation"] = arrays.terminal_obs[i].copy()
+        self.reset_infos = [{} for _ in range(self.num_envs)]
+        return obs, rewards, dones, infos
+
+    def _result_info(self, index, extra):
+        """Rebuilds the step info dict of worker ``index`` from shared memory.
+
+        ``terminal_observation`` is left to the caller, which decides how the
+        terminal frame is presented.
+        """
+        arrays = self._arrays
+        info = {"telemetry": arrays.telemetry[index].tobytes()}
+        if extra:
+            info.update(extra)
+        if arrays.terminated[index] or arrays.truncated[index]:
+            info["TimeLimit.truncated"] = bool(arrays.truncated[index] and not arrays.terminated[index])
+        return info
+
+    def reset(self):
+        for env_idx, remote in enumerate(self.remotes):
+            remote.send(("reset", (self._seeds[env_idx], self._options[env_idx])))
+        self.reset_infos = [remote.recv() for remote in self.remotes]
+        # Seeds and options are only used once
+        self._reset_seeds()
+        self._reset_options()
+        return self._arrays.obs.copy()
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            remote.send(("close", None))
+        for process in self.processes:
+            process.join()
+        self._arrays.close()
+        self.closed = True
+
+    def get_images(self):
+        # Rendering goes through MKDSEnv's own SDL window (visualize=True).
+        return [None for _ in self.remotes]
+
+    def has_attr(self, attr_name):
+        target_remotes = self._get_target_remotes(indices=None)
+        for remote in target_remotes:
+            remote.send(("has_attr", attr_name))
+        return all([remote.recv() for remote in target_remotes])
+
+    def get_attr(self, attr_name, indices=None):
+        target_remotes = self._get_target_remotes(indices)
+        for remote in target_remotes:
+            remote.send(("get_attr", attr_name))
+        return [remote.recv() for remote in target_remotes]
+
+    def set_attr(self, attr_name, value, indices=None):
+        target_remotes = self._get_target_remotes(indices)
+        for remote in target_remotes:
+            remote.send(("set_attr", (attr_name, value)))
+        for remote in target_remotes:
+            remote.recv()
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        target_remotes = self._get_target_remotes(indices)
+        for remote in target_remotes:
+            remote.send(("env_method", (method_name, method_args, method_kwargs)))
+        return [remote.recv() for remote in target_remotes]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        target_remotes = self._get_target_remotes(indices)
+        for remote in target_remotes:
+            remote.send(("is_wrapped", wrapper_class))
+        return [remote.recv() for remote in target_remotes]
+
+    def _get_target_remotes(self, indices):
+        indices = self._get_indices(indices)
+        return [self.remotes[i] for i in indices]
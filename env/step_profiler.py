@@ -0,0 +1,95 @@
+"""Low-overhead per-component timing of ``MKDSEnv.step``.
+
+:class:`StepProfiler` splits every step into the components below and keeps
+one row of durations per step in a preallocated ring buffer.  It is switched
+on per env with ``MKDSEnv.set_step_profiling(True)``.  While it is off,
+``step`` pays a single ``is None`` check; while it is on, a
+``time.perf_counter()`` call and a float add per component.
+
+The rows are collected with ``MKDSEnv.drain_step_profile()``, normally
+through ``VecEnv.env_method`` by
+:class:`~src.utils.callbacks.StepProfilerCallback`, which aggregates them
+across workers and logs percentiles to TensorBoard.
+"""
+
+import time
+import numpy as np
+
+# Component columns, in the order they occur within a step.
+STEP_COMPONENTS = (
+    "emu_cycle",       # emu.cycle() for every skipped and rendered frame
+    "get_obs",         # Framebuffer export, grayscale, resize, frame stack
+    "window_draw",     # SDL window refresh (visualize=True only)
+    "read_ram",        # Kart / race-info struct decode (_read_ram)
+    "read_race_time",  # Race timer decode (_read_race_time)
+    "watchdogs",       # Termination checks, reward shaping and info dict
+    "total",           # Whole step, including untimed glue
+)
+EMU_CYCLE, GET_OBS, WINDOW_DRAW, READ_RAM, READ_RACE_TIME, WATCHDOGS, TOTAL = range(len(STEP_COMPONENTS))
+
+
+class StepProfiler:
+    """Accumulates per-component step durations into a ring buffer.
+
+    Usage inside a step::
+
+        prof.start()
+        ...                     # work for component A
+        prof.lap(A)             # time since the previous mark goes to A
+        ...
+        prof.end_step()         # stores the row (plus TOTAL)
+
+    ``lap`` may be called several times for the same component within one
+    step; the durations add up.
+
+    Args:
+        capacity (int): Steps kept between two :meth:`drain` calls.  Older
+            rows are overwritten once the buffer is full.
+
+    Attributes:
+        dropped (int): Rows overwritten before being drained.
+    """
+
+    def __init__(self, capacity=8192):
+        self._samples = np.zeros((capacity, len(STEP_COMPONENTS)), dtype=np.float64)
+        self._capacity = capacity
+        self._count = 0
+        self._acc = [0.0] * len(STEP_COMPONENTS)
+        self._step_start = 0.0
+        self._mark = 0.0
+        self.dropped = 0
+
+    def start(self):
+        """Begins timing a new step."""
+        acc = self._acc
+        for i in range(len(acc)):
+            acc[i] = 0.0
+        self._step_start = self._mark = time.perf_counter()
+
+    def lap(self, component):
+        """Charges the time since the previous mark to ``component``."""
+        now = time.perf_counter()
+        self._acc[component] += now - self._mark
+        self._mark = now
+
+    def end_step(self):
+        """Stores the current step's row, in milliseconds."""
+        self._acc[TOTAL] = time.perf_counter() - self._step_start
+        if self._count >= self._capacity:
+            self.dropped += 1
+        self._samples[self._count % self._capacity] = self._acc
+        self._count += 1
+
+    def drain(self):
+        """Returns the recorded rows and clears the buffer.
+
+        Returns:
+            np.ndarray: ``(n_steps, len(STEP_COMPONENTS))`` durations in
+                milliseconds, oldest first.
+        """
+        n = min(self._count, self._capacity)
+        start = self._count % self._capacity if self._count > self._capacity else 0
+        rows = np.roll(self._samples[:n], -start, axis=0) * 1000.0
+        self._count = 0
+        self.dropped = 0
+        return rows
@@ -0,0 +1,154 @@
+"""Fixed-layout telemetry record shared by the environment and its VecEnvs.
+
+``MKDSEnv.step`` reports per-step telemetry as one fixed NumPy structured
+record (:data:`TELEMETRY_DTYPE`), with the terminal reason encoded as a small
+integer (:class:`TerminalReason`).  The record travels in the step info as
+its raw bytes, ``info["telemetry"]``.  Pickling one short ``bytes`` object
+is more than ten times cheaper than pickling the nested dict the env used
+to build, and a whole batch of infos decodes into one array with
+:func:`records_from_infos`, so consumers work column-wise instead of field
+by field per env.
+
+Episode-level metrics (length, reward, mean speed, time off-road,
+checkpoints, lap, termination reason) are accumulated by the env itself and
+emitted once per episode as an :data:`EPISODE_DTYPE` record in
+``info["episode_summary"]``; see :func:`episodes_from_infos`.
+"""
+
+import struct
+from enum import IntEnum
+import numpy as np
+
+
+class TerminalReason(IntEnum):
+    """Episode termination cause, stored as a ``uint8`` in telemetry records.
+
+    ``NONE`` marks a step on which the episode did not end.  The labels
+    match the ``reason`` strings produced by ``MKDSEnv.step``.
+    """
+    NONE = 0
+    BACKWARD = 1
+    TIMEOUT = 2
+    COLLISION = 3
+    STUCK = 4
+    FINISHED = 5
+
+    @property
+    def label(self):
+        """str: The human-readable reason, or ``""`` for :attr:`NONE`."""
+        return "" if self is TerminalReason.NONE else self.name.lower()
+
+    @classmethod
+    def from_label(cls, label):
+        """Maps a reason string (or ``None``) to its enum member."""
+        if not label:
+            return cls.NONE
+        return cls[label.upper()]
+
+
+# Per-step telemetry for one environment.  ``race_time`` is the internal race
+# timer in ticks (60 per second).  ``reset_time_ms`` is NaN except on the first
+# step of an episode (see MKDSEnv.reset).
+TELEMETRY_DTYPE = np.dtype([
+    ("speed", "<f8"),
+    ("offroad", "<f8"),
+    ("pos_x", "<i4"),
+    ("pos_y", "<i4"),
+    ("pos_z", "<i4"),
+    ("action", "<i2"),
+    ("checkpoint", "u1"),
+    ("lap", "u1"),
+    ("race_time", "<u4"),
+    ("reason", "u1"),
+    ("reset_time_ms", "<f8"),
+])
+
+# Packs one record straight to bytes, field for field in TELEMETRY_DTYPE
+# order.  Both layouts are packed (no padding), so the bytes are exactly one
+# TELEMETRY_DTYPE element.
+TELEMETRY_STRUCT = struct.Struct("<ddiiihBBIBd")
+assert TELEMETRY_STRUCT.size == TELEMETRY_DTYPE.itemsize
+
+# Reason label of every TerminalReason code, for vectorised decoding
+# (``REASON_LABELS[records["reason"]]``).
+REASON_LABELS = np.array([reason.label for reason in TerminalReason])
+
+# Reason string produced by MKDSEnv.step -> code, without the enum lookup.
+REASON_CODES = {reason.label: int(reason) for reason in TerminalReason if reason}
+
+
+def pack_record(speed, offroad, pos, action, checkpoint, lap, race_time, reason=0, reset_time_ms=np.nan):
+    """Packs one step's telemetry into ``info["telemetry"]`` bytes.
+
+    Args:
+        speed (float): Kart speed (fixed-point scaled).
+        offroad (float): Surface factor (fixed-point scaled).
+        pos (tuple[int, int, int]): World-space ``(X, Y, Z)``.
+        action (int): Action index applied on this step.
+        checkpoint (int): Checkpoint index.
+        lap (int): Lap number.
+        race_time (int): Race timer in ticks.
+        reason (int): :class:`TerminalReason` code, ``0`` mid-episode.
+        reset_time_ms (float): Reset latency, NaN unless this is the
+            episode's first step.
+
+    Returns:
+        bytes: One :data:`TELEMETRY_DTYPE` element.
+    """
+    return TELEMETRY_STRUCT.pack(speed, offroad, pos[0], pos[1], pos[2], action,
+                                 checkpoint, lap, race_time, reason, reset_time_ms)
+
+
+def records_from_infos(infos):
+    """Decodes the telemetry of a batch of step infos in one call.
+
+    Args:
+        infos (list[dict]): Step infos, each carrying packed
+            ``"telemetry"`` bytes from :func:`pack_record`.
+
+    Returns:
+        np.ndarray: ``(len(infos),)`` array of :data:`TELEMETRY_DTYPE`.
+    """
+    return np.frombuffer(b"".join([info["telemetry"] for info in infos]), dtype=TELEMETRY_DTYPE)
+
+
+# Per-episode summary, accumulated by MKDSEnv over an episode and emitted
+# once, in the info of its final step (``info["episode_summary"]``).
+# ``checkpoints`` counts checkpoint advances, ``lap`` is the lap at the end,
+# ``race_time`` the race-timer ticks elapsed since the reset, and
+# ``reset_time_ms`` the latency of the reset that started the episode.
+EPISODE_DTYPE = np.dtype([
+    ("length", "<u4"),
+    ("reward", "<f8"),
+    ("mean_speed", "<f8"),
+    ("offroad_fraction", "<f8"),
+    ("checkpoints", "<u4"),
+    ("lap", "u1"),
+    ("race_time", "<u4"),
+    ("reason", "u1"),
+    ("reset_time_ms", "<f8"),
+])
+
+EPISODE_STRUCT = struct.Struct("<IdddIBIBd")
+assert EPISODE_STRUCT.size == EPISODE_DTYPE.itemsize
+
+
+def episodes_from_infos(infos, dones):
+    """Decodes the episode summaries of a batch of step infos.
+
+    Only rows flagged in ``dones`` are inspected, so steps without an
+    episode end cost one vectorised check.
+
+    Args:
+        infos (list[dict]): Step infos; finished episodes carry packed
+            ``"episode_summary"`` bytes.
+        dones (np.ndarray): Per-row done flags of the same step.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Row indices into ``infos`` and the
+            matching ``(n,)`` array of :data:`EPISODE_DTYPE` (both empty
+            when no episode ended).
+    """
+    rows = [row for row in np.flatnonzero(dones) if "episode_summary" in infos[row]]
+    blob = b"".join([infos[row]["episode_summary"] for row in rows])
+    return np.asarray(rows, dtype=np.intp), np.frombuffer(blob, dtype=EPISODE_DTYPE)
@@ -0,0 +1,132 @@
+"""Worker process start-up for the multiprocess VecEnvs.
+
+Starting an emulator worker is expensive.  The process imports the full
+stack (NumPy, OpenCV, Gymnasium, py-desmume and SB3's VecEnv code), then
+``MKDSEnv.__init__`` boots DeSmuME, loads the ROM and reads the boot save
+state.  With 16 workers this happens 16 times on every launch and every
+resume.  This module selects how workers are started:
+
+``"forkserver"`` (default where available)
+    Workers are forked from a fork server that has already imported
+    :data:`FORKSERVER_PRELOAD`, so each worker skips those imports.  The
+    fork server itself is a clean process, not the trainer (which holds
+    CUDA and thread state that must not be forked).
+``"zygote"`` (POSIX only, ``SharedMemoryVecEnv`` and its async variant)
+    A single clean process builds one env (emulator booted, ROM and save
+    state loaded, first ``reset()`` done) and then ``os.fork()``s every
+    worker from that ready state.  This relies on DeSmuME tolerating a fork
+    of an initialised, headless core.  The core is single-threaded without
+    an SDL window, but treat the mode as opt-in and compare behaviour
+    against ``"forkserver"`` before relying on it.
+``"spawn"`` / ``"fork"``
+    Plain ``multiprocessing`` start methods.
+
+Every ``MKDSEnv`` records :attr:`~env.mkds_gym_env.MKDSEnv.startup_stats`,
+and :func:`log_worker_startup` logs them per worker after the VecEnv is up.
+"""
+
+import os
+import time
+import logging
+import multiprocessing as mp
+
+logger = logging.getLogger(__name__)
+
+# Modules imported once by the fork server and inherited by every worker.
+FORKSERVER_PRELOAD = [
+    "numpy",
+    "cv2",
+    "gymnasium",
+    "desmume.emulator",
+    "stable_baselines3.common.vec_env",
+    "env.mkds_gym_env",
+    "env.shared_memory_vec_env",
+]
+
+START_METHODS = ("forkserver", "spawn", "fork", "zygote")
+
+
+def resolve_start_method(method=None):
+    """Maps a configured start method onto one usable on this platform.
+
+    ``"forkserver"`` gets :data:`FORKSERVER_PRELOAD` installed.  Methods
+    that are unavailable (``forkserver``/``fork``/``zygote`` on Windows) fall
+    back to ``"spawn"`` with a warning.
+
+    Args:
+        method (str | None): One of :data:`START_METHODS`.  ``None`` means
+            ``"forkserver"``.
+
+    Returns:
+        str: The method to use.
+
+    Raises:
+        ValueError: If ``method`` is not a known start method.
+    """
+    method = method or "forkserver"
+    if method not in START_METHODS:
+        raise ValueError(f"Unknown start method '{method}' (expected one of {', '.join(START_METHODS)})")
+
+    available = mp.get_all_start_methods()
+    if method == "zygote":
+        if hasattr(os, "fork"):
+            return method
+    elif method in available:
+        if method == "forkserver":
+            # Only takes effect before the fork server first starts.
+            mp.get_context("forkserver").set_forkserver_preload(FORKSERVER_PRELOAD)
+        return method
+
+    logger.warning(f"Start method '{method}' is not available on this platform; using 'spawn'.")
+    return "spawn"
+
+
+def after_fork(env):
+    """Prepares an env inherited through ``os.fork()`` for use in the child.
+
+    The child gets its own boot save-state copy (the parent deletes its copy
+    on close) and fresh :attr:`startup_stats`.
+
+    Args:
+        env (gym.Env): The (possibly wrapped) env built before the fork.
+    """
+    start = time.perf_counter()
+    base = env.unwrapped
+    boot_state = getattr(base, "boot_state", None)
+    if boot_state is not None:
+        boot_state.make_private_copy()
+    if hasattr(base, "startup_stats"):
+        base.startup_stats = {
+            "pid": os.getpid(),
+            "init_ms": (time.perf_counter() - start) * 1000.0,
+            "ready_time": time.time(),
+            "forked": True,
+        }
+
+
+def log_worker_startup(env, launch_time, start_method):
+    """Logs per-worker start-up times of a freshly created VecEnv.
+
+    Blocks until every worker has finished building its env (``get_attr``
+    goes through each worker's pipe).
+
+    Args:
+        env (VecEnv): The VecEnv (wrappers are fine) whose workers report
+            ``startup_stats``.
+        launch_time (float): ``time.time()`` just before the VecEnv was
+            constructed.
+        start_method (str): Start method used, for the log line.
+
+    Returns:
+        list[dict]: The per-worker stats, each extended with
+            ``launch_to_ready_ms``.
+    """
+    stats = env.get_attr("startup_stats")
+    for i, s in enumerate(stats):
+        s["launch_to_ready_ms"] = (s["ready_time"] - launch_time) * 1000.0
+        origin = "forked, post-fork setup" if s.get("forked") else "emulator init"
+        logger.info(f"Worker {i} (pid {s['pid']}): ready {s['launch_to_ready_ms']:.0f} ms after launch "
+                    f"({origin} {s['init_ms']:.0f} ms)")
+    total = (time.time() - launch_time) * 1000.0
+    logger.info(f"{len(stats)} worker(s) ready in {total:.0f} ms (start method: {start_method})")
+    return stats
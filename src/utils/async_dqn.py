@@ -0,0 +1,158 @@
+"""DQN collector for asynchronous partial-batch environments.
+
+:class:`AsyncDQN` is Stable-Baselines3's DQN with a rollout collector that
+understands :class:`~env.async_vec_env.AsyncSharedMemoryVecEnv`.  Each batch
+returned by that env may contain different workers than the batch the last
+actions were sent to, so transitions cannot be formed row by row as in
+``OffPolicyAlgorithm.collect_rollouts``.  Instead, the observation and action
+sent to each worker are remembered until that worker is returned again, and
+only then is the transition completed.  Completed transitions are staged and
+written to the replay buffer ``num_envs`` at a time, the row shape the buffer
+was allocated with.
+
+Everything else (network, exploration schedule, target updates, ``train()``,
+saving and loading) is inherited unchanged.  Models saved by ``AsyncDQN`` load
+with ``DQN.load`` (e.g. in ``demo.py``) and vice versa.
+"""
+
+import numpy as np
+from stable_baselines3 import DQN
+from stable_baselines3.common.type_aliases import RolloutReturn, TrainFrequencyUnit
+from stable_baselines3.common.utils import should_collect_more_steps
+
+
+class AsyncDQN(DQN):
+    """DQN that collects experience from an asynchronous partial-batch VecEnv.
+
+    The environment must expose ``env_ids`` (worker id of each row of the
+    latest batch) and ``num_workers``, as
+    :class:`~env.async_vec_env.AsyncSharedMemoryVecEnv` does.  Callbacks see
+    ``infos``, ``rewards`` and ``dones`` restricted to the completed
+    transitions of each step, so per-step loggers such as
+    :class:`~src.utils.callbacks.MKDSMetricsCallback` work unchanged.
+    """
+
+    def _setup_learn(self, total_timesteps, callback=None, reset_num_timesteps=True,
+                     tb_log_name="run", progress_bar=False):
+        # The base class resets the env in these cases; pending actions sent
+        # before that reset can no longer complete.
+        if self.optimize_memory_usage:
+            # That buffer reads next_obs from the following row of the same
+            # column, which async batches do not preserve.
+            raise ValueError("AsyncDQN does not support optimize_memory_usage=True")
+        env_reset = reset_num_timesteps or self._last_obs is None
+        result = super()._setup_learn(total_timesteps, callback, reset_num_timesteps, tb_log_name, progress_bar)
+        if env_reset or getattr(self, "_pending_obs", None) is None:
+            self._init_pending(self.env.num_workers)
+        return result
+
+    def _init_pending(self, num_workers):
+        """Allocates the per-worker pending observation/action tables."""
+        obs_shape = self.observation_space.shape
+        self._pending_obs = np.zeros((num_workers,) + obs_shape, dtype=self.observation_space.dtype)
+        self._pending_actions = np.zeros((num_workers,) + self.action_space.shape, dtype=self.action_space.dtype)
+        self._has_pending = np.zeros(num_workers, dtype=bool)
+        self._staged = []
+
+    def _excluded_save_params(self):
+        return super()._excluded_save_params() + ["_pending_obs", "_pending_actions", "_has_pending", "_staged"]
+
+    def collect_rollouts(
+        self,
+        env,
+        callback,
+        train_freq,
+        replay_buffer,
+        action_noise=None,
+        learning_starts=0,
+        log_interval=None,
+    ):
+        """Collects experience from an async VecEnv into the replay buffer.
+
+        Same contract as ``OffPolicyAlgorithm.collect_rollouts``; one
+        "step" is one ``env.step`` of ``num_envs`` rows, and
+        ``num_timesteps`` advances by the number of completed transitions.
+        """
+        # Switch to eval mode (this affects batch norm / dropout)
+        self.policy.set_training_mode(False)
+
+        num_collected_steps, num_collected_episodes = 0, 0
+        assert train_freq.unit == TrainFrequencyUnit.STEP, "AsyncDQN only supports step-based train_freq."
+
+        callback.on_rollout_start()
+        continue_training = True
+        while should_collect_more_steps(train_freq, num_collected_steps, num_collected_episodes):
+            actions, buffer_actions = self._sample_action(learning_starts, action_noise, env.num_envs)
+
+            # Remember what each worker of this batch is acting on; its
+            # transition completes whenever that worker is returned again.
+            sent_ids = env.env_ids
+            self._pending_obs[sent_ids] = self._last_obs
+            self._pending_actions[sent_ids] = buffer_actions
+            self._has_pending[sent_ids] = True
+
+            batch_obs, batch_rewards, batch_dones, batch_infos = env.step(actions)
+            env_ids = env.env_ids
+
+            # Rows without a pending action are first observations queued by
+            # reset(), not transitions.
+            completed = self._has_pending[env_ids]
+            rows = np.flatnonzero(completed)
+            rewards, dones = batch_rewards[rows], batch_dones[rows]
+            infos = [batch_infos[row] for row in rows]
+
+            self.num_timesteps += len(rows)
+            num_collected_steps += 1
+
+            # Give access to local variables
+            callback.update_locals(locals())
+            # Only stop training if return value is False, not when it is None.
+            if not callback.on_step():
+                return RolloutReturn(num_collected_steps * env.num_envs, num_collected_episodes, continue_training=False)
+
+            # Retrieve reward and episode length if using Monitor wrapper
+            self._update_info_buffer(infos, dones)
+
+            self._stage_transitions(replay_buffer, env_ids[rows], batch_obs[rows], rewards, dones, infos)
+            self._has_pending[env_ids] = False
+            self._last_obs = batch_obs
+
+            self._update_current_progress_remaining(self.num_timesteps, self._total_timesteps)
+
+            # Target network update and exploration schedule
+            self._on_step()
+
+            for done in dones:
+                if done:
+                    num_collected_episodes += 1
+                    self._episode_num += 1
+                    if log_interval is not None and self._episode_num % log_interval == 0:
+                        self.dump_logs()
+
+        callback.on_rollout_end()
+
+        return RolloutReturn(num_collected_steps * env.num_envs, num_collected_episodes, continue_training)
+
+    def _stage_transitions(self, replay_buffer, worker_ids, next_obs, rewards, dones, infos):
+        """Completes transitions for ``worker_ids`` and flushes full rows.
+
+        The replay buffer stores ``next_obs`` explicitly, so the column a
+        transition lands in does not need to match the worker it came from.
+        """
+        for k, i in enumerate(worker_ids):
+            next_ob = infos[k]["terminal_observation"] if dones[k] else next_obs[k]
+            self._staged.append((self._pending_obs[i].copy(), next_ob, self._pending_actions[i].copy(),
+                                 rewards[k], dones[k], infos[k]))
+
+        n = self.n_envs
+        while len(self._staged) >= n:
+            chunk, self._staged = self._staged[:n], self._staged[n:]
+            obs, next_obs_, actions, rewards_, dones_, infos_ = zip(*chunk)
+            replay_buffer.add(
+                np.stack(obs),
+                np.stack(next_obs_),
+                np.stack(actions),
+                np.array(rewards_),
+                np.array(dones_),
+                list(infos_),
+            )
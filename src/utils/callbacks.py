@@ -3,71 +3,192 @@
 This module provides :class:`MKDSMetricsCallback`, a training callback that
 captures per-step race telemetry (speed, off-road flag, position, chosen
 action, reward, and terminal reason) from every parallel environment and
-persists it to a CSV file.  Data are accumulated in an in-memory buffer and
-flushed to disk in batches to avoid I/O overhead on every step.  The CSV is
-opened in append mode so that interrupted training runs can be resumed without
-losing previously collected data.
+persists it to disk, as binary column shards written by a background thread
+(``src/utils/telemetry_store.py``) or as a CSV file.  The telemetry arrives
+as fixed-layout records (``env/telemetry.py``) and is handled as arrays
+across all environments.  Data are accumulated in memory and written in
+batches to avoid I/O overhead on every step.  Both formats append, so that
+interrupted training runs can be resumed without losing previously
+collected data.  It can also count every step into per-checkpoint-window
+track-occupancy, action and termination-reason histograms
+(``src/utils/occupancy.py``), from which the analysis plots are drawn, and
+keep the run index (``src/utils/run_index.py``) current with the shards,
+episode rows and TensorBoard files it writes.
+
+:class:`StepProfilerCallback` logs where environment and learner time goes
+(see ``env/step_profiler.py``).
+
+:class:`ReplaySegmentCallback` checkpoints the replay buffer incrementally
+(see ``src/utils/replay_segments.py``), and :class:`AsyncCheckpointCallback`
+saves model checkpoints on a background thread
+(see ``src/utils/checkpoint_writer.py``).
 """
 
 import os
 import csv
-from stable_baselines3.common.callbacks import BaseCallback
+import time
+import functools
+import numpy as np
+from collections import deque
+from stable_baselines3.common.callbacks import BaseCallback, CheckpointCallback
+from env.step_profiler import STEP_COMPONENTS
+from env.telemetry import REASON_LABELS, TerminalReason, episodes_from_infos, records_from_infos
+from src.utils.occupancy import OccupancyRecorder
+from src.utils.telemetry_store import TelemetryWriter
+
+# Columns of the episode table (episodes.csv), one row per finished episode.
+EPISODE_COLUMNS = ["step", "env", "length", "reward", "mean_speed", "offroad_fraction",
+                   "checkpoints", "lap", "race_time", "reason", "reset_time_ms"]
 
 
 class MKDSMetricsCallback(BaseCallback):
-    """Custom callback for logging race telemetry to CSV during training.
+    """Custom callback for logging race telemetry during training.
 
-    Hooks into the Stable-Baselines3 training loop to record per-step
-    telemetry from every vectorised environment instance.  Rows are staged
-    in :attr:`buffer` and written to disk in a single batch whenever the
-    buffer reaches :attr:`flush_freq` entries, keeping per-step I/O cost
-    negligible.  A final flush is performed when training ends so no data
-    are silently discarded.
+    Hooks into the Stable-Baselines3 training loop and records two levels
+    of telemetry:
+
+    * **Episodes** - the summary ``MKDSEnv`` emits at the end of every
+      episode (``info["episode_summary"]``) is logged to TensorBoard under
+      ``episode/`` (averaged over the dump interval, plus the rate of each
+      termination reason) and appended to a compact episode table,
+      ``<log_dir>/episodes.csv``, one row per episode.
+    * **Steps** - per-step rows from every vectorised environment instance,
+      for every :attr:`step_sample_every`-th vectorised step (all envs of
+      that step; ``1`` logs every step, ``0`` disables step logging).
+    * **Occupancy** - with ``occupancy_window`` set, *every* step of every
+      env is counted into fixed-size position, action and
+      termination-reason histograms, saved once per window of that many
+      global steps under ``<log_dir>/occupancy/`` (see
+      :class:`~src.utils.occupancy.OccupancyRecorder`).
+
+    With the default
+    ``log_format="npz"`` the rows go to a
+    :class:`~src.utils.telemetry_store.TelemetryWriter`, which saves binary
+    column shards under ``<log_dir>/telemetry/`` from a background thread.
+    With ``log_format="csv"`` rows are staged in :attr:`buffer` and written
+    to ``telemetry_log.csv`` in a single batch whenever the buffer reaches
+    :attr:`flush_freq` entries.  Either way a final flush is performed when
+    training ends (or on :meth:`close`) so no data are silently discarded.
 
     Attributes:
-        log_path (str): Absolute path to the output CSV file
+        log_format (str): ``"npz"`` or ``"csv"``.
+        step_sample_every (int): Vectorised steps between two logged steps.
+        episode_path (str): Episode table (``<log_dir>/episodes.csv``).
+        log_path (str): Output path: the shard directory
+            (``<log_dir>/telemetry``) or the CSV file
             (``<log_dir>/telemetry_log.csv``).
-        buffer (list[list]): In-memory staging area for telemetry rows
-            awaiting the next batch write.
-        flush_freq (int): Number of rows that must accumulate in
+        store (TelemetryWriter | None): Shard writer while training with
+            ``log_format="npz"``.
+        buffer (list[tuple]): In-memory staging area of ``(step, records,
+            rewards)`` per vectorised step, awaiting the next batch write.
+        flush_freq (int): Number of rows (env steps) that must accumulate in
             :attr:`buffer` before an automatic flush to disk is triggered.
             Default is ``5000``.
+        occupancy (OccupancyRecorder | None): Histogram recorder while
+            training with ``occupancy_window``.
+        run_index (RunIndex | None): Run index told about each shard,
+            episode table write and the TensorBoard folder of the run.
     """
 
-    def __init__(self, log_dir: str, verbose: int = 0) -> None:
+    def __init__(self, log_dir: str, log_format: str = "npz", shard_rows: int = 65536,
+                 step_sample_every: int = 1, occupancy_window: int = 0, n_actions: int = 3,
+                 occupancy_bins: int = 512, occupancy_extent: int = 1 << 25, run_index=None,
+                 run_id: str = None, verbose: int = 0) -> None:
         """Initialises the callback and resolves the output file path.
 
         Args:
-            log_dir (str): Directory in which the telemetry CSV will be
-                created.  The directory must already exist; the file itself
+            log_dir (str): Directory in which the telemetry log will be
+                created.  The directory must already exist; the log itself
                 is created (or appended to) on the first call to
                 :meth:`_on_training_start`.
+            log_format (str): ``"npz"`` (binary column shards, default) or
+                ``"csv"`` (legacy ``telemetry_log.csv``).
+            shard_rows (int): Rows per shard with ``log_format="npz"``.
+            step_sample_every (int): Log per-step rows for every N-th
+                vectorised step only; ``0`` disables them.  Episode
+                summaries are always logged.  Defaults to ``1``.
+            occupancy_window (int): Global steps per occupancy histogram
+                window; ``0`` (default) disables the histograms.
+            n_actions (int): Size of the discrete action space.
+            occupancy_bins (int): Position grid cells per axis.
+            occupancy_extent (int): Half-width of the position grid in raw
+                world units.
+            run_index (RunIndex | None): Run index to keep current.
+            run_id (str | None): Run folder name in the index (required
+                with ``run_index``).
             verbose (int): Verbosity level passed to the parent
                 :class:`~stable_baselines3.common.callbacks.BaseCallback`.
                 ``0`` = silent, ``1`` = info, ``2`` = debug.  Defaults to
                 ``0``.
         """
         super().__init__(verbose)
+        if log_format not in ("npz", "csv"):
+            raise ValueError(f"log_format must be 'npz' or 'csv', got '{log_format}'")
+        self.log_format = log_format
+        self.shard_rows = shard_rows
+        self.step_sample_every = step_sample_every
+        self.store = None
+        self.occupancy = None
+        self.occupancy_path = os.path.join(log_dir, "occupancy")
+        self.occupancy_window = occupancy_window
+        self.n_actions = n_actions
+        self.occupancy_bins = occupancy_bins
+        self.occupancy_extent = occupancy_extent
+        self.run_index = run_index
+        self.run_id = run_id
+        self.episode_path = os.path.join(log_dir, "episodes.csv")
+        self._episode_rows = []  # Episode table rows awaiting the next write
+        self._recent_rewards = deque(maxlen=100)  # For mean_episode_reward()
 
         # Build the full path once so every method can use self.log_path.
-        self.log_path = os.path.join(log_dir, "telemetry_log.csv")
+        if log_format == "npz":
+            self.log_path = os.path.join(log_dir, "telemetry")
+        else:
+            self.log_path = os.path.join(log_dir, "telemetry_log.csv")
 
-        # Rows accumulate here until flush_freq is reached.
+        # (step, records, rewards) per call accumulate here until flush_freq
+        # rows are buffered.
         self.buffer = []
+        self._buffered_rows = 0
 
         # Flush to disk after this many buffered rows to balance RAM usage
         # against file-system write frequency.
         self.flush_freq = 5000
+        self.episode_flush_freq = 100
 
     def _on_training_start(self) -> None:
-        """Initialises the CSV file header if the file does not yet exist.
+        """Starts the shard writer, or initialises the CSV file header.
 
-        Opens the file in **append** mode (``'a'``) rather than write mode
-        (``'w'``) so that a resumed training run continues adding rows to
-        the same file instead of truncating data from previous sessions.
-        The header row is written only when the file is new, preventing
-        duplicate headers on resume.
+        With ``log_format="npz"`` the writer continues the shard numbering of
+        a resumed run.  For CSV, opens the file in **append** mode (``'a'``)
+        rather than write mode (``'w'``) so that a resumed training run
+        continues adding rows to the same file instead of truncating data
+        from previous sessions.  The header row is written only when the
+        file is new, preventing duplicate headers on resume (the same applies
+        to the episode table).
         """
+        if not os.path.isfile(self.episode_path):
+            with open(self.episode_path, 'w', newline='') as f:
+                csv.writer(f).writerow(EPISODE_COLUMNS)
+
+        # SB3 has opened this session's event file by now.
+        tb_dir = self.logger.get_dir()
+        if self.run_index is not None and tb_dir:
+            self.run_index.add_tb_dir(tb_dir, self.run_id)
+
+        if self.occupancy_window:
+            self.occupancy = OccupancyRecorder(self.occupancy_path, self.occupancy_window, self.n_actions,
+                                               bins=self.occupancy_bins, extent=self.occupancy_extent)
+
+        if self.step_sample_every == 0:
+            return
+        if self.log_format == "npz":
+            on_write = None
+            if self.run_index is not None:
+                on_write = functools.partial(self.run_index.add_shard, self.run_id)
+            self.store = TelemetryWriter(self.log_path, shard_rows=self.shard_rows, on_write=on_write)
+            return
+
         # Check existence before opening so we can decide whether to write
         # the header without relying on the file position after open().
         file_exists = os.path.isfile(self.log_path)
@@ -88,58 +209,133 @@ class MKDSMetricsCallback(BaseCallback):
         contains (among other keys):
 
         * ``"infos"``   – list of info dicts, one per parallel environment.
-          Each dict is expected to carry a ``"telemetry"`` sub-dict with keys
-          ``speed``, ``offroad``, ``pos_x``, ``pos_z``, and ``action``, plus
-          an optional ``"terminal_reason"`` string set on episode end.
+          Each dict carries the step's packed telemetry record under
+          ``"telemetry"`` (see :mod:`env.telemetry`).
         * ``"rewards"`` – list of scalar rewards, one per parallel environment,
           for the **current** step (before any discounting).
 
-        After appending all environment rows, the method checks whether the
-        buffer has reached :attr:`flush_freq` and triggers a disk write if so.
+        Episode summaries are looked up only in rows flagged in ``dones``.
+        On sampled steps, the records of all environments are decoded in one
+        call into a :data:`~env.telemetry.TELEMETRY_DTYPE` array and handed
+        on as is (copied into the shard writer's columns, or buffered for the
+        CSV), so the per-step cost does not grow with per-env Python work.
 
         Returns:
             bool: Always ``True``.  Returning ``False`` from this callback
             would signal SB3 to abort training early; we never want that here.
         """
-        # Iterate over every parallel environment's output for this timestep.
-        for i in range(len(self.locals["infos"])):
-            info = self.locals["infos"][i]
-            reward = self.locals["rewards"][i]  # Capture current step reward
-            tel = info["telemetry"]  # Unpack the nested telemetry sub-dict.
-            self.buffer.append([
-                self.num_timesteps,   # Global step counter maintained by SB3.
-                tel["speed"],
-                tel["offroad"],
-                tel["pos_x"],
-                tel["pos_z"],
-                tel["action"],
-                info.get("terminal_reason", ""),  # Empty string if mid-episode.
-                reward,
-            ])
+        infos = self.locals["infos"]
+        rows, episodes = episodes_from_infos(infos, self.locals["dones"])
+        if len(episodes):
+            self._log_episodes(infos, rows, episodes)
+
+        # The histograms count every step, sampled or not.
+        records = None
+        if self.occupancy is not None:
+            records = records_from_infos(infos)
+            self.occupancy.add(self.num_timesteps, records)
+
+        if not self.step_sample_every or self.n_calls % self.step_sample_every:
+            return True
+
+        if records is None:
+            records = records_from_infos(infos)
+        rewards = np.asarray(self.locals["rewards"], dtype=np.float64)
+        if self.store is not None:
+            self.store.append(self.num_timesteps, records, rewards)
+            return True
+
+        self.buffer.append((self.num_timesteps, records, rewards))
+        self._buffered_rows += len(records)
 
         # Trigger a batch write once the buffer is large enough to amortise
         # the per-call file-open / flush overhead across many rows.
-        if len(self.buffer) >= self.flush_freq:
+        if self._buffered_rows >= self.flush_freq:
             self._flush_buffer()
 
         return True  # Returning False would halt training; always return True.
 
+    def _log_episodes(self, infos, rows, episodes) -> None:
+        """Records finished episodes to TensorBoard and the episode table."""
+        record_mean = self.logger.record_mean
+        for row, ep in zip(rows.tolist(), episodes):
+            record_mean("episode/length", int(ep["length"]))
+            record_mean("episode/reward", float(ep["reward"]))
+            self._recent_rewards.append(float(ep["reward"]))
+            record_mean("episode/mean_speed", float(ep["mean_speed"]))
+            record_mean("episode/offroad_fraction", float(ep["offroad_fraction"]))
+            record_mean("episode/checkpoints", int(ep["checkpoints"]))
+            record_mean("episode/lap", int(ep["lap"]))
+            for reason in TerminalReason:
+                if reason:
+                    record_mean(f"episode/{reason.label}_rate", float(ep["reason"] == reason))
+            # Latency of the reset that started the episode; averaged by the
+            # SB3 logger over the dump interval across all workers.
+            if not np.isnan(ep["reset_time_ms"]):
+                record_mean("env/reset_time_ms", float(ep["reset_time_ms"]))
+
+            self._episode_rows.append([
+                self.num_timesteps,
+                infos[row].get("env_id", row),  # Worker id under the async VecEnv
+                int(ep["length"]),
+                float(ep["reward"]),
+                float(ep["mean_speed"]),
+                float(ep["offroad_fraction"]),
+                int(ep["checkpoints"]),
+                int(ep["lap"]),
+                int(ep["race_time"]),
+                REASON_LABELS[ep["reason"]],
+                float(ep["reset_time_ms"]),
+            ])
+        if len(self._episode_rows) >= self.episode_flush_freq:
+            self._flush_episodes()
+
+    def mean_episode_reward(self):
+        """Mean reward of the last 100 finished episodes (``None`` before the first)."""
+        return float(np.mean(self._recent_rewards)) if self._recent_rewards else None
+
+    def _flush_episodes(self) -> None:
+        """Appends the buffered rows to the episode table."""
+        if not self._episode_rows:
+            return
+        with open(self.episode_path, 'a', newline='') as f:
+            csv.writer(f).writerows(self._episode_rows)
+        self._episode_rows = []
+        if self.run_index is not None:
+            self.run_index.refresh_episodes(self.run_id)
+
     def _flush_buffer(self) -> None:
         """Writes all buffered telemetry rows to the CSV file in one batch.
 
-        Using ``writer.writerows()`` (plural) with the entire buffer in a
-        single call is significantly faster than opening the file and calling
-        ``writerow()`` once per step, because it minimises the number of
-        ``write()`` syscalls and eliminates repeated file-handle acquisition.
+        The buffered per-step record arrays are concatenated and converted
+        column by column, then handed to ``writer.writerows()`` in a single
+        call.  The CSV layout is unchanged: ``step, speed, offroad, pos_x,
+        pos_z, action, reason, reward``, with an empty reason mid-episode.
         After writing, the buffer is cleared to reclaim memory.
         """
+        if not self.buffer:
+            return
+        steps = np.concatenate([np.full(len(records), step) for step, records, _ in self.buffer])
+        records = np.concatenate([records for _, records, _ in self.buffer])
+        rewards = np.concatenate([rewards for _, _, rewards in self.buffer])
+        rows = zip(
+            steps.tolist(),
+            records["speed"].tolist(),
+            records["offroad"].tolist(),
+            records["pos_x"].tolist(),
+            records["pos_z"].tolist(),
+            records["action"].tolist(),
+            REASON_LABELS[records["reason"]].tolist(),
+            rewards.tolist(),
+        )
         with open(self.log_path, 'a', newline='') as f:
             writer = csv.writer(f)
             # Batch write: one syscall for all buffered rows instead of N.
-            writer.writerows(self.buffer)
+            writer.writerows(rows)
 
         # Clear the buffer so memory is not held indefinitely between flushes.
         self.buffer = []
+        self._buffered_rows = 0
 
     def _on_training_end(self) -> None:
         """Flushes any remaining buffered rows when training stops.
@@ -151,4 +347,212 @@ class MKDSMetricsCallback(BaseCallback):
         at the end of training.  It is called by SB3 after the final
         environment step and before the callback is torn down.
         """
-        self._flush_buffer()
\ No newline at end of file
+        self.close()
+
+    def close(self) -> None:
+        """Writes out everything still buffered; safe to call repeatedly.
+
+        ``model.learn()`` does not reach :meth:`_on_training_end` when it is
+        interrupted (Ctrl+C), so ``train()`` also calls this from its
+        ``finally`` block.
+        """
+        self._flush_episodes()
+        if self.occupancy is not None:
+            self.occupancy.close()
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+        elif self.buffer:
+            self._flush_buffer()
+
+class StepProfilerCallback(BaseCallback):
+    """Logs per-component env step timings and rollout/learner time split.
+
+    On training start the callback switches on ``MKDSEnv``'s step profiler
+    in every worker (``env_method("set_step_profiling", True)``).  Every
+    :attr:`log_freq` calls it drains the recorded rows from all workers,
+    pools them, and records the p50/p95/p99 of each component of
+    :data:`~env.step_profiler.STEP_COMPONENTS` as
+    ``profile/<component>_p50_ms`` etc.
+
+    It also times the two halves of SB3's off-policy loop:
+    ``collect_rollouts`` (between ``on_rollout_start`` and
+    ``on_rollout_end``) and everything in between rollouts, which is
+    dominated by gradient updates.  These are logged as
+    ``profile/rollout_ms``, ``profile/learner_ms`` and
+    ``profile/learner_fraction``.  A fraction near 1 means the learner is the
+    bottleneck; near 0 means the emulators are.
+
+    Attributes:
+        log_freq (int): Callback calls (vectorised steps) between drains.
+    """
+
+    def __init__(self, log_freq: int = 1000, verbose: int = 0) -> None:
+        """Initialises the callback.
+
+        Args:
+            log_freq (int): Number of ``_on_step`` calls between two
+                aggregations.  Defaults to ``1000``.
+            verbose (int): Verbosity level passed to
+                :class:`~stable_baselines3.common.callbacks.BaseCallback`.
+        """
+        super().__init__(verbose)
+        self.log_freq = log_freq
+        self._rollout_start = None
+        self._rollout_end = None
+        self._learner_s = 0.0
+
+    def _on_training_start(self) -> None:
+        """Enables step profiling in every environment worker."""
+        self.training_env.env_method("set_step_profiling", True)
+
+    def _on_rollout_start(self) -> None:
+        now = time.perf_counter()
+        if self._rollout_end is not None:
+            # Time since the previous rollout ended: train() and logging.
+            self._learner_s = now - self._rollout_end
+            self.logger.record_mean("profile/learner_ms", self._learner_s * 1000.0)
+        self._rollout_start = now
+
+    def _on_rollout_end(self) -> None:
+        now = time.perf_counter()
+        rollout_s = now - self._rollout_start
+        self.logger.record_mean("profile/rollout_ms", rollout_s * 1000.0)
+        if self._rollout_end is not None:
+            self.logger.record_mean("profile/learner_fraction", self._learner_s / (self._learner_s + rollout_s))
+        self._rollout_end = now
+
+    def _on_step(self) -> bool:
+        """Aggregates the workers' step timings every :attr:`log_freq` calls.
+
+        Returns:
+            bool: Always ``True``.
+        """
+        if self.n_calls % self.log_freq == 0:
+            self._log_step_profile()
+        return True
+
+    def _log_step_profile(self) -> None:
+        """Drains all workers and records per-component percentiles."""
+        rows = [r for r in self.training_env.env_method("drain_step_profile") if r is not None and len(r)]
+        if not rows:
+            return
+        samples = np.concatenate(rows)
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99], axis=0)
+        for i, name in enumerate(STEP_COMPONENTS):
+            self.logger.record(f"profile/{name}_p50_ms", p50[i])
+            self.logger.record(f"profile/{name}_p95_ms", p95[i])
+            self.logger.record(f"profile/{name}_p99_ms", p99[i])
+        self.logger.record("profile/steps_sampled", len(samples))
+
+    def _on_training_end(self) -> None:
+        """Switches profiling off again (the envs may outlive training)."""
+        self.training_env.env_method("set_step_profiling", False)
+
+
+class ReplaySegmentCallback(BaseCallback):
+    """Writes replay buffer checkpoints as incremental segments.
+
+    Used next to :class:`AsyncCheckpointCallback`, which saves the model
+    whole but never the replay buffer: the buffer only has the transitions
+    added since the previous segment appended to its
+    :class:`~src.utils.replay_segments.ReplaySegmentLog`.
+
+    Attributes:
+        replay_log (ReplaySegmentLog): Log of the model's replay buffer.
+        save_freq (int): Callback calls (vectorised steps) between segments.
+    """
+
+    def __init__(self, replay_log, save_freq: int, verbose: int = 0) -> None:
+        """Initialises the callback.
+
+        Args:
+            replay_log (ReplaySegmentLog): Log opened on the model's replay
+                buffer.
+            save_freq (int): Number of ``_on_step`` calls between segments,
+                as for ``CheckpointCallback``.
+            verbose (int): Verbosity level passed to
+                :class:`~stable_baselines3.common.callbacks.BaseCallback`.
+        """
+        super().__init__(verbose)
+        self.replay_log = replay_log
+        self.save_freq = save_freq
+
+    def _on_step(self) -> bool:
+        """Counts added rows and writes a segment every :attr:`save_freq` calls.
+
+        Returns:
+            bool: Always ``True``.
+        """
+        self.replay_log.track()
+        if self.n_calls % self.save_freq == 0:
+            t0 = time.perf_counter()
+            rows = self.replay_log.write_segment()
+            self.logger.record("checkpoint/replay_segment_ms", (time.perf_counter() - t0) * 1000.0)
+            if self.verbose >= 2:
+                print(f"Saved {rows} replay rows to {self.replay_log.directory}")
+        return True
+
+
+class AsyncCheckpointCallback(CheckpointCallback):
+    """``CheckpointCallback`` whose model saves are written in the background.
+
+    Every :attr:`save_freq` calls the model is snapshotted on the training
+    thread and handed to an
+    :class:`~src.utils.checkpoint_writer.AsyncCheckpointWriter`, which
+    compresses and writes it (temporary file, then rename) while training
+    continues.  Checkpoint names are the same as ``CheckpointCallback``'s.
+    The replay buffer is not saved here (see :class:`ReplaySegmentCallback`).
+
+    With a :class:`~src.utils.run_manifest.RunManifest`, each written
+    checkpoint is recorded there (with its score) and the retention policy is
+    applied, also on the writer thread.
+
+    Attributes:
+        writer (AsyncCheckpointWriter): Background writer.
+        run_manifest (RunManifest | None): Checkpoint record of the run.
+    """
+
+    def __init__(self, writer, save_freq: int, save_path: str, name_prefix: str = "rl_model",
+                 run_manifest=None, retention=None, score_fn=None, verbose: int = 0) -> None:
+        """Initialises the callback.
+
+        Args:
+            writer (AsyncCheckpointWriter): Background writer, shared with
+                the replay log so all checkpoint I/O stays in order.
+            save_freq (int): Number of ``_on_step`` calls between saves.
+            save_path (str): Checkpoint directory.
+            name_prefix (str): Checkpoint file name prefix.
+            run_manifest (RunManifest | None): Records the checkpoints.
+            retention (RetentionPolicy | None): Pruning rules applied after
+                each checkpoint (needs ``run_manifest``).
+            score_fn (callable | None): Returns the checkpoint's score for
+                ``keep_best`` (e.g.
+                :meth:`MKDSMetricsCallback.mean_episode_reward`).
+            verbose (int): Verbosity level passed to
+                :class:`~stable_baselines3.common.callbacks.BaseCallback`.
+        """
+        super().__init__(save_freq, save_path, name_prefix=name_prefix, verbose=verbose)
+        self.writer = writer
+        self.run_manifest = run_manifest
+        self.retention = retention
+        self.score_fn = score_fn
+
+    def _on_step(self) -> bool:
+        """Queues a model checkpoint every :attr:`save_freq` calls.
+
+        Returns:
+            bool: Always ``True``.
+        """
+        if self.n_calls % self.save_freq == 0:
+            t0 = time.perf_counter()
+            model_path = self.writer.save_model(self.model, self._checkpoint_path(extension="zip"))
+            self.logger.record("checkpoint/snapshot_ms", (time.perf_counter() - t0) * 1000.0)
+            if self.run_manifest is not None:
+                # Queued behind the write, so the file exists when recorded.
+                score = self.score_fn() if self.score_fn is not None else None
+                self.writer.submit(self.run_manifest.add_checkpoint, model_path, self.num_timesteps,
+                                   score, self.retention)
+            if self.verbose >= 2:
+                print(f"Saving model checkpoint to {model_path}")
+        return True
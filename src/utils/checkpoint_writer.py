@@ -0,0 +1,155 @@
+"""Checkpoint writes on a background thread.
+
+``model.save`` serialises, compresses and writes the whole model on the
+training thread, so env stepping and gradient updates stop for every
+checkpoint.  :class:`AsyncCheckpointWriter` splits a save in two:
+
+* On the training thread, :meth:`~AsyncCheckpointWriter.save_model` takes a
+  snapshot: the SB3 data dict is serialised (it is small) and the policy and
+  optimizer state dicts are copied (``copy.deepcopy`` clones the tensors on
+  their device).  Training can then mutate the model freely.
+* A single writer thread runs the queued jobs in order: it builds the
+  (deflate-compressed) zip in a temporary file and renames it into place, so
+  a checkpoint is either complete or absent.
+
+Other jobs (replay segment writes, see ``src/utils/replay_segments.py``) go
+through the same queue, so all checkpoint I/O keeps its submission order.
+:meth:`~AsyncCheckpointWriter.close` waits for every queued job; the safety
+save in ``train_sb3_dqn.py`` calls it before the process exits.
+"""
+
+import os
+import copy
+import queue
+import logging
+import zipfile
+import threading
+import torch as th
+import stable_baselines3 as sb3
+from stable_baselines3.common.save_util import data_to_json, recursive_getattr
+from stable_baselines3.common.utils import get_system_info
+
+logger = logging.getLogger(__name__)
+
+
+def snapshot_model(model):
+    """Captures what ``model.save`` would write, decoupled from the live model.
+
+    Mirrors ``BaseAlgorithm.save``: the same attributes are excluded, and the
+    result loads with ``algo_cls.load``.
+
+    Args:
+        model (BaseAlgorithm): SB3 model.
+
+    Returns:
+        tuple[str, dict, dict]: Serialised data, copied state dicts and
+            copied extra PyTorch variables.
+    """
+    data = model.__dict__.copy()
+    exclude = set(model._excluded_save_params())
+    state_dicts_names, torch_variable_names = model._get_torch_save_params()
+    for name in state_dicts_names + torch_variable_names:
+        exclude.add(name.split(".")[0])
+    for name in exclude:
+        data.pop(name, None)
+
+    serialized = data_to_json(data)
+    params = copy.deepcopy(model.get_parameters())
+    pytorch_variables = {name: copy.deepcopy(recursive_getattr(model, name)) for name in torch_variable_names}
+    return serialized, params, pytorch_variables
+
+
+def write_model_zip(path, serialized, params, pytorch_variables):
+    """Writes a snapshot from :func:`snapshot_model` in SB3's zip layout.
+
+    Args:
+        path (str): Output path (``.zip``).
+        serialized (str): Serialised data dict.
+        params (dict): State dicts by name.
+        pytorch_variables (dict): Extra PyTorch variables.
+    """
+    with zipfile.ZipFile(path, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("data", serialized)
+        with archive.open("pytorch_variables.pth", mode="w", force_zip64=True) as f:
+            th.save(pytorch_variables, f)
+        for name, state_dict in params.items():
+            with archive.open(name + ".pth", mode="w", force_zip64=True) as f:
+                th.save(state_dict, f)
+        archive.writestr("_stable_baselines3_version", sb3.__version__)
+        archive.writestr("system_info.txt", get_system_info(print_info=False)[1])
+
+
+class AsyncCheckpointWriter:
+    """Runs checkpoint jobs in order on one background thread.
+
+    Args:
+        max_pending (int): Jobs queued before :meth:`submit` blocks, which
+            bounds the memory held by snapshots if the disk falls behind.
+
+    Attributes:
+        failures (int): Jobs that raised (each is logged).
+    """
+
+    def __init__(self, max_pending=16):
+        self._jobs = queue.Queue(maxsize=max_pending)
+        self.failures = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args):
+        """Queues ``fn(*args)``; runs it right away once the writer is closed."""
+        if self._closed:
+            fn(*args)
+        else:
+            self._jobs.put((fn, args))
+
+    def save_model(self, model, path):
+        """Snapshots ``model`` now and writes it to ``path`` in the background.
+
+        Args:
+            model (BaseAlgorithm): SB3 model.
+            path (str): Checkpoint path; ``.zip`` is appended if missing,
+                as ``model.save`` does.
+
+        Returns:
+            str: The checkpoint path.
+        """
+        if not path.endswith(".zip"):
+            path += ".zip"
+        self.submit(self._write_atomic, path, write_model_zip, *snapshot_model(model))
+        return path
+
+    def wait(self):
+        """Blocks until every job queued so far has finished."""
+        self._jobs.join()
+
+    def close(self):
+        """Waits for the queued jobs and stops the thread (idempotent)."""
+        if self._closed:
+            return
+        self._jobs.put(None)
+        self._thread.join()
+        self._closed = True
+
+    @staticmethod
+    def _write_atomic(path, write_fn, *args):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        write_fn(tmp_path, *args)
+        os.replace(tmp_path, path)
+
+    def _run(self):
+        """Writer thread: runs queued jobs until ``None`` arrives."""
+        while True:
+            job = self._jobs.get()
+            try:
+                if job is None:
+                    break
+                fn, args = job
+                fn(*args)
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Checkpoint write failed: {e}")
+            finally:
+                self._jobs.task_done()
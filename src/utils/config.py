@@ -27,6 +27,10 @@ ROOT_DIR = Path(__file__).resolve().parent.parent.parent
 # ---------------------------------------------------------------------------
 SAVE_FILE_NAME = str(ROOT_DIR / "mkds_boot.dst")  # DeSmuME save-state used to boot into race
 
+# How MKDSEnv restores the boot state on reset: "memory" reads the file once
+# and restores from a private RAM-backed copy; "file" reloads it from disk.
+BOOT_STATE_MODE = "memory"
+
 # ---------------------------------------------------------------------------
 # ROM Path  (lazy — resolved on first access via module __getattr__)
 # ---------------------------------------------------------------------------
@@ -94,9 +98,39 @@ STATE_W, STATE_H = 84, 84
 # infer velocity and direction (a single frame is Markovian for position only).
 STACK_SIZE = 4
 
+# Stack frames inside MKDSEnv with a per-env ring buffer instead of wrapping
+# the VecEnv in VecFrameStack.  Same (H, W, STACK_SIZE) layout, so checkpoints
+# are interchangeable; the stacking work moves into the worker processes.
+ENV_FRAME_STACK = False
+
+# Emulator frames advanced per environment step (action repeat).  Intermediate
+# frames are not rendered by DeSmuME since the agent never observes them.
+FRAME_SKIP = 4
+
+# Observe the pixel-wise max of the last two rendered frames (Atari-style) to
+# avoid aliasing on sprites that flicker between frames.  Costs one extra
+# rendered frame per step.
+MAX_POOL_FRAMES = False
+
 # Parallel DeSmuME instances used for environment stepping.
 NUM_OF_INSTANCES = 1
 
+# Vectorised env used to run the instances: "subproc" (SB3 SubprocVecEnv,
+# pickles every step through a pipe) or "shm" (SharedMemoryVecEnv, step data
+# exchanged through shared memory).
+VEC_ENV_TYPE = "subproc"
+
+# How worker processes are started (see env/worker_startup.py): "forkserver"
+# forks workers from a server with the heavy modules preloaded; "zygote" boots
+# one emulator and forks every worker from it (POSIX, shm/async VecEnvs only);
+# "spawn" / "fork" are the plain multiprocessing methods.
+WORKER_START_METHOD = "forkserver"
+
+# Asynchronous partial-batch stepping: when > 0 (and below NUM_OF_INSTANCES),
+# each step returns the first ASYNC_BATCH_SIZE workers that are ready instead
+# of waiting for all of them (see env/async_vec_env.py).  0 = synchronous.
+ASYNC_BATCH_SIZE = 0
+
 # Action space size.  The commented-out 6-action variant includes explicit
 # drift inputs; the active 3-action set keeps the policy simpler during
 # initial training (gas is implicit — no brake action).
@@ -117,6 +151,28 @@ LEARNING_RATE = 0.00025
 # while still providing sufficient diversity for stable Q-learning updates.
 MEMORY_SIZE = 50000
 
+# Replay buffer storage: "framestack" stores every frame once per env stream
+# and rebuilds the stacks at sample time (src/utils/replay_buffers.py), about
+# 8x less observation memory than SB3's "default" buffer with 4-frame stacks,
+# so MEMORY_SIZE can be raised accordingly.  The async mode (ASYNC_BATCH_SIZE)
+# always uses "default".  "memmap" is "framestack" kept in memory-mapped files
+# under outputs/<run>/replay/: MEMORY_SIZE is bounded by disk rather than RAM,
+# and a resumed run reopens the files instead of loading a pickled buffer.
+# "prioritized" is "framestack" with prioritized experience replay: sampling
+# proportional to |TD error|^PER_ALPHA, with importance-sampling weights whose
+# exponent anneals from PER_BETA to 1 over TOTAL_TIMESTEPS.
+REPLAY_BUFFER = "framestack"
+PER_ALPHA = 0.6
+PER_BETA = 0.4
+
+# Extra frame capacity of the frame-deduplicated buffers, as a fraction of
+# MEMORY_SIZE.  Every episode start writes STACK_SIZE extra frames, so the
+# margin must be at least STACK_SIZE / (mean episode length in steps) or the
+# oldest transitions become unsampleable and the effective capacity shrinks
+# (logged as train/replay_stale_fraction).  0.25 covers episodes of 16+
+# steps with 4-frame stacks.
+REPLAY_STREAM_MARGIN = 0.25
+
 # Mini-batch size for each gradient update.
 # 128 > original 32 to better utilise modern GPU throughput.
 # BATCH_SIZE = 32
@@ -127,6 +183,44 @@ BATCH_SIZE = 128
 # EPSILON_END = 0.1
 # EPSILON_DECAY = 100000  # Frames over which ε decays from START → END
 
+# Per-step telemetry log written by MKDSMetricsCallback: "npz" (binary column
+# shards in logs/telemetry/, see src/utils/telemetry_store.py) or "csv" (the
+# legacy logs/telemetry_log.csv).  Rows per shard for "npz".
+TELEMETRY_FORMAT = "npz"
+TELEMETRY_SHARD_ROWS = 65536
+
+# Per-step telemetry rows are logged for every TELEMETRY_STEP_SAMPLE-th
+# vectorised step only (1 = every step, 0 = none).  Episode-level metrics come
+# from the per-episode summaries MKDSEnv emits, which are always logged (to
+# TensorBoard and logs/episodes.csv), so sampling the steps loses no episode
+# statistics.
+TELEMETRY_STEP_SAMPLE = 10
+
+# Track-occupancy histograms (src/utils/occupancy.py): every env step is
+# counted into an OCCUPANCY_BINS x OCCUPANCY_BINS position grid spanning
+# +/-OCCUPANCY_EXTENT raw world units (1 unit = 4096 raw), plus action and
+# termination-reason counts, saved once per checkpoint window to
+# logs/occupancy/.  analysis/plot_generator.py draws from these instead of
+# the step log.  0 bins disables them.
+OCCUPANCY_BINS = 512
+OCCUPANCY_EXTENT = 1 << 25
+
+# Per-component step timing (env/step_profiler.py), logged to TensorBoard by
+# StepProfilerCallback every PROFILE_LOG_FREQ vectorised steps.  Off by default.
+PROFILE_STEPS = False
+PROFILE_LOG_FREQ = 1000
+
+# Checkpoint retention (src/utils/run_manifest.py), applied after every
+# checkpoint: keep the CHECKPOINT_KEEP_LAST most recent, one per
+# CHECKPOINT_KEEP_EVERY global steps (0 = none) and the CHECKPOINT_KEEP_BEST
+# with the highest mean reward over the last 100 episodes.  RUN_DISK_BUDGET_GB
+# caps the run's models/ folder (0 = no cap); the latest checkpoint is always
+# kept.
+CHECKPOINT_KEEP_LAST = 5
+CHECKPOINT_KEEP_EVERY = 100000
+CHECKPOINT_KEEP_BEST = 1
+RUN_DISK_BUDGET_GB = 0
+
 # ---------------------------------------------------------------------------
 # Memory Pointers — US (NTSC) ROM Version
 # ---------------------------------------------------------------------------
@@ -137,6 +231,12 @@ ADDR_TIMER_POINTER     = 0x0217AA34  # → race timer struct (tracks lap/split t
 ADDR_BASE_POINTER      = 0x0217ACF8  # → per-kart physics/state struct for player 1
 ADDR_RACE_INFO_POINTER = 0x021755FC  # → global race-info struct (lap count, position, etc.)
 
+# ARM9 main-memory region (4 MB RAM plus its mirrors).  A dereferenced pointer
+# outside this range is treated as not-yet-initialised and re-resolved on the
+# next read.
+MAIN_RAM_START = 0x02000000
+MAIN_RAM_END   = 0x03000000
+
 # ---------------------------------------------------------------------------
 # Struct Field Offsets — relative to the address stored at ADDR_BASE_POINTER
 # ---------------------------------------------------------------------------
@@ -147,12 +247,13 @@ OFFSET_ANGLE      = 0x236  # s16, heading angle of the kart in world space (arbi
 OFFSET_CHECKPOINT = 0x46   # u8,  last checkpoint index crossed (used to detect progress)
 OFFSET_LAP        = 0x38   # u8,  current lap number (0-indexed)
 OFFSET_OFFROAD    = 0xDC   # s32, 12-bit fixed-point off-road friction factor; 0 = on-road
+OFFSET_POS_X      = 0x80   # s32, world-space X position of the kart (raw world units)
+OFFSET_POS_Y      = 0x84   # s32, world-space Y position (vertical axis, raw world units)
+OFFSET_POS_Z      = 0x88   # s32, world-space Z position of the kart (raw world units)
+OFFSET_RACE_TIME  = 0x0    # u32, race timer ticks (60/s); relative to ADDR_TIMER_POINTER's target
 
 # Offsets retained for future work (not read by the current reward/obs pipeline):
 
-OFFSET_POS_X       = 0x80   # f32, world-space X position of the kart (metres)
-OFFSET_POS_Y       = 0x84   # f32, world-space Y position (vertical axis, metres)
-OFFSET_POS_Z       = 0x88   # f32, world-space Z position of the kart (metres)
 OFFSET_VEL_X       = 0xA4   # f32, world-space velocity component along X axis
 OFFSET_VEL_Y       = 0xA8   # f32, world-space velocity component along Y axis (vertical)
 OFFSET_VEL_Z       = 0xAC   # f32, world-space velocity component along Z axis
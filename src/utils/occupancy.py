@@ -0,0 +1,222 @@
+"""Track-occupancy histograms accumulated online during training.
+
+The position heatmap used to be a KDE over every logged ``pos_x``/``pos_z``
+row, which needs the whole telemetry log in memory and minutes of compute
+for a long run.  :class:`OccupancyRecorder` instead counts every env step
+into fixed-size arrays as it happens, one set per checkpoint window:
+
+* ``occupancy`` -- ``(bins, bins)`` 2-D histogram of the kart's position on
+  a fixed square grid centred on the world origin (rows are Z, columns X);
+* ``actions`` -- how often each discrete action was chosen;
+* ``reasons`` -- how many steps ended with each
+  :class:`~env.telemetry.TerminalReason` (index ``0`` counts the steps on
+  which the episode went on).
+
+The grid spans ``[-extent, extent)`` raw world units on both axes, so
+windows (and runs) with the same settings can be summed bin for bin.
+Positions outside it are counted in ``outside``.
+
+Each window is saved as one compressed ``.npz`` when the training step
+crosses into the next window, and the current (partial) window on
+:meth:`~OccupancyRecorder.close`.  A resumed run reopens the file of the
+window it resumes in and keeps counting into it.  :func:`read_occupancy`
+sums a run's windows for ``analysis/plot_generator.py``.
+
+Layout on disk::
+
+    <run>/logs/occupancy/
+        occupancy_000000.npz      # global steps 1 .. window_steps
+        occupancy_000001.npz      # window_steps + 1 .. 2 * window_steps
+        ...
+"""
+
+import os
+import glob
+import numpy as np
+from env.telemetry import TerminalReason
+
+OCCUPANCY_GLOB = "occupancy_*.npz"
+OCCUPANCY_NAME = "occupancy_{:06d}.npz"
+
+
+def list_windows(directory):
+    """Returns the window paths of an occupancy directory, oldest first."""
+    return sorted(glob.glob(os.path.join(directory, OCCUPANCY_GLOB)))
+
+
+def bin_edges(bins, extent):
+    """Returns the ``bins + 1`` grid edges (raw world units) on either axis."""
+    return np.linspace(-extent, extent, bins + 1)
+
+
+class OccupancyRecorder:
+    """Counts env steps into per-window occupancy, action and reason arrays.
+
+    Args:
+        directory (str): Window directory (created if needed).
+        window_steps (int): Global env steps per window (typically the
+            checkpoint interval times the number of envs).
+        n_actions (int): Size of the discrete action space; other action
+            values are not counted.
+        bins (int): Grid cells per axis.
+        extent (int): Half-width of the grid in raw world units.
+
+    Attributes:
+        window (int | None): Index of the window being counted.
+        windows_written (int): Window files saved so far.
+    """
+
+    def __init__(self, directory, window_steps, n_actions, bins=512, extent=1 << 25):
+        if window_steps < 1:
+            raise ValueError(f"window_steps must be >= 1, got {window_steps}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.window_steps = window_steps
+        self.n_actions = n_actions
+        self.bins = bins
+        self.extent = extent
+        self.window = None
+        self.windows_written = 0
+
+        self._occupancy = np.zeros((bins, bins), dtype=np.uint32)
+        self._actions = np.zeros(n_actions, dtype=np.int64)
+        self._reasons = np.zeros(len(TerminalReason), dtype=np.int64)
+        self._outside = 0
+        self._steps = 0
+        self._first_step = 0
+        self._last_step = 0
+
+    def add(self, step, records):
+        """Counts one vectorised step (one row per env).
+
+        Args:
+            step (int): Global step counter after this step; selects the
+                window, so that window ``k`` ends with the checkpoint taken
+                at step ``(k + 1) * window_steps``.
+            records (np.ndarray): ``(n_envs,)`` array of
+                :data:`~env.telemetry.TELEMETRY_DTYPE`.
+        """
+        window = (step - 1) // self.window_steps
+        if window != self.window:
+            if self.window is not None:
+                self._save()
+            self._open(window, step)
+        self._last_step = step
+        self._steps += len(records)
+
+        # Cell of each position on the fixed grid, as a flat (z, x) index.
+        scale = self.bins / (2 * self.extent)
+        ix = np.floor((records["pos_x"].astype(np.int64) + self.extent) * scale).astype(np.intp)
+        iz = np.floor((records["pos_z"].astype(np.int64) + self.extent) * scale).astype(np.intp)
+        inside = (ix >= 0) & (ix < self.bins) & (iz >= 0) & (iz < self.bins)
+        np.add.at(self._occupancy.reshape(-1), iz[inside] * self.bins + ix[inside], 1)
+        self._outside += int(len(records) - np.count_nonzero(inside))
+
+        actions = records["action"]
+        actions = actions[(actions >= 0) & (actions < self.n_actions)]
+        np.add.at(self._actions, actions, 1)
+        np.add.at(self._reasons, records["reason"], 1)
+
+    def close(self):
+        """Saves the current (partial) window; safe to call repeatedly."""
+        if self.window is not None and self._steps:
+            self._save()
+
+    def _path(self, window):
+        return os.path.join(self.directory, OCCUPANCY_NAME.format(window))
+
+    def _open(self, window, step):
+        """Starts counting ``window``, from its file if a previous session left one."""
+        self.window = window
+        path = self._path(window)
+        if os.path.isfile(path):
+            with np.load(path) as saved:
+                if saved["occupancy"].shape != self._occupancy.shape or int(saved["extent"]) != self.extent:
+                    raise ValueError(f"{path} has a {saved['occupancy'].shape} grid of extent "
+                                     f"{int(saved['extent'])}, expected {self._occupancy.shape} "
+                                     f"and {self.extent}")
+                self._occupancy[:] = saved["occupancy"]
+                self._actions[:] = 0
+                n = min(len(saved["actions"]), self.n_actions)
+                self._actions[:n] = saved["actions"][:n]
+                self._reasons[:] = saved["reasons"]
+                self._outside = int(saved["outside"])
+                self._steps = int(saved["steps"])
+                self._first_step = int(saved["first_step"])
+            return
+        self._occupancy[:] = 0
+        self._actions[:] = 0
+        self._reasons[:] = 0
+        self._outside = 0
+        self._steps = 0
+        self._first_step = step
+
+    def _save(self):
+        """Writes the current window atomically (temporary file, then rename)."""
+        path = self._path(self.window)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                window=self.window,
+                window_steps=self.window_steps,
+                first_step=self._first_step,
+                last_step=self._last_step,
+                steps=self._steps,
+                bins=self.bins,
+                extent=self.extent,
+                occupancy=self._occupancy,
+                outside=self._outside,
+                actions=self._actions,
+                reasons=self._reasons,
+            )
+        os.replace(tmp_path, path)
+        self.windows_written += 1
+
+
+def read_occupancy(directory):
+    """Sums the windows of an occupancy directory.
+
+    Args:
+        directory (str): Window directory written by :class:`OccupancyRecorder`.
+
+    Returns:
+        dict | None: ``occupancy`` (``(bins, bins)`` int64, rows Z, columns
+            X), ``actions``, ``reasons``, ``outside`` and ``steps`` summed over
+            all windows, plus ``bins``, ``extent`` and ``windows`` (the
+            ``first_step`` of each window).  ``None`` when there are no
+            windows.
+
+    Raises:
+        ValueError: If the windows do not share one grid.
+    """
+    paths = list_windows(directory)
+    if not paths:
+        return None
+    total = None
+    for path in paths:
+        with np.load(path) as window:
+            if total is None:
+                total = {
+                    "bins": int(window["bins"]),
+                    "extent": int(window["extent"]),
+                    "occupancy": np.zeros(window["occupancy"].shape, dtype=np.int64),
+                    "actions": np.zeros(0, dtype=np.int64),
+                    "reasons": np.zeros(len(TerminalReason), dtype=np.int64),
+                    "outside": 0,
+                    "steps": 0,
+                    "windows": [],
+                }
+            elif window["occupancy"].shape != total["occupancy"].shape or int(window["extent"]) != total["extent"]:
+                raise ValueError(f"{path} does not use the grid of {paths[0]}")
+            total["occupancy"] += window["occupancy"]
+            actions = window["actions"]
+            if len(actions) > len(total["actions"]):
+                total["actions"] = np.pad(total["actions"], (0, len(actions) - len(total["actions"])))
+            total["actions"][:len(actions)] += actions
+            total["reasons"] += window["reasons"]
+            total["outside"] += int(window["outside"])
+            total["steps"] += int(window["steps"])
+            total["windows"].append(int(window["first_step"]))
+    total["windows"] = np.asarray(total["windows"], dtype=np.int64)
+    return total
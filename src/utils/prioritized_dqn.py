@@ -0,0 +1,87 @@
+"""DQN training step for prioritized experience replay.
+
+:class:`PrioritizedDQN` is Stable-Baselines3's DQN whose ``train()`` works
+with :class:`~src.utils.replay_buffers.PrioritizedReplayBuffer`: the Huber
+loss of each sample is scaled by its importance-sampling weight, the
+absolute TD errors of the batch are written back as the new priorities, and
+the buffer's ``beta`` is annealed linearly from its initial value to 1 over
+``total_timesteps``.
+
+With any other replay buffer ``train()`` is DQN's, so the class can be used
+unconditionally.  With a frame-deduplicated buffer it also logs
+``train/replay_stale_fraction``, the share of stored transitions that can no
+longer be sampled (see
+:meth:`~src.utils.replay_buffers.FrameStackReplayBuffer.stale_fraction`).
+Everything else is inherited unchanged, and models load with ``DQN.load`` (e.g. in ``demo.py``) and vice versa.
+"""
+
+import numpy as np
+import torch as th
+from torch.nn import functional as F
+from stable_baselines3 import DQN
+from src.utils.replay_buffers import FrameStackReplayBuffer, PrioritizedReplayBuffer
+
+
+class PrioritizedDQN(DQN):
+    """DQN with importance-weighted updates for a prioritized replay buffer."""
+
+    def train(self, gradient_steps: int, batch_size: int = 100) -> None:
+        buffer = self.replay_buffer
+        if isinstance(buffer, FrameStackReplayBuffer):
+            # Capacity lost to frames overwritten at episode starts.
+            self.logger.record("train/replay_stale_fraction", buffer.stale_fraction())
+        if not isinstance(buffer, PrioritizedReplayBuffer):
+            return super().train(gradient_steps, batch_size)
+
+        # Switch to train mode (this affects batch norm / dropout)
+        self.policy.set_training_mode(True)
+        # Update learning rate according to schedule
+        self._update_learning_rate(self.policy.optimizer)
+        # Importance-sampling correction reaches 1 (unbiased) by the end.
+        buffer.beta = buffer.beta_start + (1.0 - buffer.beta_start) * (1.0 - self._current_progress_remaining)
+
+        losses, td_errors = [], []
+        for _ in range(gradient_steps):
+            replay_data = buffer.sample(batch_size, env=self._vec_normalize_env)
+            discounts = replay_data.discounts if replay_data.discounts is not None else self.gamma
+
+            with th.no_grad():
+                # Compute the next Q-values using the target network
+                next_q_values = self.q_net_target(replay_data.next_observations)
+                # Follow greedy policy: use the one with the highest value
+                next_q_values, _ = next_q_values.max(dim=1)
+                # Avoid potential broadcast issue
+                next_q_values = next_q_values.reshape(-1, 1)
+                # 1-step TD target
+                target_q_values = replay_data.rewards + (1 - replay_data.dones) * discounts * next_q_values
+
+            # Get current Q-values estimates
+            current_q_values = self.q_net(replay_data.observations)
+
+            # Retrieve the q-values for the actions from the replay buffer
+            current_q_values = th.gather(current_q_values, dim=1, index=replay_data.actions.long())
+
+            # Huber loss per sample, weighted to undo the sampling bias
+            elementwise = F.smooth_l1_loss(current_q_values, target_q_values, reduction="none")
+            loss = (replay_data.weights * elementwise).mean()
+            losses.append(loss.item())
+
+            # Optimize the policy
+            self.policy.optimizer.zero_grad()
+            loss.backward()
+            # Clip gradient norm
+            th.nn.utils.clip_grad_norm_(self.policy.parameters(), self.max_grad_norm)
+            self.policy.optimizer.step()
+
+            # New priorities from this batch's TD errors
+            td_error = (current_q_values - target_q_values).abs().detach().cpu().numpy().ravel()
+            buffer.update_priorities(replay_data.leaves, td_error)
+            td_errors.append(td_error.mean())
+
+        # Increase update counter
+        self._n_updates += gradient_steps
+
+        self.logger.record("train/n_updates", self._n_updates, exclude="tensorboard")
+        self.logger.record("train/loss", np.mean(losses))
+        self.logger.record("train/td_error", np.mean(td_errors))
+        self.logger.record("train/per_beta", buffer.beta)
@@ -0,0 +1,522 @@
+"""Replay buffers for stacked-frame observations.
+
+With ``VecFrameStack(n_stack=4)`` (or ``MKDSEnv(frame_stack=4)``) every
+observation is the last four frames of its env, so consecutive observations
+share three of their four frames.  SB3's ``ReplayBuffer`` stores the full
+``obs`` and ``next_obs`` stacks of every transition, i.e. each 84x84 frame up
+to eight times.
+
+:class:`FrameStackReplayBuffer` stores each frame **once per env stream** and
+rebuilds the stacks when a batch is sampled.  Per env it keeps a ring of
+single frames (the *stream*).  Every transition appends only the newest frame
+of ``next_obs`` and records that frame's stream index.  ``obs`` and
+``next_obs`` are then the two overlapping windows of ``n_stack`` frames
+ending just before / at that index.
+
+Episode boundaries need no masking.  When an env's stream does not continue
+(its first transition, the first after an episode end, or any ``obs`` that
+does not match the stream), all ``n_stack`` frames of ``obs`` are appended,
+including the zero padding of a reset stack.  So every window lies inside
+one episode and reproduces the original observations exactly.
+
+Memory per transition drops from ``2 * n_stack`` frames to a little over one
+(the stream is sized ``1 + stream_margin`` times the transition capacity to
+absorb the extra frames written at episode starts).  ``save_replay_buffer``
+files shrink by the same factor.  Plug it in with
+``DQN(..., replay_buffer_class=FrameStackReplayBuffer)``.
+
+:class:`MemmapReplayBuffer` keeps the same layout in ``numpy.memmap`` files
+(one ``.npy`` per array in a run directory), so the buffer can be larger than
+RAM and outlives the process: a new instance pointed at the same directory
+reopens it, positions included, with no separate save or load step.
+
+:class:`PrioritizedReplayBuffer` adds prioritized experience replay on top
+(sampling proportional to TD error, with importance-sampling weights), backed
+by the array-based :class:`SumTree`.  It needs
+:class:`~src.utils.prioritized_dqn.PrioritizedDQN` to feed TD errors back.
+"""
+
+import os
+from typing import NamedTuple, Optional
+import numpy as np
+import torch as th
+from stable_baselines3.common.buffers import BaseBuffer, ReplayBuffer
+from stable_baselines3.common.preprocessing import is_image_space, is_image_space_channels_first
+from stable_baselines3.common.type_aliases import ReplayBufferSamples
+
+
+class FrameStackReplayBuffer(ReplayBuffer):
+    """Replay buffer that stores stacked image observations one frame at a time.
+
+    Requires image observations stacked along the channel axis, channels
+    first (as seen by the policy after ``VecTransposeImage``) or last.  It
+    relies on consecutive observations of one env column being consecutive
+    stacks, as with ``VecFrameStack`` and SB3's synchronous collector.  It
+    does not fit the async partial-batch VecEnv, whose rows change workers
+    between steps.
+
+    Args:
+        buffer_size (int): Max number of transitions (across all envs).
+        observation_space (spaces.Box): Stacked image observation space.
+        action_space (spaces.Space): Action space.
+        device (th.device | str): PyTorch device for sampled batches.
+        n_envs (int): Number of parallel environments.
+        optimize_memory_usage (bool): Must be ``False``; this buffer already
+            avoids storing ``next_obs`` separately.
+        handle_timeout_termination (bool): As in SB3's ``ReplayBuffer``.
+        stream_margin (float): Extra frame capacity per env, as a fraction of
+            the transition capacity, for the frames written at episode
+            starts (``n_stack`` per episode, so at least ``n_stack`` / mean
+            episode length).  Transitions whose frames have been
+            overwritten are never sampled; :meth:`stale_fraction` reports
+            how many there are.
+
+    Attributes:
+        n_stack (int): Frames per observation.
+        frames (np.ndarray): ``(stream_size, n_envs, *frame_shape)`` frame
+            rings.
+        next_frame_idx (np.ndarray): ``(buffer_size, n_envs)`` absolute
+            stream index of each transition's newest ``next_obs`` frame.
+        stream_pos (np.ndarray): ``(n_envs,)`` frames written per stream.
+
+    Raises:
+        ValueError: For non-image observations or ``optimize_memory_usage``.
+    """
+
+    def __init__(self, buffer_size, observation_space, action_space, device="auto", n_envs=1,
+                 optimize_memory_usage=False, handle_timeout_termination=True, stream_margin=0.25):
+        if optimize_memory_usage:
+            raise ValueError("FrameStackReplayBuffer does not support optimize_memory_usage=True")
+        if not is_image_space(observation_space, check_channels=False):
+            raise ValueError("FrameStackReplayBuffer needs stacked image observations, "
+                             f"got {observation_space}")
+        # Skip ReplayBuffer.__init__: it would allocate full obs/next_obs arrays.
+        BaseBuffer.__init__(self, buffer_size, observation_space, action_space, device, n_envs=n_envs)
+        self.buffer_size = max(buffer_size // n_envs, 1)
+        self.optimize_memory_usage = False
+        self.handle_timeout_termination = handle_timeout_termination
+
+        self.stack_axis = 0 if is_image_space_channels_first(observation_space) else len(self.obs_shape) - 1
+        self.n_stack = self.obs_shape[self.stack_axis]
+        self.frame_shape = tuple(d for i, d in enumerate(self.obs_shape) if i != self.stack_axis)
+        self.stream_size = self.buffer_size + max(int(self.buffer_size * stream_margin), self.n_stack)
+
+        self._allocate()
+
+    def _allocate(self):
+        """Allocates the storage arrays through :meth:`_alloc`."""
+        n_envs = self.n_envs
+        self.frames = self._alloc("frames", (self.stream_size, n_envs, *self.frame_shape),
+                                  self.observation_space.dtype)
+        self.next_frame_idx = self._alloc("next_frame_idx", (self.buffer_size, n_envs), np.int64)
+        self.actions = self._alloc("actions", (self.buffer_size, n_envs, self.action_dim),
+                                   self._maybe_cast_dtype(self.action_space.dtype))
+        self.rewards = self._alloc("rewards", (self.buffer_size, n_envs), np.float32)
+        self.dones = self._alloc("dones", (self.buffer_size, n_envs), np.float32)
+        self.timeouts = self._alloc("timeouts", (self.buffer_size, n_envs), np.float32)
+        self.stream_pos = np.zeros(n_envs, dtype=np.int64)
+        self._restart = np.ones(n_envs, dtype=bool)  # Streams that must restart on the next add
+
+    def _alloc(self, name, shape, dtype):
+        """Creates one storage array; subclasses may back it differently.
+
+        Args:
+            name (str): Array name (``"frames"``, ``"actions"``, ...).
+            shape (tuple[int, ...]): Array shape.
+            dtype (np.dtype): Array dtype.
+
+        Returns:
+            np.ndarray: A zero-initialised array.
+        """
+        return np.zeros(shape, dtype=dtype)
+
+    def add(self, obs, next_obs, action, reward, done, infos):
+        n_envs, k, size = self.n_envs, self.n_stack, self.stream_size
+        obs = np.asarray(obs).reshape((n_envs, *self.obs_shape))
+        next_obs = np.asarray(next_obs).reshape((n_envs, *self.obs_shape))
+        obs_frames = np.moveaxis(obs, 1 + self.stack_axis, 1)  # (n_envs, k, *frame_shape)
+        next_newest = np.take(next_obs, k - 1, axis=1 + self.stack_axis)
+
+        # A stream continues only if obs is exactly its last k frames.
+        restart = self._restart.copy()
+        cont = np.flatnonzero(~restart)
+        if len(cont):
+            window = (self.stream_pos[cont, None] + np.arange(-k, 0)) % size
+            stored = self.frames[window, cont[:, None]]
+            mismatch = (stored != obs_frames[cont]).reshape(len(cont), -1).any(axis=1)
+            restart[cont[mismatch]] = True
+        for e in np.flatnonzero(restart):
+            self.frames[(self.stream_pos[e] + np.arange(k)) % size, e] = obs_frames[e]
+            self.stream_pos[e] += k
+
+        self.frames[self.stream_pos % size, np.arange(n_envs)] = next_newest
+        self.next_frame_idx[self.pos] = self.stream_pos
+        self.stream_pos += 1
+        # After an episode end, obs is a reset stack: start a new window.
+        self._restart = np.asarray(done, dtype=bool).reshape(n_envs).copy()
+
+        self.actions[self.pos] = np.asarray(action).reshape((n_envs, self.action_dim))
+        self.rewards[self.pos] = np.asarray(reward)
+        self.dones[self.pos] = np.asarray(done)
+        if self.handle_timeout_termination:
+            self.timeouts[self.pos] = np.array([info.get("TimeLimit.truncated", False) for info in infos])
+
+        self.pos += 1
+        if self.pos == self.buffer_size:
+            self.full = True
+            self.pos = 0
+
+    def sample(self, batch_size, env=None):
+        upper = self.buffer_size if self.full else self.pos
+        batch_inds = np.random.randint(0, upper, size=batch_size)
+        env_indices = np.random.randint(0, self.n_envs, size=batch_size)
+        # Redraw the (rare) transitions whose oldest frame has been overwritten.
+        stale = self._stale(batch_inds, env_indices)
+        while stale.any():
+            batch_inds[stale] = np.random.randint(0, upper, size=int(stale.sum()))
+            env_indices[stale] = np.random.randint(0, self.n_envs, size=int(stale.sum()))
+            stale = self._stale(batch_inds, env_indices)
+        return self._get_samples(batch_inds, env=env, env_indices=env_indices)
+
+    def stale_fraction(self):
+        """Fraction of the stored transitions whose oldest frame is overwritten.
+
+        These are skipped by :meth:`sample`, so the buffer effectively holds
+        ``1 - stale_fraction()`` of its transitions.  Above 0, episodes are
+        too short for ``stream_margin``.
+        """
+        upper = self.buffer_size if self.full else self.pos
+        if upper == 0:
+            return 0.0
+        oldest = self.next_frame_idx[:upper] - self.n_stack
+        return float(np.mean(oldest < self.stream_pos - self.stream_size))
+
+    def _stale(self, batch_inds, env_indices):
+        """Flags transitions whose oldest ``obs`` frame is no longer stored."""
+        oldest = self.next_frame_idx[batch_inds, env_indices] - self.n_stack
+        return oldest < self.stream_pos[env_indices] - self.stream_size
+
+    def _get_samples(self, batch_inds, env=None, env_indices=None):
+        if env_indices is None:
+            env_indices = np.random.randint(0, self.n_envs, size=len(batch_inds))
+
+        # One gather of k + 1 frames gives both stacks: obs = [0:k], next = [1:k+1].
+        newest = self.next_frame_idx[batch_inds, env_indices]
+        window = (newest[:, None] + np.arange(-self.n_stack, 1)) % self.stream_size
+        frames = self.frames[window, env_indices[:, None]]  # (batch, k + 1, *frame_shape)
+        obs = np.moveaxis(frames[:, :-1], 1, 1 + self.stack_axis)
+        next_obs = np.moveaxis(frames[:, 1:], 1, 1 + self.stack_axis)
+
+        data = (
+            self._normalize_obs(obs, env),
+            self.actions[batch_inds, env_indices, :],
+            self._normalize_obs(next_obs, env),
+            # Only use dones that are not due to timeouts
+            (self.dones[batch_inds, env_indices] * (1 - self.timeouts[batch_inds, env_indices])).reshape(-1, 1),
+            self._normalize_reward(self.rewards[batch_inds, env_indices].reshape(-1, 1), env),
+        )
+        return ReplayBufferSamples(*tuple(map(self.to_torch, data)))
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # A reloaded buffer is fed by freshly reset envs.
+        self._restart = np.ones(self.n_envs, dtype=bool)
+
+
+class MemmapReplayBuffer(FrameStackReplayBuffer):
+    """:class:`FrameStackReplayBuffer` stored in memory-mapped ``.npy`` files.
+
+    Every storage array is a ``numpy.memmap`` file in :attr:`directory`.
+    The write position and the per-env stream positions live in a small
+    ``meta.npy`` map updated on every :meth:`add`, so the files are always
+    self-consistent.  Only the pages touched by sampling and writing are
+    resident; the OS writes dirty pages back in the background (and on
+    :meth:`flush`).
+
+    Creating the buffer on a directory that already holds one reopens it
+    (e.g. ``DQN.load`` rebuilding the buffer from its saved
+    ``replay_buffer_kwargs``).  Pickling (``save_replay_buffer``) stores
+    only the configuration, and unpickling reopens the files.
+
+    Args:
+        directory (str): Directory holding the buffer files, normally
+            ``outputs/<run_id>/replay``.
+        **kwargs: As for :class:`FrameStackReplayBuffer`.
+
+    Raises:
+        ValueError: If the directory holds a buffer with a different layout
+            (buffer size, number of envs or observation shape).
+    """
+
+    _ARRAYS = ("frames", "next_frame_idx", "actions", "rewards", "dones", "timeouts", "stream_pos", "_meta")
+
+    def __init__(self, buffer_size, observation_space, action_space, device="auto", n_envs=1,
+                 optimize_memory_usage=False, handle_timeout_termination=True, stream_margin=0.25,
+                 directory="replay"):
+        self.directory = directory
+        super().__init__(buffer_size, observation_space, action_space, device=device, n_envs=n_envs,
+                         optimize_memory_usage=optimize_memory_usage,
+                         handle_timeout_termination=handle_timeout_termination, stream_margin=stream_margin)
+
+    def _allocate(self):
+        os.makedirs(self.directory, exist_ok=True)
+        # meta.npy is created last, so its presence marks a complete buffer.
+        existing = os.path.isfile(os.path.join(self.directory, "meta.npy"))
+        super()._allocate()
+        self._meta = self._alloc("meta", (2 + self.n_envs,), np.int64)
+        if existing:
+            self.pos = int(self._meta[0])
+            self.full = bool(self._meta[1])
+        # Stream positions are a view into the map: kept current for free.
+        self.stream_pos = self._meta[2:]
+
+    def _alloc(self, name, shape, dtype):
+        path = os.path.join(self.directory, f"{name}.npy")
+        if os.path.isfile(path):
+            array = np.lib.format.open_memmap(path, mode="r+")
+            if array.shape != tuple(shape) or array.dtype != np.dtype(dtype):
+                raise ValueError(f"{path} holds a {array.dtype} array of shape {array.shape}, expected "
+                                 f"{np.dtype(dtype)} {tuple(shape)}; delete {self.directory} to start a new buffer")
+            return array
+        return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=tuple(shape))
+
+    def add(self, obs, next_obs, action, reward, done, infos):
+        super().add(obs, next_obs, action, reward, done, infos)
+        self._meta[0] = self.pos
+        self._meta[1] = self.full
+
+    def flush(self):
+        """Writes dirty pages of every map back to disk."""
+        for name in self._ARRAYS:
+            array = getattr(self, name, None)
+            if isinstance(array, np.memmap):
+                array.flush()
+
+    def __getstate__(self):
+        self.flush()
+        state = self.__dict__.copy()
+        for name in self._ARRAYS:
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._allocate()
+
+
+class SumTree:
+    """Array-based binary sum tree over ``capacity`` non-negative values.
+
+    Node ``i`` has children ``2i`` and ``2i + 1``; the root is node 1 and
+    leaf ``j`` is node ``n_leaves + j``, with ``n_leaves`` the next power of
+    two (padding leaves stay 0).  Updates and searches are vectorised over
+    whole batches: one NumPy operation per tree level.
+
+    Args:
+        capacity (int): Number of leaves in use.
+
+    Attributes:
+        n_leaves (int): Leaf count (power of two >= ``capacity``).
+        depth (int): Levels below the root.
+        nodes (np.ndarray): ``(2 * n_leaves,)`` float64 node sums.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.depth = max(int(np.ceil(np.log2(max(capacity, 1)))), 0)
+        self.n_leaves = 1 << self.depth
+        self.nodes = np.zeros(2 * self.n_leaves, dtype=np.float64)
+
+    @property
+    def total(self):
+        """Sum of all leaves."""
+        return self.nodes[1]
+
+    def get(self, leaves):
+        """Returns the values of ``leaves``."""
+        return self.nodes[self.n_leaves + np.asarray(leaves)]
+
+    def update(self, leaves, values):
+        """Sets ``leaves`` to ``values`` and refreshes their ancestors.
+
+        Args:
+            leaves (np.ndarray): Leaf indices (duplicates: the last wins).
+            values (np.ndarray): New non-negative values.
+        """
+        nodes = self.n_leaves + np.asarray(leaves, dtype=np.int64)
+        self.nodes[nodes] = values
+        for _ in range(self.depth):
+            nodes = np.unique(nodes >> 1)
+            self.nodes[nodes] = self.nodes[2 * nodes] + self.nodes[2 * nodes + 1]
+
+    def find(self, values):
+        """Finds, for each value in ``[0, total)``, the leaf whose prefix sum range contains it.
+
+        Args:
+            values (np.ndarray): Query values.
+
+        Returns:
+            np.ndarray: Leaf indices (int64).
+        """
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = self.nodes[2 * nodes]
+            right = values >= left
+            values -= left * right
+            nodes = 2 * nodes + right
+        return nodes - self.n_leaves
+
+    def rebuild(self):
+        """Recomputes every inner node from the leaves."""
+        n = self.n_leaves // 2
+        while n >= 1:
+            self.nodes[n:2 * n] = self.nodes[2 * n:4 * n:2] + self.nodes[2 * n + 1:4 * n:2]
+            n //= 2
+
+
+class PrioritizedReplayBufferSamples(NamedTuple):
+    """``ReplayBufferSamples`` plus importance-sampling weights and leaf ids."""
+
+    observations: th.Tensor
+    actions: th.Tensor
+    next_observations: th.Tensor
+    dones: th.Tensor
+    rewards: th.Tensor
+    discounts: Optional[th.Tensor] = None
+    weights: Optional[th.Tensor] = None  # (batch, 1), max-normalised
+    leaves: Optional[np.ndarray] = None  # Pass back to update_priorities()
+
+
+class PrioritizedReplayBuffer(FrameStackReplayBuffer):
+    """Proportional prioritized replay over a :class:`FrameStackReplayBuffer`.
+
+    Transition ``i`` is sampled with probability ``p_i^alpha / sum_k p_k^alpha``
+    where ``p_i = |TD error| + epsilon`` from its last update (new
+    transitions get the highest priority seen so far).  Batches are
+    stratified: the priority mass is split into ``batch_size`` equal
+    segments and one value is drawn per segment.  Each sample carries the
+    importance-sampling weight ``(N * P(i))^-beta``, normalised by the
+    batch maximum.  ``beta`` is annealed to 1 by
+    :class:`~src.utils.prioritized_dqn.PrioritizedDQN`.
+
+    Leaf ``pos * n_envs + env`` of :attr:`tree` holds the priority of
+    transition ``(pos, env)``.  Transitions whose frames have been
+    overwritten in the stream get priority 0 until their row is reused.
+
+    Args:
+        alpha (float): Priority exponent (0 = uniform).
+        beta (float): Initial importance-sampling exponent.
+        epsilon (float): Added to ``|TD error|`` so no priority is 0.
+        **kwargs: As for :class:`FrameStackReplayBuffer`.
+
+    Attributes:
+        tree (SumTree): Priorities ``p^alpha`` of all transitions.
+        max_priority (float): Largest ``p`` so far (before ``alpha``).
+        max_redraws (int): Rounds of redrawing invalid leaves from the tree
+            before the rest of a batch is drawn uniformly.
+    """
+
+    max_redraws = 32
+
+    def __init__(self, buffer_size, observation_space, action_space, device="auto", n_envs=1,
+                 optimize_memory_usage=False, handle_timeout_termination=True, stream_margin=0.25,
+                 alpha=0.6, beta=0.4, epsilon=1e-6):
+        super().__init__(buffer_size, observation_space, action_space, device=device, n_envs=n_envs,
+                         optimize_memory_usage=optimize_memory_usage,
+                         handle_timeout_termination=handle_timeout_termination, stream_margin=stream_margin)
+        self.alpha = alpha
+        self.beta_start = beta
+        self.beta = beta
+        self.epsilon = epsilon
+        self.tree = SumTree(self.buffer_size * self.n_envs)
+        self.max_priority = 1.0
+
+    def add(self, obs, next_obs, action, reward, done, infos):
+        leaves = self.pos * self.n_envs + np.arange(self.n_envs)
+        super().add(obs, next_obs, action, reward, done, infos)
+        self.tree.update(leaves, np.full(self.n_envs, self.max_priority ** self.alpha))
+
+    def sample(self, batch_size, env=None):
+        # One value per equal slice of the priority mass.
+        bounds = np.linspace(0.0, self.tree.total, batch_size + 1)
+        leaves = self.tree.find(bounds[:-1] + np.random.random(batch_size) * np.diff(bounds))
+        bad = self._invalid(leaves)
+        for _ in range(self.max_redraws):
+            if not bad.any():
+                break
+            # Rounding can land on an empty leaf; stale transitions are
+            # retired.  Redraw those from the whole mass.
+            stale = leaves[bad][self.tree.get(leaves[bad]) > 0]
+            if len(stale):
+                self.tree.update(stale, np.zeros(len(stale)))
+            if self.tree.total <= 0:
+                break
+            leaves[bad] = self.tree.find(np.random.random(int(bad.sum())) * self.tree.total)
+            bad = self._invalid(leaves)
+        if bad.any():
+            leaves[bad] = self._sample_uniform(int(bad.sum()))
+
+        batch_inds, env_indices = np.divmod(leaves, self.n_envs)
+        probs = self.tree.get(leaves) / self.tree.total
+        weights = (self.size() * self.n_envs * probs) ** -self.beta
+        weights /= weights.max()
+
+        samples = self._get_samples(batch_inds, env=env, env_indices=env_indices)
+        return PrioritizedReplayBufferSamples(**samples._asdict(),
+                                              weights=self.to_torch(weights.reshape(-1, 1).astype(np.float32)),
+                                              leaves=leaves)
+
+    def _sample_uniform(self, n):
+        """Draws ``n`` leaves uniformly from the sampleable transitions.
+
+        The fallback when the tree has no mass left to draw from (every
+        remaining priority is 0 or stale): those transitions get the max
+        priority again, so the weights stay finite and later batches are
+        drawn from the tree.
+
+        Raises:
+            RuntimeError: If no stored transition can be sampled.
+        """
+        filled = self.buffer_size if self.full else self.pos
+        valid = np.arange(filled * self.n_envs)
+        valid = valid[~self._stale(*np.divmod(valid, self.n_envs))]
+        if not len(valid):
+            raise RuntimeError("No transition in the replay buffer can be sampled")
+        if self.tree.total <= 0:
+            self.tree.update(valid, np.full(len(valid), self.max_priority ** self.alpha))
+        leaves = np.random.choice(valid, n)
+        empty = leaves[self.tree.get(leaves) <= 0]
+        if len(empty):
+            self.tree.update(empty, np.full(len(empty), self.max_priority ** self.alpha))
+        return leaves
+
+    def _invalid(self, leaves):
+        """Flags leaves that are empty, padding, or stale transitions."""
+        bad = (leaves >= self.tree.capacity) | (self.tree.get(leaves) <= 0)
+        ok = np.flatnonzero(~bad)
+        bad[ok] = self._stale(*np.divmod(leaves[ok], self.n_envs))
+        return bad
+
+    def update_priorities(self, leaves, td_errors):
+        """Sets the priorities of sampled transitions from their TD errors.
+
+        Args:
+            leaves (np.ndarray): ``leaves`` of the sampled batch.
+            td_errors (np.ndarray): Absolute TD errors, one per leaf.
+        """
+        priorities = np.abs(td_errors) + self.epsilon
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.tree.update(leaves, priorities ** self.alpha)
+
+    def reset_priorities(self):
+        """Gives every stored transition the max priority.
+
+        For buffers filled without :meth:`add`, e.g. replayed from a
+        checkpoint segment log.
+        """
+        filled = self.buffer_size if self.full else self.pos
+        self.tree.nodes[:] = 0.0
+        self.tree.nodes[self.tree.n_leaves:self.tree.n_leaves + filled * self.n_envs] = \
+            self.max_priority ** self.alpha
+        self.tree.rebuild()
@@ -0,0 +1,408 @@
+"""Incremental replay buffer checkpoints as an append-only segment log.
+
+``save_replay_buffer`` pickles the whole buffer, so every checkpoint rewrites
+(and stalls training for) data that has not changed since the last one.
+:class:`ReplaySegmentLog` writes only what was added since the previous
+checkpoint:
+
+* Each :meth:`~ReplaySegmentLog.write_segment` saves the transition rows (and,
+  for :class:`~src.utils.replay_buffers.FrameStackReplayBuffer`, the stream
+  frames) written since the last segment as one ``.npz`` file, tagged with
+  their absolute positions.
+* ``manifest.json`` lists the segments in order with the buffer layout and
+  write positions.  It is replaced atomically after the segment is on disk,
+  so a crash mid-write leaves the previous checkpoint intact.
+* Opening a log on an empty buffer replays the segments in order, which
+  restores the ring exactly (later segments overwrite what earlier ones
+  wrote to the same slots).
+* Segments whose data has since been overwritten in the ring are deleted,
+  and mostly-overwritten ones are rewritten with their live tail only, so
+  the log stays about one buffer in size.
+
+Layout on disk::
+
+    <run>/models/replay_segments/
+        manifest.json
+        segment_000041.npz
+        segment_000042.npz
+        ...
+
+Rows are counted by watching the buffer's ``pos``, which works for any
+collector as long as :meth:`~ReplaySegmentLog.track` runs at least once per
+``buffer_size`` added rows (the callback calls it every step).
+
+With a :class:`~src.utils.checkpoint_writer.AsyncCheckpointWriter`, only the
+gathering of the new rows (a copy) happens on the training thread; file
+writes, trims, manifest updates and deletions are queued in order.  If a
+segment write fails there, the manifest updates and deletions queued after
+it are skipped (the file on disk keeps describing segments that exist), and
+the next :meth:`~ReplaySegmentLog.write_segment` starts over with one
+segment holding the whole buffer.
+"""
+
+import os
+import json
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+SEGMENT_NAME = "segment_{:06d}.npz"
+
+# Per-transition arrays, indexed by ``pos`` on axis 0 (SB3's ReplayBuffer and
+# FrameStackReplayBuffer); the ones a buffer does not have are skipped.
+ROW_ARRAYS = ("observations", "next_observations", "next_frame_idx", "actions", "rewards", "dones", "timeouts")
+
+# Segments more than this fraction overwritten are rewritten during compaction.
+TRIM_FRACTION = 0.5
+
+
+class ReplaySegmentLog:
+    """Append-only checkpoint log of one replay buffer.
+
+    Opening a directory that holds a log for the same buffer layout replays
+    it into ``replay_buffer`` (which should be freshly created, i.e. empty).
+    Otherwise a new log is started; if the buffer already holds data, the
+    first segment saves all of it.  The segments of a log with a different
+    layout (e.g. another ``buffer_size`` or ``n_envs``) are left untouched
+    until the new log's first manifest replaces theirs.
+
+    Args:
+        directory (str): Log directory (created if needed).
+        replay_buffer (ReplayBuffer): Buffer to checkpoint.  SB3's
+            ``ReplayBuffer`` (without ``optimize_memory_usage``) and
+            :class:`~src.utils.replay_buffers.FrameStackReplayBuffer` are
+            supported.
+        writer (AsyncCheckpointWriter | None): Runs the file operations in
+            the background; synchronous when ``None``.
+
+    Attributes:
+        rows_added (int): Transition rows added to the buffer over its whole
+            life (not capped at ``buffer_size``).
+        restored (int): Transition rows replayed into the buffer on open.
+        saved (bool): Whether the manifest on disk covers every row the
+            buffer held when the log was opened.  ``False`` only for a
+            buffer loaded some other way (e.g. a replay buffer pickle) until
+            the first segment and its manifest are written.
+        on_saved (Callable[[], None] | None): Called once when
+            :attr:`saved` becomes ``True`` (on the writer thread, if any).
+
+    Raises:
+        ValueError: If the buffer uses ``optimize_memory_usage``.
+    """
+
+    def __init__(self, directory, replay_buffer, writer=None):
+        if getattr(replay_buffer, "optimize_memory_usage", False):
+            raise ValueError("ReplaySegmentLog does not support optimize_memory_usage=True")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.buffer = replay_buffer
+        self.writer = writer
+        self.rows = [name for name in ROW_ARRAYS if getattr(replay_buffer, name, None) is not None]
+        self.has_frames = hasattr(replay_buffer, "frames")
+        self.restored = 0
+        self.on_saved = None
+        # Segment writes that failed (counted on the writer thread) and how
+        # many of those write_segment has already recovered from.
+        self._failed = 0
+        self._handled = 0
+
+        # Segments of a log with another layout, deleted once the new log's
+        # manifest is on disk (until then, resuming still finds them).
+        self._superseded = []
+        next_segment = 0
+
+        manifest = self._read_manifest()
+        if manifest is not None and manifest["layout"] != self._layout():
+            old = manifest["layout"]
+            logger.warning(
+                f"Replay log in {directory} was written for a {old['class']} of "
+                f"{old['buffer_size'] * old['n_envs']} transitions with {old['n_envs']} envs, not for this "
+                "buffer; starting a new log, which replaces it at the next replay checkpoint. "
+                "Stop now and resume with the original --buffer-size / --n-envs to keep it.")
+            self._superseded = manifest["segments"]
+            # New file names must not collide with the old segments.
+            next_segment = manifest["next_segment"]
+            manifest = None
+
+        if manifest is not None:
+            self.manifest = manifest
+            self._replay()
+            self.saved = True
+        else:
+            # A buffer loaded some other way: its live rows are "unsaved".
+            size, pos = self.buffer.buffer_size, self.buffer.pos
+            rows_added = size + pos if self.buffer.full else pos
+            self.manifest = {
+                "layout": self._layout(),
+                "rows_added": rows_added,
+                "saved_rows": rows_added - (size if self.buffer.full else pos),
+                "stream_pos": self._stream_pos(),
+                "saved_frames": self._oldest_frames(),
+                "next_segment": next_segment,
+                "segments": [],
+            }
+            self.saved = rows_added == 0
+        self.rows_added = self.manifest["rows_added"]
+        self._last_pos = self.buffer.pos
+
+    @staticmethod
+    def exists(directory):
+        """Returns ``True`` if ``directory`` holds a segment log."""
+        return os.path.isfile(os.path.join(directory, MANIFEST_NAME))
+
+    def track(self):
+        """Counts the rows added since the previous call (cheap, call every step)."""
+        pos = self.buffer.pos
+        self.rows_added += (pos - self._last_pos) % self.buffer.buffer_size
+        self._last_pos = pos
+
+    def write_segment(self):
+        """Saves everything added since the last segment, then compacts.
+
+        Returns:
+            int: Transition rows written (0 if nothing was added).
+        """
+        self.track()
+        buffer, manifest = self.buffer, self.manifest
+        size = buffer.buffer_size
+
+        recover = self._failed > self._handled
+        if recover:
+            # Some queued segment never reached the disk, so the in-memory
+            # manifest lists data that does not exist: save the whole buffer
+            # again and drop every other file once the new manifest is out.
+            logger.warning(f"A replay segment write in {self.directory} failed; "
+                           "saving the whole buffer in the next segment")
+            self._handled = self._failed
+            manifest["segments"] = []
+            manifest["saved_rows"] = self.rows_added - min(self.rows_added, size)
+            manifest["saved_frames"] = self._oldest_frames()
+
+        # Rows end just before pos; at most one ring's worth is still live.
+        n_rows = min(self.rows_added - manifest["saved_rows"], size)
+        row_start = self.rows_added - n_rows
+        arrays, entry = {}, {"row_start": row_start, "rows": n_rows}
+        if n_rows:
+            idx = (row_start + np.arange(n_rows)) % size
+            for name in self.rows:
+                arrays[f"row_{name}"] = getattr(buffer, name)[idx]
+
+        stream_pos = self._stream_pos()
+        if self.has_frames:
+            # Per env stream: frames written since the last segment, capped
+            # at what the ring still holds.
+            start = np.maximum(np.asarray(manifest["saved_frames"]), np.asarray(stream_pos) - buffer.stream_size)
+            count = np.asarray(stream_pos) - start
+            arrays["frames"] = np.concatenate([
+                buffer.frames[(start[e] + np.arange(count[e])) % buffer.stream_size, e]
+                for e in range(buffer.n_envs)
+            ])
+            entry["frame_start"] = start.tolist()
+            entry["frame_count"] = count.tolist()
+
+        if not n_rows and not (self.has_frames and np.any(entry["frame_count"])):
+            return 0
+
+        entry["file"] = SEGMENT_NAME.format(manifest["next_segment"])
+        self._io(self._guarded, self._save_segment, entry["file"], arrays)
+
+        manifest["next_segment"] += 1
+        manifest["segments"].append(entry)
+        manifest["rows_added"] = self.rows_added
+        manifest["saved_rows"] = self.rows_added
+        manifest["stream_pos"] = stream_pos
+        manifest["saved_frames"] = stream_pos
+        self.compact()
+        if recover:
+            self._io(self._remove_unlisted, [e["file"] for e in manifest["segments"]], self._handled)
+        return n_rows
+
+    def compact(self):
+        """Drops overwritten segments and trims mostly-overwritten ones.
+
+        The manifest is written before any file is deleted, so an
+        interruption leaves at worst an unreferenced file behind.  Which
+        segments to drop is decided from the manifest alone, so it does not
+        wait for queued writes; both steps are skipped if a segment write
+        queued before them failed.
+        """
+        live_row = self.manifest["rows_added"] - self.buffer.buffer_size
+        live_frame = (np.asarray(self.manifest["stream_pos"]) - self.buffer.stream_size) if self.has_frames else None
+
+        keep, dead = [], []
+        for entry in self.manifest["segments"]:
+            row_skip = int(np.clip(live_row - entry["row_start"], 0, entry["rows"]))
+            total, skipped = entry["rows"], row_skip
+            frame_skip = None
+            if self.has_frames:
+                count = np.asarray(entry["frame_count"])
+                frame_skip = np.clip(live_frame - np.asarray(entry["frame_start"]), 0, count)
+                total += int(count.sum())
+                skipped += int(frame_skip.sum())
+            if skipped == total:
+                dead.append(entry)
+            elif skipped > TRIM_FRACTION * total:
+                keep.append(self._trim(entry, row_skip, frame_skip))
+                dead.append(entry)
+            else:
+                keep.append(entry)
+
+        self.manifest["segments"] = keep
+        self._io(self._write_manifest, json.dumps(self.manifest, indent=1), self._handled)
+        self._io(self._remove_segments, dead, self._handled)
+
+    # ------------------------------------------------------------------ #
+    # Internals                                                           #
+    # ------------------------------------------------------------------ #
+
+    def _layout(self):
+        """JSON description of the buffer storage a log must match."""
+        buffer = self.buffer
+        layout = {
+            "class": type(buffer).__name__,
+            "buffer_size": int(buffer.buffer_size),
+            "n_envs": int(buffer.n_envs),
+            "rows": {name: [list(getattr(buffer, name).shape[1:]), getattr(buffer, name).dtype.str]
+                     for name in self.rows},
+        }
+        if self.has_frames:
+            layout["frames"] = [list(buffer.frames.shape), buffer.frames.dtype.str]
+        return layout
+
+    def _stream_pos(self):
+        return self.buffer.stream_pos.tolist() if self.has_frames else None
+
+    def _oldest_frames(self):
+        """Absolute index of the oldest frame each stream still holds."""
+        if not self.has_frames:
+            return None
+        return np.maximum(self.buffer.stream_pos - self.buffer.stream_size, 0).tolist()
+
+    def _replay(self):
+        """Writes every segment back into the (empty) buffer, oldest first."""
+        buffer, manifest = self.buffer, self.manifest
+        size = buffer.buffer_size
+        for entry in manifest["segments"]:
+            path = os.path.join(self.directory, entry["file"])
+            if not os.path.isfile(path):
+                # Only a log written before failed writes were detected can
+                # list a missing file; restore what is there.
+                logger.warning(f"Replay segment {path} is missing; its transitions are not restored")
+                continue
+            with np.load(path) as segment:
+                if entry["rows"]:
+                    idx = (entry["row_start"] + np.arange(entry["rows"])) % size
+                    for name in self.rows:
+                        getattr(buffer, name)[idx] = segment[f"row_{name}"]
+                if self.has_frames:
+                    frames, offset = segment["frames"], 0
+                    for e, (start, count) in enumerate(zip(entry["frame_start"], entry["frame_count"])):
+                        idx = (start + np.arange(count)) % buffer.stream_size
+                        buffer.frames[idx, e] = frames[offset:offset + count]
+                        offset += count
+
+        rows_added = manifest["rows_added"]
+        buffer.pos = rows_added % size
+        buffer.full = rows_added >= size
+        if self.has_frames:
+            buffer.stream_pos[:] = manifest["stream_pos"]
+        if hasattr(buffer, "reset_priorities"):
+            # Priorities are not logged; restored transitions start at max.
+            buffer.reset_priorities()
+        self.restored = min(rows_added, size) * buffer.n_envs
+
+    def _io(self, fn, *args):
+        """Runs a file operation, in order on the writer thread if there is one."""
+        if self.writer is None:
+            fn(*args)
+        else:
+            self.writer.submit(fn, *args)
+
+    def _trim(self, entry, row_skip, frame_skip):
+        """Returns the manifest entry of ``entry`` without its overwritten part.
+
+        The new file is written by :meth:`_rewrite_segment`.
+        """
+        trimmed = {"row_start": entry["row_start"] + row_skip, "rows": entry["rows"] - row_skip}
+        if self.has_frames:
+            trimmed["frame_start"] = (np.asarray(entry["frame_start"]) + frame_skip).tolist()
+            trimmed["frame_count"] = (np.asarray(entry["frame_count"]) - frame_skip).tolist()
+        trimmed["file"] = SEGMENT_NAME.format(self.manifest["next_segment"])
+        self.manifest["next_segment"] += 1
+        self._io(self._guarded, self._rewrite_segment, entry, trimmed["file"], row_skip, frame_skip)
+        return trimmed
+
+    def _guarded(self, fn, *args):
+        """Runs a segment write, counting a failure before re-raising it."""
+        try:
+            fn(*args)
+        except Exception:
+            self._failed += 1
+            raise
+
+    def _rewrite_segment(self, entry, name, row_skip, frame_skip):
+        """Copies the live part of segment ``entry`` to a new file ``name``."""
+        with np.load(os.path.join(self.directory, entry["file"])) as segment:
+            arrays = {key: segment[key][row_skip:] for key in segment.files if key.startswith("row_")}
+            if self.has_frames:
+                count = np.asarray(entry["frame_count"])
+                offsets = np.concatenate([[0], np.cumsum(count)[:-1]])
+                arrays["frames"] = np.concatenate([
+                    segment["frames"][offsets[e] + frame_skip[e]:offsets[e] + count[e]]
+                    for e in range(len(count))
+                ])
+        self._save_segment(name, arrays)
+
+    def _save_segment(self, name, arrays):
+        path = os.path.join(self.directory, name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    def _read_manifest(self):
+        path = os.path.join(self.directory, MANIFEST_NAME)
+        if not os.path.isfile(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _write_manifest(self, text, handled=0):
+        if self._failed > handled:
+            # The manifest would list a segment that was never written.
+            return
+        path = os.path.join(self.directory, MANIFEST_NAME)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+        if self._superseded:
+            self._remove_segments(self._superseded, handled)
+            self._superseded = []
+        if not self.saved:
+            # The first segment (all rows the buffer was loaded with) is on
+            # disk: whatever the buffer was loaded from is no longer needed.
+            self.saved = True
+            if self.on_saved is not None:
+                self.on_saved()
+
+    def _remove_unlisted(self, names, handled):
+        """Deletes the segment files (and partial writes) not in ``names``."""
+        if self._failed > handled:
+            return
+        prefix = SEGMENT_NAME.split("{")[0]
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix) and name not in names:
+                os.remove(os.path.join(self.directory, name))
+
+    def _remove_segments(self, entries, handled=0):
+        if self._failed > handled:
+            # The manifest on disk still lists these.
+            return
+        for entry in entries:
+            try:
+                os.remove(os.path.join(self.directory, entry["file"]))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,481 @@
+"""SQLite index of the training runs in ``outputs/`` and ``logs/``.
+
+The resume menu, ``--resume``, the demo model menu and both analysis scripts
+used to find runs by listing ``outputs/`` or ``logs/`` and ``stat``-ing,
+globbing or walking every run folder, each on its own.  :class:`RunIndex`
+keeps one database, ``outputs/run_index.sqlite``, with:
+
+* ``runs`` -- one row per ``outputs/<run_id>`` folder and its latest
+  checkpoint;
+* ``checkpoints`` -- every checkpoint of the run manifest (path, global
+  step, time, score, size);
+* ``telemetry_shards`` -- the telemetry shards (rows, first and last step);
+* ``episode_summaries`` -- per-run totals of ``logs/episodes.csv``
+  (episodes, steps, reward sum and maximum, last step);
+* ``tb_runs`` / ``event_files`` -- the TensorBoard run folders and their
+  ``tfevents`` files, with the run each belongs to.
+
+Training keeps it current as it writes: the run manifest records its
+checkpoints after every save, the telemetry writer each shard, and the
+metrics callback the episode rows it appends (see
+:class:`~src.utils.callbacks.MKDSMetricsCallback`).
+
+:meth:`RunIndex.sync` catches up with anything written without it (older
+runs, copied or deleted folders, a failed update).  It lists ``outputs/``
+(and ``logs/``) once and compares a few modification times and sizes per
+run with the ones stored when the run was last read; only the parts that
+differ are read again: the manifest, new shards, the end of the episode
+table, a TensorBoard folder.  With hundreds of runs a sync is a few
+thousand ``stat`` calls and one transaction, and menus and cross-run
+queries are single SQL queries.
+
+The database is a cache of what is on disk: deleting it is safe, the next
+sync rebuilds it.  Index updates made during training never interrupt it:
+the update methods log any error (database, file or parse) and return,
+and the next sync repairs what they missed.
+"""
+
+import os
+import csv
+import sqlite3
+import logging
+import threading
+import numpy as np
+from src.utils.run_manifest import MANIFEST_NAME, RunManifest
+from src.utils.telemetry_store import list_shards
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "run_index.sqlite"
+
+# Bumped when the schema changes; an older index is dropped and rebuilt.
+SCHEMA_VERSION = 1
+
+_TABLES = ("event_files", "tb_runs", "episode_summaries", "telemetry_shards", "checkpoints", "runs")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    latest TEXT,                  -- Latest checkpoint, relative to the run folder
+    latest_step INTEGER,
+    manifest_mtime_ns INTEGER,    -- Stamps of what was last read (see sync())
+    models_mtime_ns INTEGER,
+    telemetry_mtime_ns INTEGER
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    run_id TEXT NOT NULL REFERENCES runs ON DELETE CASCADE,
+    path TEXT NOT NULL,           -- Relative to the run folder
+    step INTEGER,
+    time REAL,
+    score REAL,
+    bytes INTEGER,
+    PRIMARY KEY (run_id, path)
+);
+CREATE TABLE IF NOT EXISTS telemetry_shards (
+    run_id TEXT NOT NULL REFERENCES runs ON DELETE CASCADE,
+    path TEXT NOT NULL,           -- Relative to the run folder
+    rows INTEGER,
+    first_step INTEGER,
+    last_step INTEGER,
+    PRIMARY KEY (run_id, path)
+);
+CREATE TABLE IF NOT EXISTS episode_summaries (
+    run_id TEXT PRIMARY KEY REFERENCES runs ON DELETE CASCADE,
+    csv_offset INTEGER NOT NULL DEFAULT 0,  -- Bytes of episodes.csv counted
+    episodes INTEGER NOT NULL DEFAULT 0,
+    steps INTEGER NOT NULL DEFAULT 0,
+    reward_sum REAL NOT NULL DEFAULT 0,
+    reward_max REAL,
+    last_step INTEGER
+);
+CREATE TABLE IF NOT EXISTS tb_runs (
+    tb_dir TEXT PRIMARY KEY,      -- Absolute path
+    parent TEXT NOT NULL,         -- TensorBoard log directory holding it
+    name TEXT NOT NULL,
+    run_id TEXT,
+    mtime_ns INTEGER
+);
+CREATE INDEX IF NOT EXISTS tb_runs_parent ON tb_runs (parent);
+CREATE TABLE IF NOT EXISTS event_files (
+    path TEXT PRIMARY KEY,        -- Absolute path
+    tb_dir TEXT NOT NULL REFERENCES tb_runs ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS event_files_dir ON event_files (tb_dir);
+"""
+
+_RUNS_QUERY = """
+SELECT r.run_id, r.latest, r.latest_step,
+       (SELECT COUNT(*) FROM checkpoints c WHERE c.run_id = r.run_id) AS checkpoints,
+       (SELECT MAX(score) FROM checkpoints c WHERE c.run_id = r.run_id) AS best_score,
+       (SELECT COUNT(*) FROM telemetry_shards t WHERE t.run_id = r.run_id) AS shards,
+       (SELECT COALESCE(SUM(rows), 0) FROM telemetry_shards t WHERE t.run_id = r.run_id) AS telemetry_rows,
+       COALESCE(e.episodes, 0) AS episodes,
+       COALESCE(e.steps, 0) AS episode_steps,
+       e.reward_sum / NULLIF(e.episodes, 0) AS mean_reward,
+       e.reward_max AS max_reward,
+       e.last_step
+FROM runs r LEFT JOIN episode_summaries e USING (run_id)
+"""
+
+
+def _mtime_ns(path):
+    """Modification time of ``path`` in ns, or ``None`` if it does not exist."""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _size(path):
+    """Size of ``path`` in bytes (``0`` if it does not exist)."""
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return 0
+
+
+def tb_run_id(name):
+    """Run ID of a TensorBoard folder: SB3 names it ``<tb_log_name>_<N>``."""
+    base, _, suffix = name.rpartition("_")
+    return base if base and suffix.isdigit() else name
+
+
+class RunIndex:
+    """Index of the runs under an ``outputs/`` (and ``logs/``) directory.
+
+    Each thread uses its own connection; the database is in WAL mode, so
+    analysis scripts can query it while training writes to it.
+
+    Args:
+        outputs_dir (str): Runs directory (``outputs/``), created if needed.
+        logs_dir (str | None): TensorBoard log directory synced by
+            :meth:`sync`; ``None`` syncs the runs only.
+        path (str | None): Database file; defaults to
+            ``<outputs_dir>/run_index.sqlite``.
+    """
+
+    def __init__(self, outputs_dir="outputs", logs_dir=None, path=None):
+        self.outputs_dir = os.path.abspath(outputs_dir)
+        self.logs_dir = os.path.abspath(logs_dir) if logs_dir else None
+        self.path = path or os.path.join(self.outputs_dir, INDEX_NAME)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+
+        db = self._db()
+        if db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            with db:
+                for table in _TABLES:
+                    db.execute(f"DROP TABLE IF EXISTS {table}")
+        db.executescript(_SCHEMA)
+        db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        db.execute("PRAGMA journal_mode = WAL")
+
+    def _db(self):
+        """This thread's connection (opened on first use)."""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA foreign_keys = ON")
+            db.execute("PRAGMA synchronous = NORMAL")
+            self._local.db = db
+        return db
+
+    def run_dir(self, run_id):
+        """Folder of a run (``<outputs_dir>/<run_id>``)."""
+        return os.path.join(self.outputs_dir, run_id)
+
+    # --- Catching up with the disk ---
+
+    def sync(self):
+        """Brings the index up to date with ``outputs/`` (and ``logs/``).
+
+        Runs whose folder is gone are dropped, new ones read in full, and
+        for the others only what changed since they were last read.
+
+        Returns:
+            RunIndex: ``self``, for chaining.
+        """
+        with os.scandir(self.outputs_dir) as entries:
+            names = {entry.name for entry in entries if entry.is_dir()}
+        db = self._db()
+        with db:
+            known = {row["run_id"]: row for row in db.execute("SELECT * FROM runs")}
+            for run_id in known.keys() - names:
+                db.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+            for run_id in sorted(names):
+                self._refresh(db, run_id, known.get(run_id))
+        if self.logs_dir is not None:
+            self._sync_logs()
+        return self
+
+    def refresh_run(self, run_id):
+        """Syncs one run.
+
+        Returns:
+            bool: ``True`` if the run folder exists.
+        """
+        db = self._db()
+        with db:
+            if not os.path.isdir(self.run_dir(run_id)):
+                db.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+                return False
+            row = db.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+            self._refresh(db, run_id, row)
+        return True
+
+    def _refresh(self, db, run_id, row):
+        """Reads the parts of a run whose stamps differ from ``row``."""
+        run_dir = self.run_dir(run_id)
+        if row is None:
+            self._add_run(db, run_id)
+            row = {"manifest_mtime_ns": None, "models_mtime_ns": None, "telemetry_mtime_ns": None}
+
+        # Checkpoints: a save rewrites the manifest, a write or a deletion
+        # (pruning, or by hand) changes the models folder.
+        if ((_mtime_ns(os.path.join(run_dir, MANIFEST_NAME)), _mtime_ns(os.path.join(run_dir, "models")))
+                != (row["manifest_mtime_ns"], row["models_mtime_ns"])):
+            manifest = RunManifest(run_dir, run_id=run_id)
+            checkpoints = [c for c in manifest.data["checkpoints"]
+                           if os.path.isfile(os.path.join(run_dir, c["path"]))]
+            self._write_checkpoints(db, run_id, checkpoints)
+
+        telemetry_dir = os.path.join(run_dir, "logs", "telemetry")
+        telemetry_mtime = _mtime_ns(telemetry_dir)
+        if telemetry_mtime != row["telemetry_mtime_ns"]:
+            self._read_shards(db, run_id, telemetry_dir)
+            db.execute("UPDATE runs SET telemetry_mtime_ns = ? WHERE run_id = ?", (telemetry_mtime, run_id))
+
+        self._read_episodes(db, run_id)
+
+    @staticmethod
+    def _add_run(db, run_id):
+        db.execute("INSERT OR IGNORE INTO runs (run_id) VALUES (?)", (run_id,))
+        db.execute("INSERT OR IGNORE INTO episode_summaries (run_id) VALUES (?)", (run_id,))
+
+    def _write_checkpoints(self, db, run_id, checkpoints):
+        """Replaces the checkpoints of a run (manifest entries, oldest first)."""
+        run_dir = self.run_dir(run_id)
+        db.execute("DELETE FROM checkpoints WHERE run_id = ?", (run_id,))
+        db.executemany(
+            "INSERT OR REPLACE INTO checkpoints (run_id, path, step, time, score, bytes) VALUES (?, ?, ?, ?, ?, ?)",
+            [(run_id, c["path"], c.get("step"), c.get("time"), c.get("score"), c.get("bytes"))
+             for c in checkpoints])
+        latest = checkpoints[-1] if checkpoints else {}
+        # Stamped after the read: whatever changes later is read next time.
+        db.execute("UPDATE runs SET latest = ?, latest_step = ?, manifest_mtime_ns = ?, models_mtime_ns = ? "
+                   "WHERE run_id = ?",
+                   (latest.get("path"), latest.get("step"), _mtime_ns(os.path.join(run_dir, MANIFEST_NAME)),
+                    _mtime_ns(os.path.join(run_dir, "models")), run_id))
+
+    def _read_shards(self, db, run_id, telemetry_dir):
+        """Adds the shards not indexed yet (reading their step column) and drops deleted ones."""
+        run_dir = self.run_dir(run_id)
+        paths = {os.path.relpath(path, run_dir): path for path in list_shards(telemetry_dir)}
+        known = {r[0] for r in db.execute("SELECT path FROM telemetry_shards WHERE run_id = ?", (run_id,))}
+        db.executemany("DELETE FROM telemetry_shards WHERE run_id = ? AND path = ?",
+                       [(run_id, rel) for rel in known - paths.keys()])
+        for rel in sorted(paths.keys() - known):
+            try:
+                with np.load(paths[rel]) as shard:
+                    steps = shard["step"]
+            except (OSError, KeyError, ValueError) as e:
+                logger.warning(f"Skipping unreadable telemetry shard {paths[rel]}: {e}")
+                continue
+            db.execute("INSERT INTO telemetry_shards (run_id, path, rows, first_step, last_step) "
+                       "VALUES (?, ?, ?, ?, ?)",
+                       (run_id, rel, len(steps), int(steps[0]) if len(steps) else None,
+                        int(steps[-1]) if len(steps) else None))
+
+    def _read_episodes(self, db, run_id):
+        """Adds the episode rows appended to ``episodes.csv`` since the last read."""
+        path = os.path.join(self.run_dir(run_id), "logs", "episodes.csv")
+        size = _size(path)
+        offset = db.execute("SELECT csv_offset FROM episode_summaries WHERE run_id = ?", (run_id,)).fetchone()
+        offset = offset[0] if offset is not None else 0
+        if size == offset:
+            return
+        if size < offset:
+            # Rewritten (or deleted): count it again from the start.
+            db.execute("UPDATE episode_summaries SET csv_offset = 0, episodes = 0, steps = 0, reward_sum = 0, "
+                       "reward_max = NULL, last_step = NULL WHERE run_id = ?", (run_id,))
+            offset = 0
+            if not size:
+                return
+
+        with open(path, "rb") as f:
+            header_line = f.readline()
+            if not header_line.endswith(b"\n"):
+                return
+            start = max(offset, len(header_line))
+            f.seek(start)
+            data = f.read(size - start)
+        # Only complete lines; a row still being written is read next time.
+        data = data[:data.rfind(b"\n") + 1]
+        header = next(csv.reader([header_line.decode()]))
+        try:
+            step_col, length_col, reward_col = header.index("step"), header.index("length"), header.index("reward")
+        except ValueError:
+            return
+        episodes = steps = 0
+        reward_sum, reward_max, last_step = 0.0, None, None
+        for row in csv.reader(data.decode().splitlines()):
+            if len(row) <= max(step_col, length_col, reward_col):
+                continue
+            reward = float(row[reward_col])
+            episodes += 1
+            steps += int(row[length_col])
+            reward_sum += reward
+            reward_max = reward if reward_max is None else max(reward_max, reward)
+            last_step = int(row[step_col])
+        db.execute("UPDATE episode_summaries SET csv_offset = ?, episodes = episodes + ?, steps = steps + ?, "
+                   "reward_sum = reward_sum + ?, reward_max = COALESCE(MAX(reward_max, ?), reward_max, ?), "
+                   "last_step = COALESCE(?, last_step) WHERE run_id = ?",
+                   (start + len(data), episodes, steps, reward_sum, reward_max, reward_max, last_step, run_id))
+
+    def _sync_logs(self):
+        """Syncs the TensorBoard folders directly under ``logs_dir``."""
+        if not os.path.isdir(self.logs_dir):
+            return
+        with os.scandir(self.logs_dir) as entries:
+            dirs = {entry.path for entry in entries if entry.is_dir()}
+        db = self._db()
+        with db:
+            known = {row["tb_dir"]: row["mtime_ns"]
+                     for row in db.execute("SELECT tb_dir, mtime_ns FROM tb_runs WHERE parent = ?", (self.logs_dir,))}
+            for tb_dir in known.keys() - dirs:
+                db.execute("DELETE FROM tb_runs WHERE tb_dir = ?", (tb_dir,))
+            for tb_dir in dirs:
+                if _mtime_ns(tb_dir) != known.get(tb_dir):
+                    self._write_tb_dir(db, tb_dir, tb_run_id(os.path.basename(tb_dir)))
+
+    def _write_tb_dir(self, db, tb_dir, run_id):
+        """Replaces the event files of a TensorBoard folder."""
+        mtime = _mtime_ns(tb_dir)
+        event_files = [os.path.join(root, file) for root, _, files in os.walk(tb_dir)
+                       for file in files if "tfevents" in file]
+        db.execute("INSERT OR REPLACE INTO tb_runs (tb_dir, parent, name, run_id, mtime_ns) VALUES (?, ?, ?, ?, ?)",
+                   (tb_dir, os.path.dirname(tb_dir), os.path.basename(tb_dir), run_id, mtime))
+        db.execute("DELETE FROM event_files WHERE tb_dir = ?", (tb_dir,))
+        db.executemany("INSERT OR REPLACE INTO event_files (path, tb_dir) VALUES (?, ?)",
+                       [(path, tb_dir) for path in event_files])
+
+    # --- Updates from training ---
+
+    def record_checkpoints(self, run_id, checkpoints):
+        """Records the checkpoints of a run manifest that was just saved.
+
+        Args:
+            run_id (str): Run folder name.
+            checkpoints (list[dict]): Manifest entries, oldest (latest) last.
+        """
+        try:
+            db = self._db()
+            with db:
+                self._add_run(db, run_id)
+                self._write_checkpoints(db, run_id, checkpoints)
+        except Exception as e:
+            logger.warning(f"Run index: could not record the checkpoints of {run_id}: {e}")
+
+    def add_shard(self, run_id, path, rows, first_step, last_step):
+        """Records a telemetry shard that was just written."""
+        try:
+            db = self._db()
+            with db:
+                db.execute("INSERT OR REPLACE INTO telemetry_shards (run_id, path, rows, first_step, last_step) "
+                           "SELECT ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM runs WHERE run_id = ?)",
+                           (run_id, os.path.relpath(os.path.abspath(path), self.run_dir(run_id)), rows,
+                            first_step, last_step, run_id))
+        except Exception as e:
+            logger.warning(f"Run index: could not record telemetry shard {path}: {e}")
+
+    def refresh_episodes(self, run_id):
+        """Counts the rows just appended to a run's ``episodes.csv``."""
+        try:
+            db = self._db()
+            with db:
+                self._read_episodes(db, run_id)
+        except Exception as e:
+            logger.warning(f"Run index: could not update the episodes of {run_id}: {e}")
+
+    def add_tb_dir(self, tb_dir, run_id):
+        """Records the TensorBoard folder a run logs to, with its event files."""
+        try:
+            db = self._db()
+            with db:
+                self._write_tb_dir(db, os.path.abspath(tb_dir), run_id)
+        except Exception as e:
+            logger.warning(f"Run index: could not record TensorBoard folder {tb_dir}: {e}")
+
+    # --- Queries ---
+
+    def runs(self):
+        """Returns every run, by run ID.
+
+        Returns:
+            list[dict]: ``run_id``, ``latest`` (absolute checkpoint path or
+                ``None``), ``latest_step``, ``checkpoints``, ``best_score``,
+                ``shards``, ``telemetry_rows``, ``episodes``,
+                ``episode_steps``, ``mean_reward``, ``max_reward`` and
+                ``last_step`` (of the last episode).
+        """
+        return [self._run_dict(row) for row in self._db().execute(_RUNS_QUERY + " ORDER BY r.run_id")]
+
+    def run(self, run_id):
+        """Returns one run as in :meth:`runs`, or ``None``."""
+        row = self._db().execute(_RUNS_QUERY + " WHERE r.run_id = ?", (run_id,)).fetchone()
+        return self._run_dict(row) if row is not None else None
+
+    def _run_dict(self, row):
+        run = dict(row)
+        if run["latest"]:
+            run["latest"] = os.path.join(self.run_dir(run["run_id"]), run["latest"])
+        return run
+
+    def latest_checkpoint(self, run_id):
+        """Absolute path of the latest checkpoint of a run, or ``None``."""
+        run = self.run(run_id)
+        return run["latest"] if run is not None else None
+
+    def checkpoints(self, run_id=None):
+        """Returns the checkpoints of one run (or all runs), oldest first per run.
+
+        Returns:
+            list[dict]: ``run_id``, ``path`` (absolute), ``step``, ``time``,
+                ``score`` and ``bytes``.
+        """
+        query = "SELECT * FROM checkpoints"
+        args = ()
+        if run_id is not None:
+            query, args = query + " WHERE run_id = ?", (run_id,)
+        rows = self._db().execute(query + " ORDER BY run_id, step IS NULL, step, time", args)
+        return [dict(row, path=os.path.join(self.run_dir(row["run_id"]), row["path"])) for row in rows]
+
+    def telemetry_shards(self, run_id):
+        """Returns the telemetry shards of a run, oldest first.
+
+        Returns:
+            list[dict]: ``path`` (absolute), ``rows``, ``first_step`` and
+                ``last_step``.
+        """
+        rows = self._db().execute("SELECT path, rows, first_step, last_step FROM telemetry_shards "
+                                  "WHERE run_id = ? ORDER BY path", (run_id,))
+        return [dict(row, path=os.path.join(self.run_dir(run_id), row["path"])) for row in rows]
+
+    def tb_runs(self):
+        """Returns the TensorBoard folders under ``logs_dir``, by name.
+
+        Returns:
+            list[dict]: ``name``, ``tb_dir``, ``run_id`` and
+                ``event_files`` (sorted absolute paths).
+        """
+        db = self._db()
+        tb_runs = [dict(row) for row in db.execute("SELECT name, tb_dir, run_id FROM tb_runs WHERE parent = ? "
+                                                    "ORDER BY name", (self.logs_dir,))]
+        files = {}
+        for row in db.execute("SELECT e.path, e.tb_dir FROM event_files e JOIN tb_runs t USING (tb_dir) "
+                              "WHERE t.parent = ? ORDER BY e.path", (self.logs_dir,)):
+            files.setdefault(row["tb_dir"], []).append(row["path"])
+        for tb_run in tb_runs:
+            tb_run["event_files"] = files.get(tb_run["tb_dir"], [])
+        return tb_runs
@@ -0,0 +1,308 @@
+"""Per-run checkpoint manifest and retention policy.
+
+Every checkpoint of a run is recorded in ``outputs/<run_id>/run_manifest.json``
+(path, global step, time, size and score), along with the latest checkpoint
+and where the replay buffer lives.  Resume resolution reads this one file
+(:func:`find_latest_checkpoint`) instead of globbing and ``stat``-ing every
+``.zip`` in ``models/``, which falls back to the scan for older runs.
+
+:class:`RetentionPolicy` decides which checkpoints survive:
+
+* ``keep_last``: the N most recent checkpoints;
+* ``keep_every``: the first checkpoint at or after every multiple of K steps
+  (a sparse history of the run);
+* ``keep_best``: the N checkpoints with the highest score, the mean reward
+  of the last 100 training episodes when the checkpoint was taken;
+* ``max_bytes``: a disk budget for the whole ``models/`` folder (checkpoints
+  and replay segments).  Kept checkpoints are removed as needed, history first,
+  then the oldest recent ones, then the worst best ones.  The latest
+  checkpoint is never removed.
+
+Legacy replay buffer pickles (``*replay_buffer*.pkl``) are pruned too: all
+of them once the run's segment log or memmap buffer is on disk, otherwise
+all but the newest.
+
+Layout::
+
+    outputs/<run_id>/
+        run_manifest.json
+        models/
+            mkds_ckpt_10000_steps.zip
+            ...
+"""
+
+import os
+import re
+import glob
+import json
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "run_manifest.json"
+
+# Global step embedded in SB3 checkpoint names (mkds_ckpt_10000_steps.zip).
+_STEP_PATTERN = re.compile(r"_(\d+)_steps\.zip$")
+
+
+def _dir_bytes(path):
+    """Total size of the files under ``path`` (0 if it does not exist)."""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class RetentionPolicy:
+    """Which checkpoints of a run to keep.
+
+    Args:
+        keep_last (int): Most recent checkpoints to keep.
+        keep_every (int): Keep one checkpoint per this many global steps
+            (``0`` disables).
+        keep_best (int): Highest-scoring checkpoints to keep.
+        max_bytes (int): Disk budget of the run's ``models/`` folder in
+            bytes (``0`` for no budget).
+    """
+
+    def __init__(self, keep_last=5, keep_every=0, keep_best=1, max_bytes=0):
+        self.keep_last = keep_last
+        self.keep_every = keep_every
+        self.keep_best = keep_best
+        self.max_bytes = max_bytes
+
+    def select(self, checkpoints):
+        """Groups checkpoints by the rule that keeps them.
+
+        Args:
+            checkpoints (list[dict]): Manifest entries, oldest first.
+
+        Returns:
+            tuple[list[dict], list[dict], list[dict], list[dict]]: History
+                (``keep_every``), recent (``keep_last``) and best
+                (``keep_best``) entries, each in removal order, then the
+                entries no rule keeps.  The latest checkpoint is in none.
+        """
+        latest, older = checkpoints[-1:], checkpoints[:-1]
+        latest_paths = {c["path"] for c in latest}
+
+        best = sorted((c for c in checkpoints if c.get("score") is not None), key=lambda c: c["score"])
+        best = best[max(len(best) - self.keep_best, 0):] if self.keep_best > 0 else []
+        best = [c for c in best if c["path"] not in latest_paths]
+        taken = latest_paths | {c["path"] for c in best}
+
+        recent = older[max(len(older) - (self.keep_last - 1), 0):] if self.keep_last > 1 else []
+        recent = [c for c in recent if c["path"] not in taken]
+        taken |= {c["path"] for c in recent}
+
+        history, buckets = [], set()
+        if self.keep_every:
+            for c in checkpoints:
+                step = c.get("step")
+                if step is None or step // self.keep_every in buckets:
+                    continue
+                buckets.add(step // self.keep_every)
+                if c["path"] not in taken:
+                    history.append(c)
+            taken |= {c["path"] for c in history}
+
+        rest = [c for c in older if c["path"] not in taken]
+        return history, recent, best, rest
+
+
+class RunManifest:
+    """Checkpoint record of one run, stored as ``run_manifest.json``.
+
+    Opening a run without a manifest registers the ``.zip`` files already in
+    its ``models/`` folder (oldest first by modification time).  Methods
+    are thread-safe: checkpoints are recorded on the training thread and
+    pruned on the checkpoint writer thread.
+
+    Args:
+        run_dir (str): Run directory (``outputs/<run_id>``).
+        run_id (str | None): Run name; defaults to the directory name.
+        index (RunIndex | None): Run index that records the checkpoints
+            after every :meth:`save` (see ``src/utils/run_index.py``).
+
+    Attributes:
+        path (str): Manifest file path.
+        data (dict): Manifest contents.
+    """
+
+    def __init__(self, run_dir, run_id=None, index=None):
+        self.run_dir = run_dir
+        self.path = os.path.join(run_dir, MANIFEST_NAME)
+        self.index = index
+        self._lock = threading.Lock()
+        if os.path.isfile(self.path):
+            with open(self.path) as f:
+                self.data = json.load(f)
+        else:
+            self.data = {
+                "run_id": run_id or os.path.basename(os.path.normpath(run_dir)),
+                "latest": None,
+                "replay": None,
+                "checkpoints": [],
+            }
+            for path in sorted(glob.glob(os.path.join(run_dir, "models", "*.zip")), key=os.path.getmtime):
+                match = _STEP_PATTERN.search(path)
+                self._add(path, int(match.group(1)) if match else None, None, os.path.getmtime(path))
+
+    @staticmethod
+    def exists(run_dir):
+        """Returns ``True`` if ``run_dir`` has a manifest."""
+        return os.path.isfile(os.path.join(run_dir, MANIFEST_NAME))
+
+    def latest(self):
+        """Returns the absolute path of the latest checkpoint, or ``None``."""
+        latest = self.data["latest"]
+        return os.path.abspath(os.path.join(self.run_dir, latest)) if latest else None
+
+    def set_replay(self, kind, path=None):
+        """Records where the replay buffer is kept.
+
+        Args:
+            kind (str): ``"segments"``, ``"memmap"`` or ``"pickle"``.
+            path (str | None): Log or memmap directory.
+        """
+        with self._lock:
+            self.data["replay"] = {"kind": kind,
+                                   "path": os.path.relpath(path, self.run_dir) if path else None}
+
+    def add_checkpoint(self, path, step, score=None, policy=None):
+        """Records a written checkpoint as the latest one.
+
+        An entry with the same path (e.g. ``interrupted_exit.zip``) is
+        replaced.  Call it once the file is on disk (queue it on the
+        checkpoint writer after the save), since :meth:`prune` forgets
+        entries whose file is missing.
+
+        Args:
+            path (str): Checkpoint ``.zip`` path.
+            step (int | None): Global step of the checkpoint.
+            score (float | None): Mean recent episode reward, for
+                ``keep_best``.
+            policy (RetentionPolicy | None): If given, :meth:`prune` with
+                it afterwards; otherwise only :meth:`save`.
+        """
+        with self._lock:
+            self._add(path, step, score, time.time())
+        if policy is not None:
+            self.prune(policy)
+        else:
+            self.save()
+
+    def _add(self, path, step, score, timestamp):
+        rel = os.path.relpath(path, self.run_dir)
+        checkpoints = [c for c in self.data["checkpoints"] if c["path"] != rel]
+        checkpoints.append({"path": rel, "step": step, "time": timestamp, "score": score, "bytes": None})
+        self.data["checkpoints"] = checkpoints
+        self.data["latest"] = rel
+
+    def save(self):
+        """Writes the manifest atomically, then updates the run index."""
+        with self._lock:
+            text = json.dumps(self.data, indent=1)
+            checkpoints = [dict(c) for c in self.data["checkpoints"]]
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, self.path)
+        if self.index is not None:
+            self.index.record_checkpoints(os.path.basename(os.path.normpath(self.run_dir)), checkpoints)
+
+    def prune(self, policy):
+        """Applies ``policy``, deletes what it drops and saves the manifest.
+
+        Args:
+            policy (RetentionPolicy): Retention rules.
+
+        Returns:
+            list[str]: Deleted paths.
+        """
+        with self._lock:
+            checkpoints = [c for c in self.data["checkpoints"]
+                           if os.path.isfile(os.path.join(self.run_dir, c["path"]))]
+            for c in checkpoints:
+                c["bytes"] = os.path.getsize(os.path.join(self.run_dir, c["path"]))
+            history, recent, best, rest = policy.select(checkpoints)
+
+            removed = [c["path"] for c in rest] + self._stale_replay_pickles()
+            self._remove(removed)
+
+            if policy.max_bytes:
+                total = _dir_bytes(os.path.join(self.run_dir, "models"))
+                for c in history + recent + best:
+                    if total <= policy.max_bytes:
+                        break
+                    self._remove([c["path"]])
+                    removed.append(c["path"])
+                    total -= c["bytes"]
+                if total > policy.max_bytes:
+                    logger.warning(f"Run {self.data['run_id']} uses {total / 1e9:.2f} GB, over its "
+                                   f"{policy.max_bytes / 1e9:.2f} GB budget with only the latest checkpoint "
+                                   "and the replay buffer left")
+
+            removed_set = set(removed)
+            self.data["checkpoints"] = [c for c in checkpoints if c["path"] not in removed_set]
+            # A checkpoint whose write failed is not the latest one.
+            self.data["latest"] = self.data["checkpoints"][-1]["path"] if self.data["checkpoints"] else None
+        self.save()
+        return removed
+
+    def _remove(self, paths):
+        for rel in paths:
+            try:
+                os.remove(os.path.join(self.run_dir, rel))
+            except FileNotFoundError:
+                pass
+
+    def _stale_replay_pickles(self):
+        """Replay buffer pickles not needed to resume the run.
+
+        All of them once the buffer recorded by :meth:`set_replay` is on
+        disk, otherwise all but the newest.
+        """
+        pickles = sorted(glob.glob(os.path.join(self.run_dir, "models", "*replay_buffer*.pkl")),
+                         key=os.path.getmtime)
+        if not self._replay_on_disk():
+            pickles = pickles[:-1]
+        return [os.path.relpath(p, self.run_dir) for p in pickles]
+
+    def _replay_on_disk(self):
+        """Whether the segment log or memmap buffer of the run has been written."""
+        replay = self.data.get("replay") or {}
+        # The file each one writes last: the segment log's manifest and the
+        # memmap buffer's position map.
+        marker = {"segments": "manifest.json", "memmap": "meta.npy"}.get(replay.get("kind"))
+        if marker is None or not replay.get("path"):
+            return False
+        return os.path.isfile(os.path.join(self.run_dir, replay["path"], marker))
+
+
+def find_latest_checkpoint(run_dir):
+    """Returns the latest checkpoint of a run, or ``None`` if it has none.
+
+    Reads ``run_manifest.json``; runs without one (or whose latest entry is
+    gone) fall back to the most recently modified ``models/*.zip``.
+
+    Args:
+        run_dir (str): Run directory (``outputs/<run_id>``).
+
+    Returns:
+        str | None: Absolute path of the checkpoint ``.zip``.
+    """
+    if RunManifest.exists(run_dir):
+        latest = RunManifest(run_dir).latest()
+        if latest and os.path.isfile(latest):
+            return latest
+    model_files = glob.glob(os.path.join(run_dir, "models", "*.zip"))
+    return os.path.abspath(max(model_files, key=os.path.getmtime)) if model_files else None
@@ -0,0 +1,303 @@
+"""Columnar binary telemetry log with a background writer thread.
+
+Per-step telemetry used to go to ``telemetry_log.csv``: text formatting and
+file writes on the training thread, and gigabytes of CSV that the analysis
+scripts then have to parse again.  This module stores the same data in
+binary columns instead:
+
+* :class:`TelemetryWriter` fills preallocated column arrays (one NumPy array
+  per field) from the training thread.  Every ``shard_rows`` rows the filled
+  set of columns is handed to a background thread, which saves it as one
+  ``.npz`` shard (one ``.npy`` per column, uncompressed).  The training
+  thread continues on a spare set of columns, so it never waits on disk
+  unless the writer falls more than ``n_buffers - 1`` shards behind.
+* :func:`read_telemetry` / :func:`load_dataframe` read the shards back
+  (optionally only some columns) for the analysis scripts.
+* :func:`export_csv` writes the legacy ``telemetry_log.csv`` layout for
+  tools that expect it::
+
+      python -m src.utils.telemetry_store outputs/<run>/logs/telemetry
+
+Layout on disk::
+
+    <run>/logs/telemetry/
+        telemetry_000000.npz      # step, speed, offroad, pos_x, ..., reward
+        telemetry_000001.npz
+        ...
+
+Shards are written to a temporary file and renamed, so a shard is either
+complete or absent.  A resumed run continues the shard numbering after the
+highest existing shard, and a shard that fails to write leaves no number
+unused, so an existing shard is never overwritten.
+"""
+
+import os
+import csv
+import glob
+import queue
+import logging
+import argparse
+import threading
+import numpy as np
+from env.telemetry import TELEMETRY_DTYPE, REASON_LABELS
+
+logger = logging.getLogger(__name__)
+
+# One row per env step: the global step counter, every telemetry record field
+# and the step reward.
+LOG_COLUMNS = (
+    [("step", np.dtype("<i8"))]
+    + [(name, TELEMETRY_DTYPE.fields[name][0]) for name in TELEMETRY_DTYPE.names]
+    + [("reward", np.dtype("<f8"))]
+)
+
+SHARD_GLOB = "telemetry_*.npz"
+SHARD_NAME = "telemetry_{:06d}.npz"
+
+# Column order of the legacy telemetry_log.csv.
+CSV_COLUMNS = ["step", "speed", "offroad", "pos_x", "pos_z", "action", "reason", "reward"]
+
+
+def list_shards(directory):
+    """Returns the shard paths of a telemetry directory, oldest first."""
+    return sorted(glob.glob(os.path.join(directory, SHARD_GLOB)))
+
+
+def _next_shard_index(directory):
+    """Returns the number after the highest shard in ``directory`` (0 if none)."""
+    prefix, suffix = SHARD_NAME.split("{")[0], os.path.splitext(SHARD_NAME)[1]
+    indices = []
+    for path in list_shards(directory):
+        name = os.path.basename(path)[len(prefix):-len(suffix)]
+        if name.isdigit():
+            indices.append(int(name))
+    return max(indices) + 1 if indices else 0
+
+
+class TelemetryWriter:
+    """Buffers telemetry rows in column arrays and writes shards in a thread.
+
+    Args:
+        directory (str): Shard directory (created if needed).
+        shard_rows (int): Rows per shard.
+        n_buffers (int): Sets of column arrays allocated up front.  One is
+            being filled, the others are queued for or being written.
+        on_write (callable | None): Called on the writer thread after each
+            shard is saved, as ``on_write(path, rows, first_step,
+            last_step)`` (e.g. :meth:`~src.utils.run_index.RunIndex.add_shard`).
+
+    Attributes:
+        rows_written (int): Rows handed to the writer thread so far.
+    """
+
+    def __init__(self, directory, shard_rows=65536, n_buffers=3, on_write=None):
+        if shard_rows < 1:
+            raise ValueError(f"shard_rows must be >= 1, got {shard_rows}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.shard_rows = shard_rows
+        self.on_write = on_write
+        self.rows_written = 0
+
+        # Continue numbering after the shards of a previous session.
+        self._next_shard = _next_shard_index(directory)
+
+        self._free = queue.Queue()
+        for _ in range(max(n_buffers, 2) - 1):
+            self._free.put(self._allocate())
+        self._columns = self._allocate()
+        self._fill = 0
+
+        self._pending = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="telemetry-writer", daemon=True)
+        self._thread.start()
+        self._closed = False
+
+    def _allocate(self):
+        return {name: np.empty(self.shard_rows, dtype=dtype) for name, dtype in LOG_COLUMNS}
+
+    def append(self, step, records, rewards):
+        """Appends one vectorised step (one row per env).
+
+        Args:
+            step (int): Global step counter, stored on every row.
+            records (np.ndarray): ``(n_envs,)`` array of
+                :data:`~env.telemetry.TELEMETRY_DTYPE`.
+            rewards (np.ndarray): ``(n_envs,)`` step rewards.
+        """
+        n = len(records)
+        offset = 0
+        while offset < n:
+            take = min(n - offset, self.shard_rows - self._fill)
+            rows = slice(self._fill, self._fill + take)
+            src = slice(offset, offset + take)
+            columns = self._columns
+            columns["step"][rows] = step
+            for name in TELEMETRY_DTYPE.names:
+                columns[name][rows] = records[name][src]
+            columns["reward"][rows] = rewards[src]
+            self._fill += take
+            offset += take
+            if self._fill == self.shard_rows:
+                self._submit()
+
+    def flush(self):
+        """Hands the rows buffered so far to the writer as a (short) shard."""
+        if self._fill:
+            self._submit()
+
+    def close(self):
+        """Flushes, then waits for every queued shard to be on disk."""
+        if self._closed:
+            return
+        self._closed = True
+        self.flush()
+        self._pending.put(None)
+        self._thread.join()
+
+    def _submit(self):
+        self._pending.put((self._columns, self._fill))
+        self.rows_written += self._fill
+        # Blocks only if the writer thread is n_buffers - 1 shards behind,
+        # and never on a writer thread that has stopped.
+        while True:
+            try:
+                self._columns = self._free.get(timeout=1.0)
+                break
+            except queue.Empty:
+                if not self._thread.is_alive():
+                    raise RuntimeError("The telemetry writer thread has stopped")
+        self._fill = 0
+
+    def _run(self):
+        """Writer thread: saves queued column sets until ``None`` arrives."""
+        while True:
+            item = self._pending.get()
+            if item is None:
+                break
+            columns, n = item
+            # The number is only used up once the shard is on disk, so
+            # numbering stays contiguous after a failed write.
+            path = os.path.join(self.directory, SHARD_NAME.format(self._next_shard))
+            tmp_path = path + ".tmp"
+            # Read before the columns go back to the training thread.
+            steps = (int(columns["step"][0]), int(columns["step"][n - 1])) if n else None
+            try:
+                with open(tmp_path, "wb") as f:
+                    np.savez(f, **{name: column[:n] for name, column in columns.items()})
+                os.replace(tmp_path, path)
+            except Exception as e:
+                logger.error(f"Failed to write telemetry shard {path}: {e}")
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                continue
+            finally:
+                self._free.put(columns)
+            self._next_shard += 1
+            if self.on_write is not None and steps is not None:
+                # A failing hook (e.g. the run index) must not stop the writer.
+                try:
+                    self.on_write(path, n, *steps)
+                except Exception as e:
+                    logger.warning(f"Shard write hook failed for {path}: {e}")
+
+
+def iter_shards(directory, columns=None):
+    """Yields each shard of a telemetry directory as a dict of columns.
+
+    Args:
+        directory (str): Shard directory written by :class:`TelemetryWriter`.
+        columns (list[str] | None): Columns to load; all when ``None``.
+            Only the requested ``.npy`` members are read.
+
+    Yields:
+        dict[str, np.ndarray]: Column name -> values, one shard at a time.
+    """
+    for path in list_shards(directory):
+        with np.load(path) as shard:
+            names = shard.files if columns is None else columns
+            yield {name: shard[name] for name in names}
+
+
+def read_telemetry(directory, columns=None):
+    """Reads a whole telemetry directory into concatenated column arrays.
+
+    Args:
+        directory (str): Shard directory written by :class:`TelemetryWriter`.
+        columns (list[str] | None): Columns to load; all when ``None``.
+
+    Returns:
+        dict[str, np.ndarray]: Column name -> values across all shards (empty
+            arrays when there are no shards).
+    """
+    names = [name for name, _ in LOG_COLUMNS] if columns is None else list(columns)
+    parts = {name: [] for name in names}
+    for shard in iter_shards(directory, names):
+        for name in names:
+            parts[name].append(shard[name])
+    dtypes = dict(LOG_COLUMNS)
+    return {name: np.concatenate(chunks) if chunks else np.empty(0, dtype=dtypes.get(name))
+            for name, chunks in parts.items()}
+
+
+def load_dataframe(directory, columns=None):
+    """Reads a telemetry directory as a DataFrame shaped like the CSV log.
+
+    The ``reason`` column is decoded to its labels, with NaN mid-episode,
+    which is what ``pd.read_csv`` produces for ``telemetry_log.csv``.
+
+    Args:
+        directory (str): Shard directory written by :class:`TelemetryWriter`.
+        columns (list[str] | None): Columns to load; all when ``None``.
+
+    Returns:
+        pandas.DataFrame: One row per logged env step.
+    """
+    import pandas as pd
+
+    df = pd.DataFrame(read_telemetry(directory, columns))
+    if "reason" in df.columns:
+        df["reason"] = pd.Series(REASON_LABELS[df["reason"].to_numpy()]).replace("", np.nan)
+    return df
+
+
+def export_csv(directory, csv_path):
+    """Writes a telemetry directory as a legacy ``telemetry_log.csv``.
+
+    Converts one shard at a time, so memory use is bounded by the shard size.
+
+    Args:
+        directory (str): Shard directory written by :class:`TelemetryWriter`.
+        csv_path (str): Output CSV path (overwritten).
+
+    Returns:
+        int: Number of rows written.
+    """
+    n_rows = 0
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        for shard in iter_shards(directory, CSV_COLUMNS):
+            shard["reason"] = REASON_LABELS[shard["reason"]]
+            writer.writerows(zip(*(shard[name].tolist() for name in CSV_COLUMNS)))
+            n_rows += len(shard["step"])
+    return n_rows
+
+
+def main():
+    """CLI: exports a telemetry directory to CSV."""
+    parser = argparse.ArgumentParser(description="Export a binary telemetry log to telemetry_log.csv.")
+    parser.add_argument("directory", help="Shard directory, e.g. outputs/<run>/logs/telemetry")
+    parser.add_argument("--output", "-o", default=None,
+                        help="CSV path (default: telemetry_log.csv next to the directory)")
+    args = parser.parse_args()
+
+    output = args.output or os.path.join(os.path.dirname(os.path.normpath(args.directory)), "telemetry_log.csv")
+    n_rows = export_csv(args.directory, output)
+    print(f"Exported {n_rows} rows to {output}")
+
+
+if __name__ == "__main__":
+    main()
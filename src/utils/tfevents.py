@@ -0,0 +1,168 @@
+"""Direct, lossless reader for the scalars of TensorBoard event files.
+
+``EventAccumulator`` keeps a reservoir sample of at most 10,000 events per
+scalar tag with its default ``size_guidance``, so long runs were silently
+plotted from a subset of their points, after paying for a full parse of the
+file.  This module reads the ``tfevents`` record files itself and returns
+*every* scalar event, collected straight into typed arrays.
+
+An event file is a sequence of TFRecords::
+
+    uint64 length | uint32 masked CRC-32C of length | Event proto (length bytes) | uint32 masked CRC-32C of data
+
+Each record is decoded with TensorBoard's compiled ``Event`` protobuf.
+Scalars written as ``simple_value`` (``torch.utils.tensorboard``, i.e.
+Stable-Baselines3) and as rank-0 tensors (TF2 summaries) are both read.
+CRCs are not verified: a record is only decoded once it is complete, and a
+partially written record at the end of the file (a run still training)
+stops the read there.
+
+Reading can start at any record boundary, and returns the offset after the
+last complete record, so a growing file is tailed by reading only what was
+appended (:class:`EventFileTail`, and the scalar cache of
+``analysis/tf_event_parser.py``).
+"""
+
+import struct
+from array import array
+import numpy as np
+from tensorboard.compat.proto import event_pb2, types_pb2
+
+# Record framing: length + length CRC before the data, data CRC after it.
+_HEADER = struct.Struct("<QI")
+_FOOTER_SIZE = 4
+
+# Bytes read from the file at a time.
+READ_BLOCK = 16 * 1024 ** 2
+
+# Element types of scalar tensors written by TF2 summaries.
+_TENSOR_DTYPES = {
+    types_pb2.DT_FLOAT: np.dtype("<f4"),
+    types_pb2.DT_DOUBLE: np.dtype("<f8"),
+    types_pb2.DT_INT32: np.dtype("<i4"),
+    types_pb2.DT_INT64: np.dtype("<i8"),
+}
+
+
+def _scalar_value(value):
+    """Returns the scalar of a ``Summary.Value``, or ``None`` if it is not one."""
+    kind = value.WhichOneof("value")
+    if kind == "simple_value":
+        return value.simple_value
+    if kind != "tensor":
+        return None
+    tensor = value.tensor
+    if tensor.tensor_shape.dim:  # Not rank 0
+        return None
+    for field in (tensor.float_val, tensor.double_val, tensor.int_val, tensor.int64_val):
+        if field:
+            return float(field[0])
+    dtype = _TENSOR_DTYPES.get(tensor.dtype)
+    if dtype is not None and len(tensor.tensor_content) == dtype.itemsize:
+        return float(np.frombuffer(tensor.tensor_content, dtype=dtype)[0])
+    return None
+
+
+def read_scalar_events(path, tags=None, offset=0):
+    """Reads every scalar event of an event file from a byte offset.
+
+    Args:
+        path (str): ``tfevents`` file path.
+        tags (Iterable[str] | None): Tags to keep; all scalar tags when
+            ``None``.  Records that mention none of them are skipped without
+            being decoded.
+        offset (int): Byte offset of a record boundary to start at (``0``,
+            or the offset returned by a previous call).
+
+    Returns:
+        tuple[dict[str, tuple[np.ndarray, np.ndarray]], int]: Tag ->
+            ``(steps, values)`` (int64 and float64 arrays, in file order) for
+            the events read, and the offset just after the last complete
+            record.
+    """
+    tags = None if tags is None else set(tags)
+    needles = None if tags is None else [tag.encode() for tag in tags]
+    steps, values = {}, {}
+
+    with open(path, "rb") as f:
+        f.seek(offset)
+        buf, pos = b"", 0
+        while True:
+            block = f.read(READ_BLOCK)
+            if not block:
+                break
+            buf = buf[pos:] + block
+            pos = 0
+            while pos + _HEADER.size <= len(buf):
+                length, _ = _HEADER.unpack_from(buf, pos)
+                end = pos + _HEADER.size + length + _FOOTER_SIZE
+                if end > len(buf):
+                    break  # Record continues in the next block (or is still being written)
+                data = buf[pos + _HEADER.size:end - _FOOTER_SIZE]
+                pos = end
+                if needles is not None and not any(needle in data for needle in needles):
+                    continue
+                event = event_pb2.Event.FromString(data)
+                if not event.HasField("summary"):
+                    continue
+                for value in event.summary.value:
+                    if tags is not None and value.tag not in tags:
+                        continue
+                    scalar = _scalar_value(value)
+                    if scalar is None:
+                        continue
+                    if value.tag not in steps:
+                        steps[value.tag], values[value.tag] = array("q"), array("d")
+                    steps[value.tag].append(event.step)
+                    values[value.tag].append(scalar)
+        # Just after the last complete record; unread bytes are left over.
+        end_offset = f.tell() - (len(buf) - pos)
+
+    return ({tag: (np.frombuffer(steps[tag], dtype=np.int64), np.frombuffer(values[tag], dtype=np.float64))
+             for tag in steps}, end_offset)
+
+
+class EventFileTail:
+    """Follows the scalars of an event file as it grows.
+
+    Each :meth:`poll` reads only the records appended since the previous
+    one.  Save :attr:`offset` to continue from the same point later.
+
+    Args:
+        path (str): ``tfevents`` file path.
+        tags (Iterable[str] | None): Tags to keep; all scalar tags when
+            ``None``.
+        offset (int): Byte offset to start at.
+
+    Attributes:
+        offset (int): Offset just after the last record read.
+        scalars (dict[str, tuple[np.ndarray, np.ndarray]]): Every event read
+            so far, tag -> ``(steps, values)``.
+    """
+
+    def __init__(self, path, tags=None, offset=0):
+        self.path = path
+        self.tags = tags
+        self.offset = offset
+        self.scalars = {}
+
+    def poll(self):
+        """Reads the records appended since the last call.
+
+        Returns:
+            dict[str, tuple[np.ndarray, np.ndarray]]: The new events only.
+        """
+        new, self.offset = read_scalar_events(self.path, self.tags, self.offset)
+        self.scalars = merge_scalars(self.scalars, new)
+        return new
+
+
+def merge_scalars(old, new):
+    """Appends the events of ``new`` to those of ``old`` (tag by tag)."""
+    merged = dict(old)
+    for tag, (steps, values) in new.items():
+        if tag in merged:
+            merged[tag] = (np.concatenate([merged[tag][0], steps]), np.concatenate([merged[tag][1], values]))
+        else:
+            merged[tag] = (steps, values)
+    return merged
@@ -0,0 +1,74 @@
+"""Tests for the sum tree and the prioritized replay buffer's sampling."""
+
+import numpy as np
+import gymnasium as gym
+from src.utils.replay_buffers import PrioritizedReplayBuffer, SumTree
+
+OBS_SPACE = gym.spaces.Box(0, 255, (4, 6, 6), np.uint8)
+ACTION_SPACE = gym.spaces.Discrete(3)
+
+
+def reference_find(values, queries):
+    """Leaf lookup by prefix sums, what SumTree.find must match."""
+    return np.searchsorted(np.cumsum(values), queries, side="right")
+
+
+def test_sum_tree_update_and_find_match_prefix_sums():
+    rng = np.random.default_rng(0)
+    tree = SumTree(13)
+    values = rng.random(13)
+    tree.update(np.arange(13), values)
+    # Later updates, with a duplicate leaf (the last value wins).
+    tree.update(np.array([3, 7, 3]), np.array([0.5, 0.0, 2.0]))
+    values[[7, 3]] = [0.0, 2.0]
+
+    assert tree.n_leaves == 16
+    np.testing.assert_allclose(tree.total, values.sum())
+    np.testing.assert_array_equal(tree.get(np.arange(13)), values)
+    queries = rng.random(1000) * values.sum()
+    np.testing.assert_array_equal(tree.find(queries), reference_find(values, queries))
+    assert 7 not in tree.find(queries)
+
+
+def test_sum_tree_rebuild_matches_updates():
+    rng = np.random.default_rng(1)
+    values = rng.random(20)
+    updated = SumTree(20)
+    updated.update(np.arange(20), values)
+    rebuilt = SumTree(20)
+    rebuilt.nodes[rebuilt.n_leaves:rebuilt.n_leaves + 20] = values
+    rebuilt.rebuild()
+    np.testing.assert_allclose(rebuilt.nodes, updated.nodes)
+
+
+def make_buffer(n_steps, alpha=0.6, beta=0.4):
+    buffer = PrioritizedReplayBuffer(32, OBS_SPACE, ACTION_SPACE, device="cpu", n_envs=2, alpha=alpha, beta=beta)
+    obs = np.zeros((2, *OBS_SPACE.shape), dtype=np.uint8)
+    for i in range(n_steps):
+        buffer.add(obs, obs, np.zeros((2, 1)), np.zeros(2), np.array([i % 5 == 4] * 2), [{}, {}])
+    return buffer
+
+
+def test_importance_sampling_weights():
+    buffer = make_buffer(12, alpha=0.7, beta=0.5)
+    rng = np.random.default_rng(2)
+    n = 12 * 2
+    td_errors = rng.random(n) * 5
+    buffer.update_priorities(np.arange(n), td_errors)
+    priorities = buffer.tree.get(np.arange(n))
+    np.testing.assert_allclose(priorities, (td_errors + buffer.epsilon) ** 0.7)
+
+    samples = buffer.sample(64)
+    probs = priorities[samples.leaves] / priorities.sum()
+    expected = (n * probs) ** -0.5
+    np.testing.assert_allclose(samples.weights.numpy().ravel(), expected / expected.max(), rtol=1e-5)
+
+
+def test_sample_without_priority_mass_falls_back_to_uniform():
+    buffer = make_buffer(10)
+    # Every priority 0: the tree has nothing to draw from.
+    buffer.tree.update(np.arange(20), np.zeros(20))
+    samples = buffer.sample(16)
+    assert (samples.leaves < 20).all()
+    assert np.isfinite(samples.weights.numpy()).all()
+    assert buffer.tree.total > 0
@@ -0,0 +1,140 @@
+"""Tests for the replay segment log's recovery from failed background writes."""
+
+import os
+import numpy as np
+import gymnasium as gym
+from src.utils.checkpoint_writer import AsyncCheckpointWriter
+from src.utils.replay_buffers import FrameStackReplayBuffer
+from src.utils.replay_segments import ReplaySegmentLog
+
+OBS_SPACE = gym.spaces.Box(0, 255, (4, 6, 6), np.uint8)
+ACTION_SPACE = gym.spaces.Discrete(3)
+
+
+def make_buffer(buffer_size=64):
+    return FrameStackReplayBuffer(buffer_size, OBS_SPACE, ACTION_SPACE, device="cpu", n_envs=1)
+
+
+def add_steps(buffer, rng, n):
+    """Adds ``n`` transitions of random frames, ending an episode every 10."""
+    obs = rng.integers(0, 255, (1, *OBS_SPACE.shape), dtype=np.uint8)
+    for i in range(n):
+        next_obs = np.roll(obs, -1, axis=1)
+        next_obs[:, -1] = rng.integers(0, 255, OBS_SPACE.shape[1:], dtype=np.uint8)
+        done = np.array([i % 10 == 9])
+        buffer.add(obs, next_obs, np.array([[i % 3]]), np.array([float(i)]), done, [{}])
+        obs = rng.integers(0, 255, obs.shape, dtype=np.uint8) if done[0] else next_obs
+
+
+def assert_same_samples(a, b):
+    inds = np.arange(a.buffer_size if a.full else a.pos)
+    env_inds = np.zeros_like(inds)
+    assert a.pos == b.pos and a.full == b.full
+    for name in ("observations", "next_observations", "actions", "rewards", "dones"):
+        np.testing.assert_array_equal(getattr(a._get_samples(inds, env_indices=env_inds), name).numpy(),
+                                      getattr(b._get_samples(inds, env_indices=env_inds), name).numpy())
+
+
+def test_failed_segment_write_keeps_log_resumable(tmp_path):
+    directory = str(tmp_path / "replay_segments")
+    rng = np.random.default_rng(0)
+    buffer = make_buffer()
+    writer = AsyncCheckpointWriter()
+    log = ReplaySegmentLog(directory, buffer, writer)
+
+    add_steps(buffer, rng, 30)
+    log.write_segment()
+    writer.wait()
+
+    # The second segment never reaches the disk.
+    save_segment = log._save_segment
+
+    def failing_save(name, arrays):
+        raise OSError("disk full")
+
+    log._save_segment = failing_save
+    add_steps(buffer, rng, 30)
+    log.write_segment()
+    writer.wait()
+    log._save_segment = save_segment
+    assert writer.failures == 1
+
+    # The manifest on disk still describes the first segment only.
+    restored = make_buffer()
+    reopened = ReplaySegmentLog(directory, restored)
+    assert reopened.restored == 30
+
+    # The next segment saves the whole buffer (the ring has wrapped by now).
+    add_steps(buffer, rng, 50)
+    log.write_segment()
+    writer.close()
+    assert sorted(os.listdir(directory)) == ["manifest.json", log.manifest["segments"][0]["file"]]
+
+    restored = make_buffer()
+    reopened = ReplaySegmentLog(directory, restored)
+    assert reopened.restored == 64
+    assert_same_samples(buffer, restored)
+
+
+def test_missing_segment_file_is_skipped(tmp_path):
+    directory = str(tmp_path / "replay_segments")
+    rng = np.random.default_rng(1)
+    buffer = make_buffer()
+    log = ReplaySegmentLog(directory, buffer)
+    add_steps(buffer, rng, 20)
+    log.write_segment()
+    add_steps(buffer, rng, 20)
+    log.write_segment()
+
+    os.remove(os.path.join(directory, log.manifest["segments"][0]["file"]))
+    restored = make_buffer()
+    reopened = ReplaySegmentLog(directory, restored)
+    assert restored.pos == buffer.pos
+    # The rows of the surviving segment are restored.
+    np.testing.assert_array_equal(restored.rewards[20:40], buffer.rewards[20:40])
+    assert not restored.rewards[:20].any()
+
+
+def test_saved_after_first_segment_of_loaded_buffer(tmp_path):
+    rng = np.random.default_rng(2)
+    buffer = make_buffer()
+    add_steps(buffer, rng, 20)  # e.g. loaded from a replay buffer pickle
+    log = ReplaySegmentLog(str(tmp_path / "replay_segments"), buffer)
+    calls = []
+    log.on_saved = lambda: calls.append(log.manifest["saved_rows"])
+    assert not log.saved
+
+    log.write_segment()
+    assert log.saved and calls == [20]
+    add_steps(buffer, rng, 5)
+    log.write_segment()
+    assert calls == [20]
+    assert ReplaySegmentLog(str(tmp_path / "replay_segments"), make_buffer()).saved
+
+
+def test_layout_change_keeps_old_log_until_replaced(tmp_path):
+    directory = str(tmp_path / "replay_segments")
+    rng = np.random.default_rng(3)
+    buffer = make_buffer()
+    log = ReplaySegmentLog(directory, buffer)
+    add_steps(buffer, rng, 40)
+    log.write_segment()
+    old_files = sorted(os.listdir(directory))
+
+    # Resumed with another buffer size: nothing is deleted yet, and the
+    # original size still restores the old log.
+    larger = make_buffer(128)
+    new_log = ReplaySegmentLog(directory, larger)
+    assert new_log.restored == 0
+    assert sorted(os.listdir(directory)) == old_files
+    restored = make_buffer()
+    assert ReplaySegmentLog(directory, restored).restored == 40
+    assert_same_samples(buffer, restored)
+
+    # The new log's first manifest replaces the old one.
+    add_steps(larger, rng, 10)
+    new_log.write_segment()
+    files = sorted(os.listdir(directory))
+    assert files == ["manifest.json", new_log.manifest["segments"][0]["file"]]
+    assert files[1] not in old_files
+    assert ReplaySegmentLog(directory, make_buffer(128)).restored == 10
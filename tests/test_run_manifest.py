@@ -0,0 +1,114 @@
+"""Tests for checkpoint retention and replay pickle pruning."""
+
+import os
+from src.utils.run_manifest import RetentionPolicy, RunManifest
+
+
+def make_run(tmp_path, scores, size=100, step=1000):
+    """Writes one checkpoint per score (``size`` bytes each) and records them."""
+    run_dir = str(tmp_path / "DQN_test")
+    os.makedirs(os.path.join(run_dir, "models"))
+    manifest = RunManifest(run_dir)
+    for i, score in enumerate(scores):
+        path = os.path.join(run_dir, "models", f"mkds_ckpt_{(i + 1) * step}_steps.zip")
+        with open(path, "wb") as f:
+            f.write(b"\0" * size)
+        manifest.add_checkpoint(path, (i + 1) * step, score)
+    return run_dir, manifest
+
+
+def kept_steps(manifest):
+    steps = [c["step"] for c in manifest.data["checkpoints"]]
+    on_disk = sorted(int(name.split("_")[2]) for name in os.listdir(os.path.join(manifest.run_dir, "models"))
+                     if name.endswith(".zip"))
+    assert steps == on_disk
+    return steps
+
+
+def test_keep_last(tmp_path):
+    _, manifest = make_run(tmp_path, [None] * 6)
+    manifest.prune(RetentionPolicy(keep_last=3, keep_best=0))
+    assert kept_steps(manifest) == [4000, 5000, 6000]
+    assert manifest.data["latest"] == "models/mkds_ckpt_6000_steps.zip"
+
+
+def test_keep_every(tmp_path):
+    _, manifest = make_run(tmp_path, [None] * 7)
+    manifest.prune(RetentionPolicy(keep_last=1, keep_every=3000, keep_best=0))
+    # First checkpoint at or after each multiple of 3000, plus the latest.
+    assert kept_steps(manifest) == [1000, 3000, 6000, 7000]
+
+
+def test_keep_best(tmp_path):
+    _, manifest = make_run(tmp_path, [5.0, 9.0, 1.0, 7.0, 2.0, 3.0])
+    manifest.prune(RetentionPolicy(keep_last=2, keep_best=2))
+    assert kept_steps(manifest) == [2000, 4000, 5000, 6000]
+
+
+def test_latest_is_never_removed(tmp_path):
+    _, manifest = make_run(tmp_path, [9.0, 1.0, None])
+    manifest.prune(RetentionPolicy(keep_last=0, keep_best=0, max_bytes=1))
+    assert kept_steps(manifest) == [3000]
+
+
+def test_disk_budget_removes_history_then_recent_then_best(tmp_path):
+    _, manifest = make_run(tmp_path, [9.0, 1.0, 2.0, 3.0, 4.0, 5.0])
+    policy = RetentionPolicy(keep_last=2, keep_every=4000, keep_best=1)
+    manifest.prune(policy)
+    # History 4000, recent 5000, best 1000 (score 9) and the latest 6000.
+    assert kept_steps(manifest) == [1000, 4000, 5000, 6000]
+
+    policy.max_bytes = 250
+    manifest.prune(policy)
+    assert kept_steps(manifest) == [1000, 6000]
+
+    policy.max_bytes = 150
+    manifest.prune(policy)
+    assert kept_steps(manifest) == [6000]
+
+
+def write_pickle(run_dir, name):
+    with open(os.path.join(run_dir, "models", name), "wb") as f:
+        f.write(b"pickle")
+
+
+def pickles(run_dir):
+    return sorted(name for name in os.listdir(os.path.join(run_dir, "models")) if name.endswith(".pkl"))
+
+
+def test_replay_pickles_kept_until_replay_is_on_disk(tmp_path):
+    run_dir, manifest = make_run(tmp_path, [None] * 2)
+    write_pickle(run_dir, "mkds_ckpt_1000_steps_replay_buffer.pkl")
+    os.utime(os.path.join(run_dir, "models", "mkds_ckpt_1000_steps_replay_buffer.pkl"), (0, 0))
+    write_pickle(run_dir, "interrupted_exit_replay_buffer.pkl")
+    policy = RetentionPolicy(keep_last=5)
+
+    # Without a replay location only the newest pickle survives.
+    manifest.prune(policy)
+    assert pickles(run_dir) == ["interrupted_exit_replay_buffer.pkl"]
+
+    # Recorded, but nothing written yet: the pickle is still the only copy.
+    segment_dir = os.path.join(run_dir, "models", "replay_segments")
+    manifest.set_replay("segments", segment_dir)
+    manifest.prune(policy)
+    assert pickles(run_dir) == ["interrupted_exit_replay_buffer.pkl"]
+
+    os.makedirs(segment_dir)
+    with open(os.path.join(segment_dir, "manifest.json"), "w") as f:
+        f.write("{}")
+    manifest.prune(policy)
+    assert pickles(run_dir) == []
+
+
+def test_replay_pickles_with_memmap_buffer(tmp_path):
+    run_dir, manifest = make_run(tmp_path, [None])
+    write_pickle(run_dir, "interrupted_exit_replay_buffer.pkl")
+    replay_dir = os.path.join(run_dir, "replay")
+    manifest.set_replay("memmap", replay_dir)
+    manifest.prune(RetentionPolicy())
+    assert pickles(run_dir) == ["interrupted_exit_replay_buffer.pkl"]
+
+    os.makedirs(replay_dir)
+    open(os.path.join(replay_dir, "meta.npy"), "wb").close()
+    manifest.prune(RetentionPolicy())
+    assert pickles(run_dir) == []
@@ -0,0 +1,64 @@
+"""Tests for the telemetry shard numbering across failed writes and resumes."""
+
+import os
+import numpy as np
+from unittest import mock
+from env.telemetry import TELEMETRY_DTYPE
+from src.utils import telemetry_store
+from src.utils.telemetry_store import TelemetryWriter, read_telemetry
+
+
+def append_steps(writer, steps, n_envs=2):
+    records = np.zeros(n_envs, dtype=TELEMETRY_DTYPE)
+    for step in steps:
+        writer.append(step, records, np.full(n_envs, float(step)))
+
+
+def shard_names(directory):
+    return sorted(os.listdir(directory))
+
+
+def test_resume_after_gap_does_not_overwrite(tmp_path):
+    directory = str(tmp_path / "telemetry")
+    writer = TelemetryWriter(directory, shard_rows=4)
+    append_steps(writer, range(6))
+    writer.close()
+    assert shard_names(directory) == ["telemetry_000000.npz", "telemetry_000001.npz", "telemetry_000002.npz"]
+
+    # A gap in the numbering, e.g. a shard deleted by hand.
+    os.remove(os.path.join(directory, "telemetry_000001.npz"))
+    writer = TelemetryWriter(directory, shard_rows=4)
+    append_steps(writer, [100, 101])
+    writer.close()
+
+    assert shard_names(directory) == ["telemetry_000000.npz", "telemetry_000002.npz", "telemetry_000003.npz"]
+    steps = read_telemetry(directory, ["step"])["step"]
+    np.testing.assert_array_equal(steps, [0, 0, 1, 1, 4, 4, 5, 5, 100, 100, 101, 101])
+
+
+def test_failed_write_leaves_no_gap_or_tmp(tmp_path):
+    directory = str(tmp_path / "telemetry")
+    writer = TelemetryWriter(directory, shard_rows=4)
+    savez = np.savez
+    calls = []
+
+    def flaky_savez(f, **columns):
+        calls.append(1)
+        if len(calls) == 2:
+            f.write(b"partial")
+            raise OSError("disk full")
+        savez(f, **columns)
+
+    with mock.patch.object(telemetry_store.np, "savez", flaky_savez):
+        append_steps(writer, range(6))
+        writer.close()
+
+    # The second shard was lost; the third took its number.
+    assert shard_names(directory) == ["telemetry_000000.npz", "telemetry_000001.npz"]
+    steps = read_telemetry(directory, ["step"])["step"]
+    np.testing.assert_array_equal(steps, [0, 0, 1, 1, 4, 4, 5, 5])
+
+    writer = TelemetryWriter(directory, shard_rows=4)
+    append_steps(writer, [200])
+    writer.close()
+    assert shard_names(directory)[-1] == "telemetry_000002.npz"
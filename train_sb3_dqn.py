@@ -14,15 +14,28 @@ Typical usage::
 """
 
 import os
-import glob
+import json
+import time
 import argparse
 import logging
+import zipfile
 from datetime import datetime
-from stable_baselines3 import DQN
 from stable_baselines3.common.vec_env import SubprocVecEnv, VecFrameStack
-from stable_baselines3.common.callbacks import CheckpointCallback, CallbackList
+from stable_baselines3.common.callbacks import CallbackList
+from stable_baselines3.common.save_util import json_to_data
 from env.mkds_gym_env import MKDSEnv
-from src.utils.callbacks import MKDSMetricsCallback
+from env.shared_memory_vec_env import SharedMemoryVecEnv
+from env.async_vec_env import AsyncSharedMemoryVecEnv
+from env.worker_startup import START_METHODS, resolve_start_method, log_worker_startup
+from src.utils.callbacks import (AsyncCheckpointCallback, MKDSMetricsCallback, ReplaySegmentCallback,
+                                 StepProfilerCallback)
+from src.utils.checkpoint_writer import AsyncCheckpointWriter
+from src.utils.async_dqn import AsyncDQN
+from src.utils.prioritized_dqn import PrioritizedDQN
+from src.utils.replay_buffers import FrameStackReplayBuffer, MemmapReplayBuffer, PrioritizedReplayBuffer
+from src.utils.replay_segments import ReplaySegmentLog
+from src.utils.run_index import RunIndex
+from src.utils.run_manifest import RetentionPolicy, RunManifest, find_latest_checkpoint
 from src.utils import config, setup_logging
 
 logger = logging.getLogger(__name__)
@@ -69,6 +82,29 @@ def parse_args():
         default=config.NUM_OF_INSTANCES,
         help=f"Number of parallel emulator environments (default: {config.NUM_OF_INSTANCES})",
     )
+    parser.add_argument(
+        "--vec-env",
+        type=str,
+        default=config.VEC_ENV_TYPE,
+        choices=["subproc", "shm"],
+        help="Worker backend: 'subproc' (SubprocVecEnv) or 'shm' (shared-memory step data) "
+             f"(default: {config.VEC_ENV_TYPE})",
+    )
+    parser.add_argument(
+        "--start-method",
+        type=str,
+        default=config.WORKER_START_METHOD,
+        choices=START_METHODS,
+        help="How worker processes are started; 'zygote' forks every worker from one pre-booted "
+             f"emulator (shm/async only) (default: {config.WORKER_START_METHOD})",
+    )
+    parser.add_argument(
+        "--async-batch",
+        type=int,
+        default=config.ASYNC_BATCH_SIZE,
+        help="Return the first K ready workers per step instead of waiting for all "
+             f"--n-envs of them (0 = synchronous) (default: {config.ASYNC_BATCH_SIZE})",
+    )
     parser.add_argument(
         "--stack-size",
         type=int,
@@ -95,6 +131,45 @@ def parse_args():
         default=config.MEMORY_SIZE,
         help=f"Maximum replay buffer capacity (default: {config.MEMORY_SIZE})",
     )
+    parser.add_argument(
+        "--replay-buffer",
+        type=str,
+        default=config.REPLAY_BUFFER,
+        choices=["framestack", "memmap", "prioritized", "default"],
+        help="'framestack' stores each frame once and rebuilds stacks at sample time; "
+             "'memmap' is the same in memory-mapped files under outputs/<run>/replay/; "
+             "'prioritized' adds prioritized experience replay; "
+             f"'default' is SB3's ReplayBuffer (default: {config.REPLAY_BUFFER})",
+    )
+    parser.add_argument(
+        "--per-alpha",
+        type=float,
+        default=config.PER_ALPHA,
+        help=f"Prioritized replay priority exponent, 0 = uniform (default: {config.PER_ALPHA})",
+    )
+    parser.add_argument(
+        "--per-beta",
+        type=float,
+        default=config.PER_BETA,
+        help="Initial prioritized replay importance-sampling exponent, annealed to 1 "
+             f"(default: {config.PER_BETA})",
+    )
+    parser.add_argument(
+        "--stream-margin",
+        type=float,
+        default=config.REPLAY_STREAM_MARGIN,
+        help="Extra frame capacity of the frame-deduplicated replay buffers, as a fraction of "
+             "--buffer-size; raise it for short episodes (at least stack size / mean episode "
+             "length; watch train/replay_stale_fraction) "
+             f"(default: {config.REPLAY_STREAM_MARGIN})",
+    )
+    parser.add_argument(
+        "--env-stack",
+        action="store_true",
+        default=config.ENV_FRAME_STACK,
+        help="Stack frames inside MKDSEnv (ring buffer) instead of using VecFrameStack; "
+             "same observation layout, so checkpoints are interchangeable.",
+    )
     parser.add_argument(
         "--action-space",
         type=int,
@@ -102,6 +177,18 @@ def parse_args():
         choices=[3, 6],
         help=f"Number of discrete actions: 3 (basic) or 6 (with drift) (default: {config.ACTION_SPACE})",
     )
+    parser.add_argument(
+        "--frame-skip",
+        type=int,
+        default=config.FRAME_SKIP,
+        help=f"Emulator frames per environment step; intermediate frames are not rendered (default: {config.FRAME_SKIP})",
+    )
+    parser.add_argument(
+        "--max-pool",
+        action="store_true",
+        default=config.MAX_POOL_FRAMES,
+        help="Observe the max of the last two rendered frames to suppress sprite flicker.",
+    )
     
     # Directories / Logging
     parser.add_argument(
@@ -110,12 +197,68 @@ def parse_args():
         default="./logs/",
         help="Directory to write TensorBoard logs (default: ./logs/)",
     )
+    parser.add_argument(
+        "--telemetry-format",
+        type=str,
+        default=config.TELEMETRY_FORMAT,
+        choices=["npz", "csv"],
+        help="Per-step telemetry log: 'npz' binary column shards in logs/telemetry/ "
+             f"or 'csv' logs/telemetry_log.csv (default: {config.TELEMETRY_FORMAT})",
+    )
+    parser.add_argument(
+        "--telemetry-sample",
+        type=int,
+        default=config.TELEMETRY_STEP_SAMPLE,
+        help="Log per-step telemetry every N vectorised steps; 1 logs every step, 0 disables it. "
+             f"Episode summaries are always logged (default: {config.TELEMETRY_STEP_SAMPLE})",
+    )
+    parser.add_argument(
+        "--occupancy-bins",
+        type=int,
+        default=config.OCCUPANCY_BINS,
+        help="Cells per axis of the per-checkpoint-window track-occupancy histograms in "
+             f"logs/occupancy/; 0 disables them (default: {config.OCCUPANCY_BINS})",
+    )
+    parser.add_argument(
+        "--profile-steps",
+        action="store_true",
+        default=config.PROFILE_STEPS,
+        help="Log per-component env step timings (p50/p95/p99) and the rollout/learner "
+             "time split to TensorBoard.",
+    )
     parser.add_argument(
         "--save-freq",
         type=int,
         default=10000,
         help="Checkpoint saving frequency in environment steps (default: 10000)",
     )
+    parser.add_argument(
+        "--keep-last",
+        type=int,
+        default=config.CHECKPOINT_KEEP_LAST,
+        help=f"Most recent checkpoints to keep (default: {config.CHECKPOINT_KEEP_LAST})",
+    )
+    parser.add_argument(
+        "--keep-every",
+        type=int,
+        default=config.CHECKPOINT_KEEP_EVERY,
+        help="Also keep one checkpoint per this many global steps; 0 disables "
+             f"(default: {config.CHECKPOINT_KEEP_EVERY})",
+    )
+    parser.add_argument(
+        "--keep-best",
+        type=int,
+        default=config.CHECKPOINT_KEEP_BEST,
+        help="Also keep the checkpoints with the highest mean reward over the last 100 episodes "
+             f"(default: {config.CHECKPOINT_KEEP_BEST})",
+    )
+    parser.add_argument(
+        "--disk-budget-gb",
+        type=float,
+        default=config.RUN_DISK_BUDGET_GB,
+        help="Disk budget of the run's models/ folder in GB; older kept checkpoints are "
+             f"pruned to fit, 0 disables (default: {config.RUN_DISK_BUDGET_GB})",
+    )
 
     return parser.parse_args()
 
@@ -148,10 +291,13 @@ def resolve_resume_path(resume_arg):
     run_dir = os.path.normpath(os.path.join("outputs", run_id))
     
     if os.path.isdir(run_dir):
-        model_files = glob.glob(os.path.join(run_dir, "models", "*.zip"))
-        if model_files:
-            latest_model = max(model_files, key=os.path.getmtime)
-            return run_id, os.path.abspath(latest_model)
+        # The run index re-reads only what changed in this run since it was
+        # last indexed; the manifest / models scan is the fallback.
+        run_index = RunIndex("outputs")
+        run_index.refresh_run(run_id)
+        latest_model = run_index.latest_checkpoint(run_id) or find_latest_checkpoint(run_dir)
+        if latest_model:
+            return run_id, latest_model
         else:
             raise FileNotFoundError(f"No model checkpoints (.zip) found in {run_dir}/models/")
     else:
@@ -161,13 +307,37 @@ def resolve_resume_path(resume_arg):
         )
 
 
+def saved_replay_buffer(model_path):
+    """Reads the replay buffer class and size a checkpoint was saved with.
+
+    Only the ``data`` member of the zip is read, so this is cheap next to
+    loading the model.
+
+    Args:
+        model_path (str): Checkpoint ``.zip`` path.
+
+    Returns:
+        tuple[type | None, int | None]: Replay buffer class and
+            ``buffer_size`` (``None`` where the checkpoint does not say).
+    """
+    with zipfile.ZipFile(model_path) as archive:
+        data = json.loads(archive.read("data"))
+    replay_buffer_class = None
+    if "replay_buffer_class" in data:
+        replay_buffer_class = json_to_data(
+            json.dumps({"replay_buffer_class": data["replay_buffer_class"]}))["replay_buffer_class"]
+    return replay_buffer_class, data.get("buffer_size")
+
+
 def select_resume_option():
-    """Scans the outputs directory and presents an interactive resume menu.
+    """Lists the runs of the run index and presents an interactive resume menu.
 
-    Walks every subdirectory of ``outputs/``, collects the most-recently
-    modified ``.zip`` model file from each run's ``models/`` folder, and
-    lets the user pick one to resume.  Pressing Enter (empty input) starts
-    a fresh run instead.
+    Syncs the run index (``outputs/run_index.sqlite``, see
+    :mod:`src.utils.run_index`), which re-reads only the runs that changed
+    since it was last synced, then lists every run with a checkpoint, its
+    latest checkpoint, global step and finished episodes, and lets the user
+    pick one to resume.  Pressing Enter (empty input) starts a fresh run
+    instead.
 
     Returns:
         tuple[str | None, str | None]: A 2-tuple of ``(run_id, model_path)``
@@ -182,26 +352,18 @@ def select_resume_option():
     if not os.path.exists("outputs"):
         return None, None
 
-    # Collect every top-level subdirectory (one per training run).
-    runs = [d for d in os.listdir("outputs") if os.path.isdir(os.path.join("outputs", d))]
-
-    options = []
-    for run in runs:
-        # Find all checkpoint zips saved inside this run's models folder.
-        model_files = glob.glob(f"outputs/{run}/models/*.zip")
-        if model_files:
-            # Keep only the *latest* checkpoint; mtime is reliable here because
-            # SB3 checkpoint filenames embed the step count anyway.
-            latest_model = max(model_files, key=os.path.getmtime)
-            options.append((run, latest_model))
+    # One row per run with a checkpoint, from a single query.
+    runs = [run for run in RunIndex("outputs").sync().runs() if run["latest"]]
+    options = [(run["run_id"], run["latest"]) for run in runs]
 
     # No resumable runs found — fall through to a fresh start.
     if not options:
         return None, None
 
     print("\n--- Available Models to Resume ---")
-    for i, (run_id, path) in enumerate(options):
-        print(f"{i}: {run_id} ({os.path.basename(path)})")
+    for i, run in enumerate(runs):
+        print(f"{i}: {run['run_id']} ({os.path.basename(run['latest'])}, step {run['latest_step']}, "
+              f"{run['episodes']} episodes)")
 
     choice = input(f"\nSelect index (Enter for NEW): ")
 
@@ -218,21 +380,36 @@ def train(args=None):
        :func:`select_resume_option` to decide whether to load an existing
        checkpoint (model + replay buffer) or initialise a brand-new DQN.
     2. **Environment setup** -- creates *N* parallel emulator processes with
-       :class:`~stable_baselines3.common.vec_env.SubprocVecEnv` (where *N* is
+       :class:`~stable_baselines3.common.vec_env.SubprocVecEnv` or
+       :class:`~env.shared_memory_vec_env.SharedMemoryVecEnv` (where *N* is
        ``config.NUM_OF_INSTANCES``), then wraps them in
        :class:`~stable_baselines3.common.vec_env.VecFrameStack` so each
        observation contains ``config.STACK_SIZE`` consecutive frames stacked
-       along the channel axis, giving the CNN temporal awareness.
+       along the channel axis, giving the CNN temporal awareness
+       (``--env-stack`` stacks inside each ``MKDSEnv`` instead).  With
+       ``--async-batch K`` the workers run in
+       :class:`~env.async_vec_env.AsyncSharedMemoryVecEnv` instead and the
+       model is an :class:`~src.utils.async_dqn.AsyncDQN`.
     3. **Training** -- calls ``model.learn()`` for up to TOTAL_TIMESTEPS
-       with two callbacks running in parallel:
-       - :class:`~src.utils.callbacks.MKDSMetricsCallback` -- logs custom
-         game metrics (speed, position, lap) to a CSV inside the run folder.
-       - :class:`~stable_baselines3.common.callbacks.CheckpointCallback` --
-         saves a model *and* the full replay buffer every save_freq steps so
-         off-policy learning can be resumed warm (no cold-start penalty).
+       with these callbacks running in parallel:
+       - :class:`~src.utils.callbacks.MKDSMetricsCallback` -- logs
+         per-episode summaries (reason, checkpoints, lap, mean speed, ...)
+         to TensorBoard and an episode table, and sampled per-step game
+         metrics (speed, position, lap) inside the run folder, as binary
+         telemetry shards (``--telemetry-format npz``) or a CSV, plus
+         per-checkpoint-window track-occupancy / action / reason histograms
+         of every step (``logs/occupancy/``).
+       - :class:`~src.utils.callbacks.AsyncCheckpointCallback` -- snapshots
+         the model every save_freq steps; a background thread compresses and
+         writes it while training continues.
+       - :class:`~src.utils.callbacks.ReplaySegmentCallback` -- appends the
+         transitions added since the last checkpoint to the replay segment
+         log (``models/replay_segments/``) every save_freq steps, so
+         off-policy learning can be resumed warm (no cold-start penalty)
+         without rewriting the whole buffer each time.
     4. **Safety save** -- a ``try/finally`` block guarantees that the current
        model and replay buffer are written to disk even when the user presses
-       Ctrl+C mid-training.
+       Ctrl+C mid-training, waiting for any checkpoint writes still in flight.
 
     Raises:
         KeyboardInterrupt: Caught internally; triggers the safety save and a
@@ -247,13 +424,31 @@ def train(args=None):
     # Override configuration defaults in the config module so that any imported
     # modules (like MKDSEnv) will dynamically use the CLI argument values.
     config.NUM_OF_INSTANCES = args.n_envs
+    config.VEC_ENV_TYPE = args.vec_env
+    config.ASYNC_BATCH_SIZE = args.async_batch
+    config.WORKER_START_METHOD = args.start_method
+    config.PROFILE_STEPS = args.profile_steps
+    config.CHECKPOINT_KEEP_LAST = args.keep_last
+    config.CHECKPOINT_KEEP_EVERY = args.keep_every
+    config.CHECKPOINT_KEEP_BEST = args.keep_best
+    config.RUN_DISK_BUDGET_GB = args.disk_budget_gb
+    config.TELEMETRY_FORMAT = args.telemetry_format
+    config.TELEMETRY_STEP_SAMPLE = args.telemetry_sample
+    config.OCCUPANCY_BINS = args.occupancy_bins
     config.STACK_SIZE = args.stack_size
+    config.ENV_FRAME_STACK = args.env_stack
     config.TOTAL_TIMESTEPS = args.total_timesteps
     config.MEMORY_SIZE = args.buffer_size
+    config.REPLAY_BUFFER = args.replay_buffer
+    config.PER_ALPHA = args.per_alpha
+    config.PER_BETA = args.per_beta
+    config.REPLAY_STREAM_MARGIN = args.stream_margin
     config.BATCH_SIZE = args.batch_size
     config.GAMMA = args.gamma
     config.LEARNING_RATE = args.learning_rate
     config.ACTION_SPACE = args.action_space
+    config.FRAME_SKIP = args.frame_skip
+    config.MAX_POOL_FRAMES = args.max_pool
 
     if args.resume:
         try:
@@ -275,14 +470,56 @@ def train(args=None):
     # CPU parallelism for data collection (one emulator instance per process).
     # visualize=False disables the SDL render window in worker processes to
     # avoid GPU/display contention and speed up frame generation.
-    env = SubprocVecEnv([lambda: MKDSEnv(visualize=False) for _ in range(config.NUM_OF_INSTANCES)])
-
-    # VecFrameStack concatenates the last STACK_SIZE observations along the
-    # channel axis (channels_order='last' -> HWC layout expected by SB3's CNN).
-    # This turns a single 2-D frame into a short video clip the CNN can use to
-    # infer velocity and direction -- critical for a racing game.
-    env = VecFrameStack(env, n_stack=config.STACK_SIZE, channels_order='last')
-
+    # Frame-skip settings are passed explicitly because worker processes
+    # started with spawn/forkserver re-import config with its defaults.
+    # SharedMemoryVecEnv ("shm") is a drop-in alternative that moves the
+    # per-step observations and telemetry through shared memory instead of
+    # pickling them through the worker pipes.
+    use_async = 0 < config.ASYNC_BATCH_SIZE < config.NUM_OF_INSTANCES
+    # With ENV_FRAME_STACK each MKDSEnv stacks its own frames in a ring buffer
+    # (same layout as VecFrameStack), moving that work into the workers.  The
+    # async mode always stacks in the env: its batches mix workers.
+    env_stack = config.STACK_SIZE if (config.ENV_FRAME_STACK or use_async) else 1
+    env_fns = [
+        lambda: MKDSEnv(visualize=False, frame_skip=args.frame_skip, max_pool=args.max_pool,
+                        frame_stack=env_stack)
+        for _ in range(config.NUM_OF_INSTANCES)
+    ]
+    start_method = config.WORKER_START_METHOD
+    if start_method == "zygote" and not use_async and config.VEC_ENV_TYPE != "shm":
+        logger.warning("The 'zygote' start method needs --vec-env shm or --async-batch; using 'forkserver'.")
+        start_method = "forkserver"
+    start_method = resolve_start_method(start_method)
+    launch_time = time.time()
+
+    if use_async:
+        # Async partial-batch mode: each step returns the first ASYNC_BATCH_SIZE
+        # workers that are ready, so a worker stuck in a reset no longer stalls
+        # the others.  AsyncDQN pairs each result with the observation/action
+        # last sent to that worker.
+        env = AsyncSharedMemoryVecEnv(env_fns, batch_size=config.ASYNC_BATCH_SIZE, start_method=start_method)
+        algo_cls = AsyncDQN
+    else:
+        vec_env_cls = SharedMemoryVecEnv if config.VEC_ENV_TYPE == "shm" else SubprocVecEnv
+        env = vec_env_cls(env_fns, start_method=start_method)
+
+        if env_stack == 1:
+            # VecFrameStack concatenates the last STACK_SIZE observations along the
+            # channel axis (channels_order='last' -> HWC layout expected by SB3's CNN).
+            # This turns a single 2-D frame into a short video clip the CNN can use to
+            # infer velocity and direction -- critical for a racing game.
+            env = VecFrameStack(env, n_stack=config.STACK_SIZE, channels_order='last')
+        # DQN whose train() also handles a prioritized replay buffer (plain
+        # DQN otherwise), so resumed prioritized runs keep their updates.
+        algo_cls = PrioritizedDQN
+
+    # Per-worker start-up times (waits until every emulator is up).
+    log_worker_startup(env, launch_time, start_method)
+
+    # Checkpoints are snapshotted on this thread and written by a background
+    # thread, so training does not stop for disk I/O.
+    checkpoint_writer = AsyncCheckpointWriter()
+    replay_log = None
     if model_path:
         # --- Resume an existing run ---
         logger.info(f"--- Resuming: {run_id} ---")
@@ -294,16 +531,35 @@ def train(args=None):
             "batch_size": config.BATCH_SIZE,
             "buffer_size": config.MEMORY_SIZE,
         }
+        # A memory-mapped buffer reopens its files, which have the size the
+        # run was started with: keep that size rather than --buffer-size.
+        saved_class, saved_size = saved_replay_buffer(model_path)
+        if isinstance(saved_class, type) and issubclass(saved_class, MemmapReplayBuffer):
+            del custom_objects["buffer_size"]
+            if saved_size is not None and saved_size != config.MEMORY_SIZE:
+                logger.info(f"Memory-mapped replay buffer keeps its saved size of {saved_size} "
+                            f"transitions (--buffer-size {config.MEMORY_SIZE} is ignored)")
 
         # Reload weights and hyper-parameters; bind the resumed model to the
         # freshly created vectorised environment.
-        model = DQN.load(model_path, env=env, device="auto", tensorboard_log=tb_log_path, custom_objects=custom_objects)
+        model = algo_cls.load(model_path, env=env, device="auto", tensorboard_log=tb_log_path, custom_objects=custom_objects)
 
         # The replay buffer is saved alongside the model checkpoint as a .pkl
         # file.  Loading it lets DQN continue off-policy learning immediately
         # without refilling the buffer from scratch (warm resumption).
+        # A memory-mapped buffer was already reopened from its files (with
+        # every transition up to the exit) when the model was rebuilt.
+        # Otherwise replay the incremental segment log kept next to the
+        # checkpoints, or load a full pickle written by older versions.
         buffer_path = model_path.replace(".zip", "_replay_buffer.pkl")
-        if os.path.exists(buffer_path):
+        segment_dir = os.path.join(os.path.dirname(model_path), "replay_segments")
+        if isinstance(model.replay_buffer, MemmapReplayBuffer):
+            logger.info(f"Reopened replay buffer at {model.replay_buffer.directory} "
+                        f"({model.replay_buffer.size() * model.replay_buffer.n_envs} transitions)")
+        elif ReplaySegmentLog.exists(segment_dir):
+            replay_log = ReplaySegmentLog(segment_dir, model.replay_buffer, writer=checkpoint_writer)
+            logger.info(f"Restored {replay_log.restored} transitions from {segment_dir}")
+        elif os.path.exists(buffer_path):
             model.load_replay_buffer(buffer_path)
     else:
         # --- Fresh run ---
@@ -311,12 +567,37 @@ def train(args=None):
         run_id = f"DQN_{datetime.now().strftime('%m%d_%H%M')}"
         logger.info(f"--- Fresh Run: {run_id} ---")
 
-        model = DQN(
+        # Frame-deduplicated replay storage.  It needs each batch row to stay
+        # the same env stream, which the async batches do not guarantee.
+        replay_buffer_class, replay_buffer_kwargs = None, None
+        if config.REPLAY_BUFFER in ("framestack", "memmap", "prioritized"):
+            if use_async:
+                logger.info("The async mode uses SB3's default replay buffer (no frame deduplication).")
+            elif config.REPLAY_BUFFER == "memmap":
+                # Disk-backed storage in the run folder; the path is saved with
+                # the model, so a resumed run reopens the same files.
+                replay_buffer_class = MemmapReplayBuffer
+                replay_buffer_kwargs = {"directory": f"outputs/{run_id}/replay"}
+            elif config.REPLAY_BUFFER == "prioritized":
+                # Rare collision / stuck / checkpoint transitions are replayed
+                # more often than routine straight-line driving.
+                replay_buffer_class = PrioritizedReplayBuffer
+                replay_buffer_kwargs = {"alpha": config.PER_ALPHA, "beta": config.PER_BETA}
+            else:
+                replay_buffer_class = FrameStackReplayBuffer
+            if replay_buffer_class is not None:
+                # Room for the extra frames written at episode starts.
+                replay_buffer_kwargs = {**(replay_buffer_kwargs or {}),
+                                        "stream_margin": config.REPLAY_STREAM_MARGIN}
+
+        model = algo_cls(
             "CnnPolicy",      # Convolutional policy suited for pixel observations.
             env,
             verbose=1,
             device="auto",
             buffer_size=config.MEMORY_SIZE,   # Maximum replay buffer capacity (transitions).
+            replay_buffer_class=replay_buffer_class,
+            replay_buffer_kwargs=replay_buffer_kwargs,
             batch_size=config.BATCH_SIZE,     # Minibatch size for each gradient update.
             learning_rate=config.LEARNING_RATE, # Adam learning rate.
             gamma=config.GAMMA,               # Discount factor.
@@ -331,19 +612,75 @@ def train(args=None):
     # Configure logging to write to file as well
     setup_logging(log_file=f"{base_path}/logs/train.log")
 
+    # Replay buffer checkpoints are incremental: each one appends only the
+    # transitions added since the previous one to a segment log.  A
+    # memory-mapped buffer is always on disk and needs neither.
+    memmap_buffer = isinstance(model.replay_buffer, MemmapReplayBuffer)
+    if replay_log is None and not memmap_buffer:
+        replay_log = ReplaySegmentLog(f"{base_path}/models/replay_segments", model.replay_buffer,
+                                      writer=checkpoint_writer)
+
+    # Run index (outputs/run_index.sqlite) queried by the resume / demo menus
+    # and the analysis scripts; training tells it about each checkpoint,
+    # telemetry shard and episode table write as they happen.
+    run_index = RunIndex("outputs", tb_log_path)
+    run_index.refresh_run(run_id)
+
+    # Per-run checkpoint record (run_manifest.json): resume reads the latest
+    # checkpoint from it, and the retention policy prunes old checkpoints
+    # (and stale replay buffer pickles) after every save.
+    run_manifest = RunManifest(base_path, run_id=run_id, index=run_index)
+    if memmap_buffer:
+        run_manifest.set_replay("memmap", model.replay_buffer.directory)
+    elif replay_log.saved:
+        run_manifest.set_replay("segments", replay_log.directory)
+    else:
+        # Resumed from a replay buffer pickle: keep it (pruning treats a
+        # "segments" run's pickles as stale) until the log holds its rows.
+        def record_segments():
+            run_manifest.set_replay("segments", replay_log.directory)
+            run_manifest.save()
+
+        replay_log.on_saved = record_segments
+    retention = RetentionPolicy(keep_last=config.CHECKPOINT_KEEP_LAST, keep_every=config.CHECKPOINT_KEEP_EVERY,
+                                keep_best=config.CHECKPOINT_KEEP_BEST,
+                                max_bytes=int(config.RUN_DISK_BUDGET_GB * 1e9))
+
     # --- Callbacks ---
-    # CallbackList executes both callbacks at every step simultaneously.
-    callbacks = CallbackList([
-        # Custom callback: logs episode metrics (reward, lap time, etc.) to CSV.
-        MKDSMetricsCallback(log_dir=f"{base_path}/logs"),
-
-        # Periodic checkpoint: saves model weights every save_freq steps.
-        # save_replay_buffer=True is critical for off-policy DQN -- without it,
-        # resuming training restarts with an empty buffer, causing a cold-start
-        # quality drop that can last tens of thousands of steps.
-        CheckpointCallback(save_freq=args.save_freq, save_path=f"{base_path}/models/",
-                           name_prefix="mkds_ckpt", save_replay_buffer=True)
-    ])
+    # CallbackList executes all callbacks at every step simultaneously.
+    # Custom callback: logs per-episode summaries to TensorBoard and
+    # logs/episodes.csv, and sampled per-step telemetry (speed, position,
+    # reward, ...) to binary shards in logs/telemetry/ (or telemetry_log.csv).
+    # Every step is also counted into position / action / reason histograms,
+    # one set per checkpoint window (save_freq vectorised steps).
+    metrics_callback = MKDSMetricsCallback(log_dir=f"{base_path}/logs", log_format=config.TELEMETRY_FORMAT,
+                                           shard_rows=config.TELEMETRY_SHARD_ROWS,
+                                           step_sample_every=config.TELEMETRY_STEP_SAMPLE,
+                                           occupancy_window=(args.save_freq * env.num_envs
+                                                             if config.OCCUPANCY_BINS else 0),
+                                           n_actions=config.ACTION_SPACE,
+                                           occupancy_bins=config.OCCUPANCY_BINS,
+                                           occupancy_extent=config.OCCUPANCY_EXTENT,
+                                           run_index=run_index, run_id=run_id)
+    callback_list = [
+        metrics_callback,
+
+        # Periodic checkpoint: saves model weights every save_freq steps,
+        # written in the background.  The replay buffer is saved by
+        # ReplaySegmentCallback below rather than pickled whole here.
+        AsyncCheckpointCallback(checkpoint_writer, save_freq=args.save_freq, save_path=f"{base_path}/models/",
+                                name_prefix="mkds_ckpt", run_manifest=run_manifest, retention=retention,
+                                score_fn=metrics_callback.mean_episode_reward)
+    ]
+    if replay_log is not None:
+        # Saving the replay buffer is critical for off-policy DQN -- without
+        # it, resuming training restarts with an empty buffer, causing a
+        # cold-start quality drop that can last tens of thousands of steps.
+        callback_list.append(ReplaySegmentCallback(replay_log, save_freq=args.save_freq))
+    if config.PROFILE_STEPS:
+        # Optional: per-component step timings and env-vs-learner time split.
+        callback_list.append(StepProfilerCallback(log_freq=config.PROFILE_LOG_FREQ))
+    callbacks = CallbackList(callback_list)
 
     try:
         logger.info("Training started. Press Ctrl+C to stop safely.")
@@ -363,9 +700,20 @@ def train(args=None):
         # Writes the current model and replay buffer before the process exits
         # so no training progress is lost regardless of when Ctrl+C was pressed.
         final_save = f"{base_path}/models/interrupted_exit"
-        model.save(final_save)
-        model.save_replay_buffer(f"{final_save}_replay_buffer")
+        final_path = checkpoint_writer.save_model(model, final_save)
+        checkpoint_writer.submit(run_manifest.add_checkpoint, final_path, model.num_timesteps,
+                                 metrics_callback.mean_episode_reward(), retention)
+        if memmap_buffer:
+            model.replay_buffer.flush()
+        else:
+            replay_log.write_segment()
+        # Waits for every queued write, periodic checkpoints included.
+        checkpoint_writer.close()
+        if checkpoint_writer.failures:
+            logger.error(f"{checkpoint_writer.failures} checkpoint write(s) failed; see the errors above.")
         logger.info(f"Safety Save Complete: {final_save}")
+        # Telemetry still buffered (learn() skips _on_training_end on Ctrl+C).
+        metrics_callback.close()
         try:
             logger.info("Closing environments...")
             env.close()